@@ -3,15 +3,15 @@ from flask_sqlalchemy import SQLAlchemy
 from flask_migrate import Migrate
 from flask_login import LoginManager
 from flask_socketio import SocketIO
-from apscheduler.schedulers.background import BackgroundScheduler
-from datetime import datetime
+from werkzeug.middleware.proxy_fix import ProxyFix
+from app.db_routing import RoutingSession
+from datetime import datetime, timedelta
 import pytz
 
-db = SQLAlchemy()
+db = SQLAlchemy(session_options={'class_': RoutingSession})
 migrate = Migrate()
 login_manager = LoginManager()
 socketio = SocketIO()
-scheduler = BackgroundScheduler()
 
 def to_local_time(utc_time, timezone='Asia/Shanghai'):
     local_tz = pytz.timezone(timezone)
@@ -20,36 +20,111 @@ def to_local_time(utc_time, timezone='Asia/Shanghai'):
     local_time = utc_time.astimezone(local_tz)
     return local_time
 
+def init_proxy_fix(app):
+    # 经过 PROXY_FIX_HOPS 层可信代理时，request.remote_addr 取 X-Forwarded-For 中对应的客户端地址
+    hops = app.config['PROXY_FIX_HOPS']
+    if hops:
+        app.wsgi_app = ProxyFix(app.wsgi_app, x_for=hops, x_proto=hops)
+
 def create_app():
     app = Flask(__name__)
     app.config.from_object('config.Config')
-    print("Database URI:", app.config['SQLALCHEMY_DATABASE_URI'])
+    init_proxy_fix(app)
+    from app.log import get_logger, init_logging
+    init_logging(app)
+    log = get_logger()
+    from app.db_green import configure_database, init_green_engines
+    configure_database(app)
 
     db.init_app(app)
+    init_green_engines(app, db)
     migrate.init_app(app, db)
     login_manager.init_app(app)
     login_manager.login_view = 'login'
-    socketio.init_app(app)
+    from app.backplane import socketio_options
+    socketio.init_app(app, **socketio_options(app.config))
 
     # 注册 Jinja2 全局函数
     app.jinja_env.globals.update(to_local_time=to_local_time)
 
     from app import models
+    from app.instrumentation import init_instrumentation
+    init_instrumentation(app)
     from app.routes import init_routes
     init_routes(app, db, socketio)
+    from app.metrics import metrics
+    metrics.init_app(app, db, socketio)
+    from app.commands import init_commands
+    init_commands(app)
+    from app.chat_stream import chat_stream
+    chat_stream.init_app(app, socketio)
+    from app.chat_writer import message_writer
+    message_writer.init_app(app, socketio)
+    from app.user_cache import user_cache
+    user_cache.init_app(app)
+    from app.page_cache import page_cache
+    page_cache.init_app(app)
+    from app.passwords import password_hasher
+    password_hasher.init_app(app, socketio)
+    from app.ratelimit import socket_limiter
+    socket_limiter.init_app(app, socketio)
+    from app.recommendations import recommender
+    recommender.init_app(app)
+    from app.reminders import reminders
+    reminders.init_app(app, socketio)
+
+    from app.jobs import job_runner
+    job_runner.init_app(app, socketio)
 
+    # 后台任务只在持有租约的进程中执行，由 job_runner.start() 启动调度（见 run.py）
+    @job_runner.job('delete_expired_activities', minutes=60)
     def delete_expired_activities():
-        with app.app_context():
-            expired_activities = Activity.query.filter(Activity.end_time < datetime.utcnow()).all()
-            for activity in expired_activities:
-                print(f"Deleting expired activity: {activity.title}")
-                db.session.delete(activity)
-            db.session.commit()
+        from app.reaper import reap_expired_activities
+        reap_expired_activities(app.config['REAPER_CHUNK_SIZE'], app.config['REAPER_ARCHIVE'])
+
+    @job_runner.job('reconcile_participant_counts', hours=6)
+    def reconcile_participant_counts():
+        from app.participation import reconcile_participant_counts as reconcile
+        fixed = reconcile()
+        if fixed:
+            log.info('participant counts reconciled', extra={'activities': fixed})
+
+    @job_runner.job('archive_old_messages', hours=24, enabled=lambda config: config['MESSAGE_ARCHIVE_AFTER_DAYS'] > 0)
+    def archive_old_messages():
+        from app.reaper import archive_old_messages as archive
+        before = datetime.utcnow() - timedelta(days=app.config['MESSAGE_ARCHIVE_AFTER_DAYS'])
+        archive(before, app.config['MESSAGE_ARCHIVE_CHUNK_SIZE'])
+
+    # 两个推荐任务共用一把锁；接手租约后第一次增量更新时内存中还没有相似度矩阵，会先做一次全量计算
+    @job_runner.job('rebuild_recommendations', hours=app.config['RECOMMENDATIONS_REBUILD_HOURS'],
+                    enabled=lambda config: config['RECOMMENDATIONS_ENABLED'])
+    def rebuild_recommendations():
+        recommender.build()
+
+    @job_runner.job('update_recommendations', minutes=app.config['RECOMMENDATIONS_UPDATE_MINUTES'],
+                    enabled=lambda config: config['RECOMMENDATIONS_ENABLED'])
+    def update_recommendations():
+        recommender.update()
+
+    # 提醒的堆只在持有租约的进程中加载和弹出，其他进程不会重复发送
+    @job_runner.job('send_activity_reminders', seconds=1, history=False,
+                    enabled=lambda config: config['REMINDERS_ENABLED'])
+    def send_activity_reminders():
+        reminders.tick()
+
+    @job_runner.job('replication_heartbeat', seconds=app.config['DB_REPLICA_HEARTBEAT_SECONDS'], history=False,
+                    enabled=lambda config: bool(config.get('DB_REPLICA_URL')))
+    def replication_heartbeat():
+        from app.db_routing import write_heartbeat
+        write_heartbeat(db)
 
-    scheduler.add_job(delete_expired_activities, 'interval', minutes=60)
-    scheduler.start()
+    @job_runner.job('prune_job_runs', hours=24)
+    def prune_job_runs():
+        from app.jobs import prune_job_runs as prune
+        prune(datetime.utcnow() - timedelta(days=app.config['JOBS_HISTORY_DAYS']))
 
     with app.app_context():
-        print("Database file path:", db.engine.url)
+        log.info('database configured', extra={'url': db.engine.url.render_as_string(hide_password=True),
+                                               'green_mode': app.config['DB_GREEN_MODE']})
 
     return app
\ No newline at end of file
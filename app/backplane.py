@@ -0,0 +1,74 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+
+import socketio
+
+
+class SQLiteManager(socketio.PubSubManager):
+    """基于本机 SQLite 文件的 Socket.IO 消息总线。
+
+    同一台机器上的多个工作进程共享一个 SQLite 文件，发布时写入一行，各进程
+    轮询读取自己尚未处理的行。不依赖 Redis，适合单机多进程部署和测试。
+    使用方式：SOCKETIO_MESSAGE_QUEUE = 'sqlite:////path/to/backplane.db'
+    """
+
+    name = 'sqlite'
+
+    def __init__(self, url, channel='socketio', write_only=False, logger=None,
+                 poll_interval=0.02, retention=60):
+        super().__init__(channel=channel, write_only=write_only, logger=logger)
+        self.path = url[len('sqlite:///'):]
+        self.poll_interval = poll_interval
+        self.retention = retention
+        self._published = 0
+        # 每个进程一个连接，发布和轮询共用，由锁串行化。不能按线程/协程各开一个连接：
+        # eventlet 打补丁后 threading.local 是协程级的，每个发消息的协程都会重新建连接
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(self.path, timeout=5, isolation_level=None, check_same_thread=False)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute('CREATE TABLE IF NOT EXISTS socketio_backplane ('
+                           'id INTEGER PRIMARY KEY AUTOINCREMENT, channel TEXT NOT NULL, '
+                           'created_at REAL NOT NULL, payload TEXT NOT NULL)')
+
+    def _execute(self, sql, parameters=()):
+        with self._lock:
+            return self._conn.execute(sql, parameters).fetchall()
+
+    def _publish(self, data):
+        now = time.time()
+        self._execute('INSERT INTO socketio_backplane (channel, created_at, payload) VALUES (?, ?, ?)',
+                      (self.channel, now, json.dumps(data)))
+        self._published += 1
+        if self._published % 1000 == 0:
+            # 定期清理已经被所有进程读过的旧消息
+            self._execute('DELETE FROM socketio_backplane WHERE created_at < ?', (now - self.retention,))
+
+    def _listen(self):
+        last_id = self._execute('SELECT COALESCE(MAX(id), 0) FROM socketio_backplane')[0][0]
+        while True:
+            rows = self._execute('SELECT id, payload FROM socketio_backplane WHERE id > ? AND channel = ? ORDER BY id',
+                                 (last_id, self.channel))
+            for row_id, payload in rows:
+                last_id = row_id
+                yield json.loads(payload)
+            self.server.sleep(self.poll_interval)
+
+
+def socketio_options(config):
+    """根据 SOCKETIO_MESSAGE_QUEUE 生成 socketio.init_app 的参数。
+
+    - 未设置：单进程，房间和广播只在本进程内存中
+    - sqlite:///...：使用内置的 SQLiteManager
+    - 其他（redis://、amqp://、kafka://、zmq+tcp://）：交给 Flask-SocketIO 自带的实现
+    """
+    url = config.get('SOCKETIO_MESSAGE_QUEUE')
+    channel = config['SOCKETIO_CHANNEL']
+    if not url:
+        return {}
+    if url.startswith('sqlite:///'):
+        os.makedirs(os.path.dirname(os.path.abspath(url[len('sqlite:///'):])), exist_ok=True)
+        return {'client_manager': SQLiteManager(url, channel=channel)}
+    return {'message_queue': url, 'channel': channel}
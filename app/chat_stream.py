@@ -0,0 +1,106 @@
+import threading
+from collections import OrderedDict, deque
+
+from app import to_local_time
+from app.conversations import conversation_key, find_conversation, messages_after, parse_conversation_key
+from app.user_cache import user_cache
+
+
+def message_event(message, sender_name):
+    """new_message 事件和补发消息的内容。"""
+    return {
+        'id': message.id,
+        'seq': message.seq,
+        'sender': sender_name,
+        'sender_id': message.sender_id,
+        'content': message.content,
+        'timestamp': to_local_time(message.timestamp).strftime('%Y-%m-%d %H:%M')
+    }
+
+
+class ChatStream:
+    """会话房间的实时消息流：消息落库、分配序号之后才广播 new_message，客户端据此记住最后收到的序号。
+
+    断线重连的客户端在 join 时带上 last_seq，只补发之后的消息：本进程为每个房间保留最近
+    CHAT_REPLAY_BUFFER_SIZE 条消息的环形缓冲区，缺口都在缓冲区内时直接从内存补发，否则按
+    (conversation_id, seq) 索引查询。缺口超过 CHAT_REPLAY_LIMIT 条时让客户端重新加载页面。
+
+    配置了 SOCKETIO_MESSAGE_QUEUE 时其他进程写入的消息不经过本进程的缓冲区，补发总是查数据库。
+    """
+
+    def __init__(self):
+        self.socketio = None
+        self.buffer_size = 0
+        self.max_rooms = 0
+        self.replay_limit = 0
+        self.buffered = False
+        self._rooms = OrderedDict()
+        self._lock = threading.Lock()
+        self._counters = {'published': 0, 'replayed_from_buffer': 0, 'replayed_from_db': 0, 'resets': 0}
+
+    def init_app(self, app, socketio):
+        self.socketio = socketio
+        self.buffer_size = app.config['CHAT_REPLAY_BUFFER_SIZE']
+        self.max_rooms = app.config['CHAT_REPLAY_ROOMS']
+        self.replay_limit = app.config['CHAT_REPLAY_LIMIT']
+        self.buffered = self.buffer_size > 0 and not app.config.get('SOCKETIO_MESSAGE_QUEUE')
+        with self._lock:
+            self._rooms.clear()
+
+    def stats(self):
+        with self._lock:
+            return dict(self._counters, rooms=len(self._rooms))
+
+    def prepare(self, messages):
+        """在消息 flush 之后、提交之前生成 [(房间, 事件)]（提交后 ORM 对象会过期）。"""
+        events = []
+        for message in messages:
+            sender = user_cache.get(message.sender_id)
+            events.append((conversation_key(message.activity_id, message.sender_id, message.receiver_id),
+                           message_event(message, sender.username if sender else '')))
+        return events
+
+    def publish(self, events):
+        """消息提交后由写入方调用：放进房间的缓冲区并广播给房间内的连接。"""
+        for room, event in events:
+            if self.buffered:
+                self._remember(room, event)
+            self.socketio.emit('new_message', event, to=room)
+        self._counters['published'] += len(events)
+
+    def _remember(self, room, event):
+        with self._lock:
+            buffer = self._rooms.get(room)
+            if buffer is None:
+                buffer = self._rooms[room] = deque(maxlen=self.buffer_size)
+                if len(self._rooms) > self.max_rooms:
+                    self._rooms.popitem(last=False)
+            else:
+                self._rooms.move_to_end(room)
+                if buffer and buffer[-1]['seq'] >= event['seq']:
+                    # 会话被删除后重建，序号从头开始
+                    buffer.clear()
+            buffer.append(event)
+
+    def replay(self, room, last_seq):
+        """返回 last_seq 之后的消息 (events, reset)；reset 为 True 表示缺口太大，应重新加载页面。"""
+        with self._lock:
+            buffer = self._rooms.get(room)
+            # 缓冲区连续且覆盖 last_seq 之后的全部消息时不访问数据库
+            if buffer and buffer[0]['seq'] <= last_seq + 1 and last_seq <= buffer[-1]['seq']:
+                events = [event for event in buffer if event['seq'] > last_seq]
+                self._counters['replayed_from_buffer'] += len(events)
+                return events, False
+        conversation = find_conversation(*parse_conversation_key(room))
+        if conversation is None or conversation.last_seq <= last_seq:
+            return [], False
+        if conversation.last_seq - last_seq > self.replay_limit:
+            self._counters['resets'] += 1
+            return [], True
+        events = [message_event(message, message.sender.username)
+                  for message in messages_after(conversation.id, last_seq, self.replay_limit)]
+        self._counters['replayed_from_db'] += len(events)
+        return events, False
+
+
+chat_stream = ChatStream()
@@ -0,0 +1,144 @@
+import atexit
+import time
+from collections import deque
+
+from app.log import get_logger
+
+log = get_logger('chat_writer')
+
+
+class MessageWriter:
+    """聊天消息的写后（write-behind）队列。
+
+    Socket.IO 处理函数只负责入队，后台任务每隔几毫秒把队列中最多 batch_size 条
+    消息放在一个事务里批量写入 Message 并更新会话汇总，提交后由 chat_stream 广播。
+    队列有上限，写满时先在调用方同步刷一次（背压），仍然写不进去就拒绝。
+    """
+
+    def __init__(self):
+        self.app = None
+        self.enabled = False
+        self.max_queue = 0
+        self.batch_size = 0
+        self.interval = 0
+        self._queue = deque()
+        self._running = False
+        self._counters = {
+            'enqueued': 0,
+            'written': 0,
+            'batches': 0,
+            'rejected': 0,
+            'failed_batches': 0,
+            'dropped': 0,
+            'publish_failures': 0,
+            'max_queue_depth': 0,
+            'last_flush_ms': 0.0,
+            'max_flush_ms': 0.0,
+            'total_flush_ms': 0.0,
+        }
+
+    def init_app(self, app, socketio):
+        self.app = app
+        self.enabled = app.config['CHAT_WRITE_BEHIND']
+        self.max_queue = app.config['CHAT_WRITE_QUEUE_SIZE']
+        self.batch_size = app.config['CHAT_WRITE_BATCH_SIZE']
+        self.interval = app.config['CHAT_WRITE_FLUSH_INTERVAL_MS'] / 1000.0
+        if self.enabled and not self._running:
+            self._running = True
+            socketio.start_background_task(self._run, socketio)
+            # 进程退出前把队列中剩余的消息全部落库
+            atexit.register(self.stop)
+
+    def submit(self, fields):
+        """提交一条消息（Message 的列值字典），返回是否被接受。"""
+        if not self._running:
+            self._write([fields])
+            return True
+        if len(self._queue) >= self.max_queue:
+            self.flush()
+            if len(self._queue) >= self.max_queue:
+                self._counters['rejected'] += 1
+                return False
+        self._queue.append(fields)
+        self._counters['enqueued'] += 1
+        if len(self._queue) > self._counters['max_queue_depth']:
+            self._counters['max_queue_depth'] = len(self._queue)
+        return True
+
+    def flush(self):
+        """写入一批消息，返回写入条数。"""
+        batch = []
+        while self._queue and len(batch) < self.batch_size:
+            batch.append(self._queue.popleft())
+        if not batch:
+            return 0
+        try:
+            self._write(batch)
+        except Exception:
+            self._counters['failed_batches'] += 1
+            log.exception('chat batch write failed, retrying one by one', extra={'messages': len(batch)})
+            # 逐条重试，只丢弃确实写不进去的消息（例如所属活动已被清理）
+            dropped = 0
+            for fields in batch:
+                try:
+                    self._write([fields])
+                except Exception:
+                    dropped += 1
+            self._counters['dropped'] += dropped
+            if dropped:
+                log.error('chat messages dropped', extra={'messages': len(batch), 'dropped': dropped})
+        return len(batch)
+
+    def drain(self):
+        while self.flush():
+            pass
+
+    def stop(self):
+        self._running = False
+        self.drain()
+
+    def stats(self):
+        stats = dict(self._counters)
+        stats['queue_depth'] = len(self._queue)
+        stats['queue_capacity'] = self.max_queue
+        return stats
+
+    def _write(self, batch):
+        from app import db
+        from app.models import Message
+        from app.conversations import record_messages
+        from app.chat_stream import chat_stream
+
+        started = time.perf_counter()
+        with self.app.app_context():
+            try:
+                messages = [Message(**fields) for fields in batch]
+                record_messages(messages)
+                events = chat_stream.prepare(messages)
+                db.session.commit()
+            except Exception:
+                db.session.rollback()
+                raise
+            elapsed = (time.perf_counter() - started) * 1000
+            self._counters['written'] += len(batch)
+            self._counters['batches'] += 1
+            self._counters['last_flush_ms'] = elapsed
+            self._counters['total_flush_ms'] += elapsed
+            self._counters['max_flush_ms'] = max(self._counters['max_flush_ms'], elapsed)
+            # 提交之后才广播，客户端收到的每条消息都带有已经落库的序号。广播失败（例如消息总线不可用）
+            # 不能抛给 flush()，否则已经提交的消息会被逐条重试而重复写入；客户端重连后由补发机制补齐
+            try:
+                chat_stream.publish(events)
+            except Exception:
+                self._counters['publish_failures'] += 1
+                log.exception('chat messages committed but not broadcast', extra={'messages': len(batch)})
+
+    def _run(self, socketio):
+        while self._running:
+            socketio.sleep(self.interval)
+            # 积压较多时连续写，直到队列不足一批
+            while self._running and self.flush() == self.batch_size:
+                socketio.sleep(0)
+
+
+message_writer = MessageWriter()
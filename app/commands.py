@@ -0,0 +1,212 @@
+import os
+import signal
+import subprocess
+import sys
+
+import click
+from flask.cli import AppGroup
+
+
+def init_commands(app):
+    search_cli = AppGroup('search', help='活动全文检索索引维护')
+
+    @search_cli.command('reindex')
+    @click.option('--batch-size', default=500, show_default=True, help='每批重建的活动数')
+    def search_reindex(batch_size):
+        """重建全部活动的倒排索引。"""
+        from app.search import rebuild_index
+        count = rebuild_index(batch_size)
+        click.echo(f'Indexed {count} activities.')
+
+    app.cli.add_command(search_cli)
+
+    participants_cli = AppGroup('participants', help='活动报名人数维护')
+
+    @participants_cli.command('reconcile')
+    def participants_reconcile():
+        """按 participation 表重算所有活动的 participant_count。"""
+        from app.participation import reconcile_participant_counts
+        fixed = reconcile_participant_counts()
+        click.echo(f'Reconciled {fixed} activities.')
+
+    app.cli.add_command(participants_cli)
+
+    jobs_cli = AppGroup('jobs', help='后台任务')
+
+    @jobs_cli.command('list')
+    def jobs_list():
+        """列出已启用的任务、租约持有者和每个任务最近一次运行。"""
+        import sqlalchemy as sa
+        from app import db
+        from app.jobs import LEASE_NAME, job_runner
+        from app.models import JobLease, JobRun
+        lease = db.session.get(JobLease, LEASE_NAME)
+        if lease is not None:
+            click.echo(f'lease: {lease.holder} (acquired {lease.acquired_at:%Y-%m-%d %H:%M:%S}, '
+                       f'expires {lease.expires_at:%Y-%m-%d %H:%M:%S} UTC)')
+        else:
+            click.echo('lease: none')
+        for job in job_runner.jobs():
+            last = db.session.scalars(sa.select(JobRun).where(JobRun.job == job.name).order_by(
+                JobRun.started_at.desc()).limit(1)).first()
+            line = f'{job.name:<30} every {job.interval}'
+            if last is not None:
+                line += f'  last {last.started_at:%Y-%m-%d %H:%M:%S} {last.outcome}'
+                if last.seconds is not None:
+                    line += f' ({last.seconds}s)'
+            click.echo(line)
+
+    @jobs_cli.command('run')
+    @click.argument('name')
+    def jobs_run(name):
+        """在当前进程中立即执行一次任务（不经过租约），结果写入运行记录。"""
+        from app.jobs import job_runner
+        if name not in {job.name for job in job_runner.jobs()}:
+            raise click.BadParameter(f'unknown or disabled job {name!r}', param_hint='NAME')
+        outcome = job_runner.run_now(name)
+        click.echo(f'{name}: {outcome}')
+        if outcome != 'ok':
+            raise SystemExit(1)
+
+    app.cli.add_command(jobs_cli)
+
+    recommendations_cli = AppGroup('recommendations', help='“为你推荐”离线计算')
+
+    def _mib(value):
+        return 'n/a' if value is None else f'{value / 2 ** 20:.1f} MiB'
+
+    @recommendations_cli.command('build')
+    def recommendations_build():
+        """全量重新计算所有用户的推荐，输出耗时和内存峰值。"""
+        from app.recommendations import recommender
+        result = recommender.build()
+        click.echo(f"Built {result['recommendations']} recommendations for {result['users']} users "
+                   f"over {result['activities']} activities in {result['seconds']}s "
+                   f"(matrices {result['matrix_bytes'] / 2 ** 20:.1f} MiB, peak RSS {_mib(result['peak_rss_bytes'])}).")
+
+    app.cli.add_command(recommendations_cli)
+
+    messages_cli = AppGroup('messages', help='聊天消息维护')
+
+    @messages_cli.command('archive')
+    @click.option('--days', default=None, type=int, help='归档发送超过该天数的消息，默认取 MESSAGE_ARCHIVE_AFTER_DAYS')
+    @click.option('--chunk-size', default=None, type=int, help='每批移动的消息数')
+    def messages_archive(days, chunk_size):
+        """把旧聊天消息移到 message_archive 表。"""
+        from datetime import datetime, timedelta
+        from app.reaper import archive_old_messages
+        days = app.config['MESSAGE_ARCHIVE_AFTER_DAYS'] if days is None else days
+        if days <= 0:
+            raise click.UsageError('pass --days or set MESSAGE_ARCHIVE_AFTER_DAYS')
+        moved = archive_old_messages(datetime.utcnow() - timedelta(days=days),
+                                     chunk_size or app.config['MESSAGE_ARCHIVE_CHUNK_SIZE'])
+        click.echo(f'Archived {moved} messages.')
+
+    app.cli.add_command(messages_cli)
+
+    data_cli = AppGroup('data', help='数据流式导出/导入（NDJSON 或 CSV，可选 gzip）')
+
+    def _tables(value):
+        from app.dataio import TABLES
+        tables = [table for table in value.split(',') if table] if value else list(TABLES)
+        unknown = set(tables) - set(TABLES)
+        if unknown:
+            raise click.BadParameter(f"unknown tables {sorted(unknown)}, choose from {', '.join(TABLES)}")
+        # 始终按外键依赖顺序处理
+        return [table for table in TABLES if table in tables]
+
+    def _report(stats):
+        click.echo(f"{stats['table']}: {stats['rows']} rows in {stats['seconds']}s "
+                   f"({stats['rows_per_sec']} rows/sec)", err=True)
+
+    @data_cli.command('export')
+    @click.argument('directory', type=click.Path(file_okay=False))
+    @click.option('--tables', default='', help='逗号分隔的表名，默认 user,activity,participation,conversation,message')
+    @click.option('--format', 'fmt', type=click.Choice(['ndjson', 'csv']), default='ndjson', show_default=True)
+    @click.option('--gzip', 'compress', is_flag=True, help='输出 .gz 压缩文件')
+    @click.option('--batch-size', default=1000, show_default=True, help='服务端游标每次取回的行数')
+    def data_export(directory, tables, fmt, compress, batch_size):
+        """把各表按主键顺序导出到 DIRECTORY/<表名>.<格式>[.gz]。"""
+        from app.dataio import data_path, export_table
+        os.makedirs(directory, exist_ok=True)
+        for table in _tables(tables):
+            _report(export_table(table, data_path(directory, table, fmt, compress), fmt, batch_size))
+
+    @data_cli.command('import')
+    @click.argument('directory', type=click.Path(exists=True, file_okay=False))
+    @click.option('--tables', default='', help='逗号分隔的表名，默认导入目录中存在的全部表')
+    @click.option('--batch-size', default=1000, show_default=True, help='每批插入并提交的行数')
+    def data_import(directory, tables, batch_size):
+        """从 DIRECTORY 导入 data export 生成的文件（按扩展名识别格式），目标表应为空。"""
+        from app.dataio import find_data_file, import_table
+        from app.search import rebuild_index
+        imported = []
+        for table in _tables(tables):
+            path = find_data_file(directory, table)
+            if path is None:
+                if tables:
+                    raise click.ClickException(f'no export file for {table} in {directory}')
+                continue
+            _report(import_table(table, path, batch_size))
+            imported.append(table)
+        if 'activity' in imported:
+            # 倒排索引不导出，导入活动后重建
+            click.echo(f'Indexed {rebuild_index()} activities.', err=True)
+
+    app.cli.add_command(data_cli)
+
+    @app.cli.command('serve')
+    @click.option('--workers', default=os.cpu_count() or 1, show_default=True, help='工作进程数')
+    @click.option('--host', default='127.0.0.1', show_default=True)
+    @click.option('--base-port', default=5001, show_default=True, help='第 i 个进程监听 base-port + i')
+    def serve(workers, host, base_port):
+        """启动多个 Socket.IO 工作进程，并打印负载均衡（粘性会话）配置示例。"""
+        env = dict(os.environ, YUEDAZI_WORKER='1', HOST=host)
+        if host in ('127.0.0.1', 'localhost') and 'PROXY_FIX_HOPS' not in env:
+            # 工作进程只能经本机的 nginx 访问，按一层可信代理还原客户端 IP
+            env['PROXY_FIX_HOPS'] = '1'
+        # 该变量会让 Flask-SocketIO 退回 threading 模式，工作进程需要使用 eventlet
+        env.pop('FLASK_RUN_FROM_CLI', None)
+        if workers > 1 and not app.config.get('SOCKETIO_MESSAGE_QUEUE'):
+            # 多进程必须共享房间和广播，未配置时使用内置的 SQLite 消息总线
+            env['SOCKETIO_MESSAGE_QUEUE'] = 'sqlite:///' + os.path.join(app.instance_path, 'socketio-backplane.db')
+            click.echo(f"SOCKETIO_MESSAGE_QUEUE not set, using {env['SOCKETIO_MESSAGE_QUEUE']}")
+
+        run_py = os.path.join(app.config['BASE_DIR'], 'run.py')
+        ports = [base_port + i for i in range(workers)]
+        processes = [subprocess.Popen([sys.executable, run_py], env=dict(env, PORT=str(port))) for port in ports]
+
+        # Socket.IO 的长轮询请求必须回到同一进程，负载均衡需按客户端 IP 粘性分配
+        upstream = '\n'.join(f'    server {host}:{port};' for port in ports)
+        click.echo(f"""Started {workers} workers on ports {ports[0]}-{ports[-1]}.
+nginx example (sticky sessions via ip_hash):
+
+upstream yuedazi {{
+    ip_hash;
+{upstream}
+}}
+
+location / {{
+    proxy_pass http://yuedazi;
+    proxy_set_header X-Forwarded-For $proxy_add_x_forwarded_for;
+    proxy_set_header X-Forwarded-Proto $scheme;
+}}
+
+location /socket.io {{
+    proxy_pass http://yuedazi;
+    proxy_http_version 1.1;
+    proxy_set_header Upgrade $http_upgrade;
+    proxy_set_header Connection "upgrade";
+    proxy_set_header X-Forwarded-For $proxy_add_x_forwarded_for;
+    proxy_set_header X-Forwarded-Proto $scheme;
+}}
+""")
+
+        def terminate(signum, frame):
+            for process in processes:
+                process.terminate()
+
+        signal.signal(signal.SIGINT, terminate)
+        signal.signal(signal.SIGTERM, terminate)
+        for process in processes:
+            process.wait()
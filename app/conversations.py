@@ -0,0 +1,182 @@
+import sqlalchemy as sa
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import joinedload
+
+from flask import current_app
+
+from app import db
+from app.models import Conversation, Message, MessageArchive, Participation
+from app.pagination import encode_cursor, keyset_page
+
+
+def conversation_key(activity_id, user_a, user_b):
+    user_ids = sorted([int(user_a), int(user_b)])
+    return f"{activity_id}-{user_ids[0]}-{user_ids[1]}"
+
+
+def parse_conversation_key(key):
+    activity_id, user1_id, user2_id = map(int, key.split('-'))
+    return activity_id, user1_id, user2_id
+
+
+def find_conversation(activity_id, user1_id, user2_id):
+    """按 (活动, 较小用户 id, 较大用户 id) 的唯一索引查找会话。"""
+    return Conversation.query.filter_by(activity_id=activity_id, user1_id=user1_id, user2_id=user2_id).first()
+
+
+def can_message(activity, sender_id, receiver_id):
+    """能否在该活动下给 receiver_id 发消息：对方是发起人或参与者，或者双方已有会话
+    （例如发起人回复来咨询的用户）。"""
+    if receiver_id == sender_id:
+        return False
+    if receiver_id == activity.creator_id:
+        return True
+    if db.session.query(Participation.id).filter_by(user_id=receiver_id, activity_id=activity.id).first():
+        return True
+    user1_id, user2_id = sorted((sender_id, receiver_id))
+    return find_conversation(activity.id, user1_id, user2_id) is not None
+
+
+def _get_or_create(activity_id, user1_id, user2_id):
+    conversation = find_conversation(activity_id, user1_id, user2_id)
+    if conversation is not None:
+        return conversation
+    conversation = Conversation(activity_id=activity_id, user1_id=user1_id, user2_id=user2_id,
+                                user1_unread=0, user2_unread=0)
+    try:
+        with db.session.begin_nested():
+            db.session.add(conversation)
+    except IntegrityError:
+        # 并发的第一条消息已经建好了会话
+        conversation = find_conversation(activity_id, user1_id, user2_id)
+    return conversation
+
+
+def record_message(message):
+    """把消息加入当前事务并更新会话汇总，调用方负责 commit。"""
+    record_messages([message])
+
+
+def record_messages(messages):
+    """把一批尚未加入 session 的消息写入所属会话，并按会话合并（按发送顺序）更新汇总。
+
+    会话由消息的活动和收发双方确定，不存在时先创建，再给消息填上 conversation_id。
+    序号在同一事务中用 UPDATE 递增 conversation.last_seq 分配，行锁保证多进程写入时也连续不重复。
+    """
+    batches = {}
+    for message in messages:
+        user1_id, user2_id = sorted((int(message.sender_id), int(message.receiver_id)))
+        batches.setdefault((int(message.activity_id), user1_id, user2_id), []).append(message)
+    conversations = {}
+    for (activity_id, user1_id, user2_id), batch in batches.items():
+        conversation = _get_or_create(activity_id, user1_id, user2_id)
+        conversations[conversation.id] = (conversation, user1_id, batch)
+        db.session.execute(sa.update(Conversation).where(Conversation.id == conversation.id).values(
+            last_seq=Conversation.last_seq + len(batch)))
+        last_seq = db.session.scalar(sa.select(Conversation.last_seq).where(Conversation.id == conversation.id))
+        for seq, message in enumerate(batch, last_seq - len(batch) + 1):
+            message.conversation_id = conversation.id
+            message.seq = seq
+    db.session.add_all(messages)
+    db.session.flush()
+    for conversation, user1_id, batch in conversations.values():
+        last = batch[-1]
+        conversation.last_message_id = last.id
+        conversation.last_activity_at = last.timestamp
+        user1_received = sum(1 for message in batch if int(message.receiver_id) == user1_id)
+        if user1_received:
+            conversation.user1_unread = Conversation.user1_unread + user1_received
+        if len(batch) > user1_received:
+            conversation.user2_unread = Conversation.user2_unread + (len(batch) - user1_received)
+
+
+def _anchor(model, conversation_id, before_id):
+    return db.session.query(model.timestamp).filter(
+        model.id == before_id, model.conversation_id == conversation_id
+    ).scalar()
+
+
+def message_page(conversation_id, before_id=None, limit=50):
+    """返回 before_id 之前最新的 limit 条消息（按时间正序）以及是否还有更早的消息。
+
+    message 表中的记录读完后，开启了历史消息归档时继续从 message_archive 中读取。
+    """
+    archive_enabled = current_app.config['MESSAGE_ARCHIVE_AFTER_DAYS'] > 0
+    cursor = None
+    if before_id is not None:
+        anchor = _anchor(Message, conversation_id, before_id)
+        if anchor is None and archive_enabled:
+            anchor = _anchor(MessageArchive, conversation_id, before_id)
+            if anchor is not None:
+                return _archive_page(conversation_id, encode_cursor(anchor, before_id), limit)
+        if anchor is None:
+            return [], False
+        cursor = encode_cursor(anchor, before_id)
+    query = Message.query.options(joinedload(Message.sender)).filter(Message.conversation_id == conversation_id)
+    messages, next_cursor = keyset_page(query, Message.timestamp, Message.id, cursor, limit, descending=True)
+    if next_cursor is None and archive_enabled:
+        oldest = encode_cursor(messages[-1].timestamp, messages[-1].id) if messages else cursor
+        messages.reverse()
+        if len(messages) < limit:
+            older, has_more = _archive_page(conversation_id, oldest, limit - len(messages))
+            return older + messages, has_more
+        # 本页正好取完 message 表时，只看归档里是否还有更早的消息，由下一页接着读取
+        older, _ = _archive_page(conversation_id, oldest, 1)
+        return messages, bool(older)
+    messages.reverse()
+    return messages, next_cursor is not None
+
+
+def messages_after(conversation_id, after_seq, limit):
+    """按 (conversation_id, seq) 索引取序号大于 after_seq 的消息（按序号正序），最多 limit 条。"""
+    return Message.query.options(joinedload(Message.sender)).filter(
+        Message.conversation_id == conversation_id, Message.seq > after_seq
+    ).order_by(Message.seq).limit(limit).all()
+
+
+def _archive_page(conversation_id, cursor, limit):
+    query = MessageArchive.query.options(joinedload(MessageArchive.sender)).filter(
+        MessageArchive.conversation_id == conversation_id)
+    messages, next_cursor = keyset_page(query, MessageArchive.timestamp, MessageArchive.id, cursor, limit,
+                                        descending=True)
+    messages.reverse()
+    return messages, next_cursor is not None
+
+
+def mark_read(conversation, user_id):
+    if conversation.unread_for(user_id) == 0:
+        return False
+    if user_id == conversation.user1_id:
+        conversation.user1_unread = 0
+    else:
+        conversation.user2_unread = 0
+    return True
+
+
+def _participant_filter(user_id):
+    return (Conversation.user1_id == user_id) | (Conversation.user2_id == user_id)
+
+
+def recent_conversations(user_id, limit=5):
+    return Conversation.query.options(
+        joinedload(Conversation.activity),
+        joinedload(Conversation.user1),
+        joinedload(Conversation.user2)
+    ).filter(_participant_filter(user_id)).order_by(
+        Conversation.last_activity_at.desc()
+    ).limit(limit).all()
+
+
+def unread_total(user_id):
+    unread = sa.case((Conversation.user1_id == user_id, Conversation.user1_unread), else_=Conversation.user2_unread)
+    total = db.session.query(sa.func.sum(unread)).filter(_participant_filter(user_id)).scalar()
+    return total or 0
+
+
+def remove_user_conversations(user_id):
+    # 先删会话中的消息以满足外键；归档中的消息一并删除
+    conversation_ids = sa.select(Conversation.id).where(_participant_filter(user_id))
+    db.session.execute(sa.delete(Message).where(Message.conversation_id.in_(conversation_ids)))
+    db.session.execute(sa.delete(MessageArchive).where(
+        (MessageArchive.sender_id == user_id) | (MessageArchive.receiver_id == user_id)))
+    db.session.execute(sa.delete(Conversation).where(_participant_filter(user_id)))
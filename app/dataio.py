@@ -0,0 +1,130 @@
+import csv
+import gzip
+import json
+import os
+import time
+from datetime import datetime
+
+import sqlalchemy as sa
+
+from app import db
+from app.models import Activity, Conversation, Message, Participation, User
+
+# 导入顺序满足外键依赖：会话依赖活动和用户，消息依赖会话
+TABLES = {model.__tablename__: model for model in (User, Activity, Participation, Conversation, Message)}
+FORMATS = ('ndjson', 'csv')
+# CSV 中表示 NULL 的取值（与 MySQL LOAD DATA 一致），以区分空字符串
+CSV_NULL = '\\N'
+
+
+def data_path(directory, table, fmt, compress):
+    return os.path.join(directory, f"{table}.{fmt}{'.gz' if compress else ''}")
+
+
+def _open(path, mode):
+    if path.endswith('.gz'):
+        return gzip.open(path, mode + 't', encoding='utf-8', newline='')
+    return open(path, mode, encoding='utf-8', newline='')
+
+
+def _dump(value):
+    return value.isoformat() if isinstance(value, datetime) else value
+
+
+def _loader(column):
+    """按列类型把 NDJSON/CSV 中的值还原成 Python 值。"""
+    python_type = column.type.python_type
+    if python_type is datetime:
+        return datetime.fromisoformat
+    if python_type is bool:
+        return lambda value: value if isinstance(value, bool) else value in ('1', 'true', 'True')
+    if python_type is int:
+        return int
+    if python_type is float:
+        return float
+    return lambda value: value
+
+
+class _Throughput:
+    def __init__(self, table):
+        self.table = table
+        self.rows = 0
+        self.started = time.perf_counter()
+
+    def result(self):
+        elapsed = time.perf_counter() - self.started
+        return {'table': self.table, 'rows': self.rows, 'seconds': round(elapsed, 3),
+                'rows_per_sec': round(self.rows / elapsed, 1) if elapsed > 0 else None}
+
+
+def export_table(table, path, fmt='ndjson', batch_size=1000):
+    """用服务端游标按主键顺序流式导出一张表，内存占用与表大小无关，返回吞吐统计。"""
+    model = TABLES[table]
+    columns = [column.name for column in model.__table__.columns]
+    query = sa.select(model.__table__).order_by(*model.__table__.primary_key.columns)
+    throughput = _Throughput(table)
+    with _open(path, 'w') as out:
+        writer = None
+        if fmt == 'csv':
+            writer = csv.writer(out)
+            writer.writerow(columns)
+        result = db.session.execute(query, execution_options={'yield_per': batch_size})
+        for partition in result.mappings().partitions():
+            for row in partition:
+                if writer is not None:
+                    writer.writerow([CSV_NULL if row[name] is None else _dump(row[name]) for name in columns])
+                else:
+                    out.write(json.dumps({name: _dump(row[name]) for name in columns}, ensure_ascii=False))
+                    out.write('\n')
+            throughput.rows += len(partition)
+        result.close()
+    db.session.rollback()
+    return throughput.result()
+
+
+def _read_rows(path, model):
+    loaders = {column.name: _loader(column) for column in model.__table__.columns}
+    # 其他工具导出的 CSV 常用空单元格表示 NULL；可空的非文本列不可能取空字符串，按 NULL 处理
+    blank_is_null = {column.name for column in model.__table__.columns
+                     if column.nullable and column.type.python_type is not str}
+    with _open(path, 'r') as source:
+        if '.csv' in os.path.basename(path):
+            for record in csv.DictReader(source):
+                yield {name: None if value == CSV_NULL or (value == '' and name in blank_is_null)
+                       else loaders[name](value)
+                       for name, value in record.items() if name in loaders}
+        else:
+            for line in source:
+                if line.strip():
+                    record = json.loads(line)
+                    yield {name: None if value is None else loaders[name](value)
+                           for name, value in record.items() if name in loaders}
+
+
+def import_table(table, path, batch_size=1000):
+    """按批 executemany 插入并逐批提交，返回吞吐统计。目标表应为空（主键按原值写入）。"""
+    model = TABLES[table]
+    insert = sa.insert(model.__table__)
+    throughput = _Throughput(table)
+    batch = []
+    for row in _read_rows(path, model):
+        batch.append(row)
+        if len(batch) >= batch_size:
+            db.session.execute(insert, batch)
+            db.session.commit()
+            throughput.rows += len(batch)
+            batch = []
+    if batch:
+        db.session.execute(insert, batch)
+        db.session.commit()
+        throughput.rows += len(batch)
+    return throughput.result()
+
+
+def find_data_file(directory, table):
+    for fmt in FORMATS:
+        for compress in (False, True):
+            path = data_path(directory, table, fmt, compress)
+            if os.path.exists(path):
+                return path
+    return None
@@ -0,0 +1,65 @@
+import sqlalchemy as sa
+from sqlalchemy import event
+
+GREEN_MODES = ('pymysql', 'tpool', 'off')
+
+
+def configure_database(app):
+    """在 db.init_app 之前调用：按 DB_GREEN_MODE 调整连接串并生成连接池参数。
+
+    - pymysql：MySQL 改用纯 Python 的 PyMySQL 驱动，eventlet 打过补丁的 socket
+      会在等待查询结果时让出，事件循环不被阻塞（默认）
+    - tpool：保留 mysqlclient，连接和游标的每次调用都放到 eventlet 的原生线程池执行
+    - off：不做处理，C 驱动在查询期间会阻塞整个事件循环
+    """
+    mode = app.config['DB_GREEN_MODE']
+    if mode not in GREEN_MODES:
+        raise ValueError(f'DB_GREEN_MODE must be one of {GREEN_MODES}, got {mode!r}')
+    url = _driver_url(app.config['SQLALCHEMY_DATABASE_URI'], mode)
+    app.config['SQLALCHEMY_DATABASE_URI'] = url.render_as_string(hide_password=False)
+    if app.config.get('DB_REPLICA_URL'):
+        from app.db_routing import REPLICA_BIND
+        binds = dict(app.config.get('SQLALCHEMY_BINDS') or {})
+        binds[REPLICA_BIND] = _driver_url(app.config['DB_REPLICA_URL'], mode).render_as_string(hide_password=False)
+        app.config['SQLALCHEMY_BINDS'] = binds
+
+    options = dict(app.config.get('SQLALCHEMY_ENGINE_OPTIONS') or {})
+    options.setdefault('pool_pre_ping', app.config['DB_POOL_PRE_PING'])
+    if url.get_backend_name() == 'sqlite':
+        if mode == 'tpool':
+            # 同一个连接会在线程池的不同线程上使用
+            options['connect_args'] = dict(options.get('connect_args', {}), check_same_thread=False)
+    else:
+        options.setdefault('pool_size', app.config['DB_POOL_SIZE'])
+        options.setdefault('max_overflow', app.config['DB_MAX_OVERFLOW'])
+        options.setdefault('pool_timeout', app.config['DB_POOL_TIMEOUT'])
+        options.setdefault('pool_recycle', app.config['DB_POOL_RECYCLE'])
+    app.config['SQLALCHEMY_ENGINE_OPTIONS'] = options
+
+
+def _driver_url(uri, mode):
+    url = sa.engine.make_url(uri)
+    if mode == 'pymysql' and url.drivername in ('mysql', 'mysql+mysqldb'):
+        url = url.set(drivername='mysql+pymysql')
+    return url
+
+
+def _tpool_connect(dialect, connection_record, cargs, cparams):
+    from eventlet import tpool
+    connection = tpool.execute(dialect.loaded_dbapi.connect, *cargs, **cparams)
+    return tpool.Proxy(connection, autowrap_names=('cursor',))
+
+
+def init_green_engines(app, db):
+    """tpool 模式下给所有引擎挂上连接钩子。只在 eventlet 打过补丁的进程中生效。"""
+    if app.config['DB_GREEN_MODE'] != 'tpool':
+        return
+    from eventlet import patcher, tpool
+    if not patcher.is_monkey_patched('socket'):
+        return
+    # 线程池至少要能同时容纳连接池里的全部连接
+    tpool.set_num_threads(max(20, app.config['DB_POOL_SIZE'] + app.config['DB_MAX_OVERFLOW']))
+    with app.app_context():
+        engines = list(db.engines.values())
+    for engine in engines:
+        event.listen(engine, 'do_connect', _tpool_connect)
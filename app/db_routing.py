@@ -0,0 +1,137 @@
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime
+from functools import wraps
+
+import sqlalchemy as sa
+from flask import current_app, g, has_request_context, session as flask_session
+from flask_sqlalchemy.session import Session
+
+REPLICA_BIND = 'replica'
+_PRIMARY_UNTIL_KEY = '_db_primary_until'
+
+
+class ReplicaMonitor:
+    """读取副本上的心跳时间估算复制延迟，结果缓存 DB_REPLICA_LAG_CHECK_INTERVAL 秒。
+
+    心跳由主库上的定时任务写入 replication_heartbeat 表，副本上读到的时间与
+    当前时间之差即为延迟（要求各应用服务器时钟同步）。读不到心跳视为延迟无限大。
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._checked_at = 0.0
+        self._lag = None
+        self._counters = {'replica_reads': 0, 'primary_reads': 0, 'lag_fallbacks': 0, 'lag_checks': 0}
+
+    def lag(self, engine, interval):
+        now = time.monotonic()
+        with self._lock:
+            if now - self._checked_at < interval:
+                return self._lag
+            self._checked_at = now
+        from app.models import ReplicationHeartbeat
+
+        self._counters['lag_checks'] += 1
+        try:
+            with engine.connect() as conn:
+                beat_at = conn.execute(sa.select(ReplicationHeartbeat.beat_at).where(
+                    ReplicationHeartbeat.id == 1)).scalar()
+        except sa.exc.DBAPIError:
+            beat_at = None
+        lag = (datetime.utcnow() - beat_at).total_seconds() if beat_at is not None else None
+        with self._lock:
+            self._lag = lag
+        return lag
+
+    def count(self, name):
+        self._counters[name] += 1
+
+    def stats(self):
+        stats = dict(self._counters)
+        stats['lag_seconds'] = self._lag
+        return stats
+
+
+replica_monitor = ReplicaMonitor()
+
+
+class RoutingSession(Session):
+    """按场景在主库和只读副本之间选择引擎。
+
+    只有同时满足以下条件的查询才会发往副本：配置了副本；当前请求由 read_only
+    标记；本请求内还没有写操作；不在该客户端上次写入后的“读己之写”窗口内；
+    副本延迟不超过 DB_REPLICA_MAX_LAG。写操作（flush 以及 INSERT/UPDATE/DELETE
+    语句）始终发往主库。
+    """
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        engine = super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+        if bind is not None or REPLICA_BIND not in self._db.engines or engine is not self._db.engines.get(None):
+            return engine
+        if self._flushing or (clause is not None and getattr(clause, 'is_dml', False)):
+            self.info['wrote'] = True
+            if has_request_context():
+                g.db_wrote = True
+            return engine
+        if not self._replica_allowed():
+            replica_monitor.count('primary_reads')
+            return engine
+        replica = self._db.engines[REPLICA_BIND]
+        config = current_app.config
+        lag = replica_monitor.lag(replica, config['DB_REPLICA_LAG_CHECK_INTERVAL'])
+        if lag is None or lag > config['DB_REPLICA_MAX_LAG']:
+            replica_monitor.count('lag_fallbacks')
+            return engine
+        replica_monitor.count('replica_reads')
+        return replica
+
+    def _replica_allowed(self):
+        if not has_request_context() or not g.get('db_read_only') or g.get('db_wrote') or g.get('db_force_primary'):
+            return False
+        return flask_session.get(_PRIMARY_UNTIL_KEY, 0) < time.time()
+
+
+@sa.event.listens_for(RoutingSession, 'after_commit')
+def _remember_write(session):
+    if session.info.pop('wrote', False) and has_request_context() and REPLICA_BIND in session._db.engines:
+        # 写入后的一段时间内该客户端的读请求都走主库，避免读不到自己刚写的数据
+        flask_session[_PRIMARY_UNTIL_KEY] = time.time() + current_app.config['DB_READ_YOUR_WRITES_SECONDS']
+
+
+@sa.event.listens_for(RoutingSession, 'after_rollback')
+def _forget_write(session):
+    session.info.pop('wrote', None)
+
+
+def read_only(view):
+    """标记只读视图：其中的查询在条件允许时发往副本。"""
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        g.db_read_only = True
+        return view(*args, **kwargs)
+    return wrapper
+
+
+@contextmanager
+def use_primary():
+    """在只读视图中强制一段代码读主库，例如读取随后要修改的数据。"""
+    previous = g.get('db_force_primary', False)
+    g.db_force_primary = True
+    try:
+        yield
+    finally:
+        g.db_force_primary = previous
+
+
+def write_heartbeat(db):
+    """在主库上更新心跳时间，由定时任务调用。"""
+    from app.models import ReplicationHeartbeat
+
+    now = datetime.utcnow()
+    updated = db.session.execute(sa.update(ReplicationHeartbeat).where(
+        ReplicationHeartbeat.id == 1).values(beat_at=now)).rowcount
+    if not updated:
+        db.session.add(ReplicationHeartbeat(id=1, beat_at=now))
+    db.session.commit()
@@ -1,6 +1,6 @@
 from flask_wtf import FlaskForm
-from wtforms import StringField, PasswordField, BooleanField, SubmitField, TextAreaField, DateTimeField, IntegerField
-from wtforms.validators import DataRequired, Email, EqualTo, Length
+from wtforms import StringField, PasswordField, BooleanField, SubmitField, TextAreaField, DateTimeField, IntegerField, FloatField
+from wtforms.validators import DataRequired, Email, EqualTo, Length, NumberRange, Optional
 
 class LoginForm(FlaskForm):
     username = StringField('Username', validators=[DataRequired()])
@@ -22,8 +22,19 @@ class ActivityForm(FlaskForm):
     end_time = DateTimeField('End Time (YYYY-MM-DD HH:MM)', format='%Y-%m-%d %H:%M', validators=[DataRequired()])  # 新增结束时间
     location = StringField('Location', validators=[DataRequired()])
     max_participants = IntegerField('Max Participants', validators=[DataRequired()])
+    # 坐标可选，填写后活动会出现在“附近活动”中
+    latitude = FloatField('Latitude', validators=[Optional(), NumberRange(min=-90, max=90)])
+    longitude = FloatField('Longitude', validators=[Optional(), NumberRange(min=-180, max=180)])
     submit = SubmitField('Create Activity')
 
+    def validate(self, extra_validators=None):
+        if not super().validate(extra_validators):
+            return False
+        if (self.latitude.data is None) != (self.longitude.data is None):
+            self.longitude.errors.append('Latitude and longitude must be given together.')
+            return False
+        return True
+
 class ProfileForm(FlaskForm):
     username = StringField('Username', validators=[DataRequired()])
     email = StringField('Email', validators=[DataRequired(), Email()])
@@ -0,0 +1,85 @@
+import math
+from datetime import datetime
+
+import sqlalchemy as sa
+from sqlalchemy.orm import joinedload
+
+from app.models import Activity
+
+# 网格边长（度），约 5.5 公里；修改后需要对已有活动重新调用 index_activity
+CELL_DEGREES = 0.05
+EARTH_RADIUS_KM = 6371.0088
+_ROWS = int(round(180 / CELL_DEGREES))
+_COLS = int(round(360 / CELL_DEGREES))
+_KM_PER_DEGREE = math.pi * EARTH_RADIUS_KM / 180
+
+
+def cell_of(latitude, longitude):
+    row = min(int(math.floor((latitude + 90) / CELL_DEGREES)), _ROWS - 1)
+    col = int(math.floor((longitude + 180) / CELL_DEGREES)) % _COLS
+    return row, col
+
+
+def distance_km(lat1, lng1, lat2, lng2):
+    """两点间的大圆距离（haversine）。"""
+    phi1, phi2 = math.radians(lat1), math.radians(lat2)
+    d_phi = phi2 - phi1
+    d_lambda = math.radians(lng2 - lng1)
+    a = math.sin(d_phi / 2) ** 2 + math.cos(phi1) * math.cos(phi2) * math.sin(d_lambda / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * math.asin(min(1.0, math.sqrt(a)))
+
+
+def index_activity(activity):
+    """根据经纬度设置活动所在网格，未填写坐标时清空；调用方负责 commit。"""
+    if activity.latitude is None or activity.longitude is None:
+        activity.latitude = activity.longitude = None
+        activity.geo_row = activity.geo_col = None
+    else:
+        activity.geo_row, activity.geo_col = cell_of(activity.latitude, activity.longitude)
+
+
+def covering_cells(latitude, longitude, radius_km):
+    """返回覆盖以 (latitude, longitude) 为圆心、radius_km 为半径的圆的网格，
+
+    形式为 [(row, first_col, last_col)]，每行是一段连续的列区间，跨越 180 度经线时拆成两段。
+    """
+    d_lat = radius_km / _KM_PER_DEGREE
+    south, north = max(latitude - d_lat, -90.0), min(latitude + d_lat, 90.0)
+    first_row, _ = cell_of(south, 0)
+    last_row, _ = cell_of(north, 0)
+    # 经度方向的跨度取决于离赤道最远处的纬度
+    widest = max(abs(south), abs(north))
+    cos_lat = math.cos(math.radians(widest))
+    if widest >= 90 or radius_km / (_KM_PER_DEGREE * cos_lat) >= 180:
+        col_ranges = [(0, _COLS - 1)]
+    else:
+        d_lng = radius_km / (_KM_PER_DEGREE * cos_lat)
+        _, first_col = cell_of(0, longitude - d_lng)
+        _, last_col = cell_of(0, longitude + d_lng)
+        if first_col <= last_col:
+            col_ranges = [(first_col, last_col)]
+        else:
+            col_ranges = [(first_col, _COLS - 1), (0, last_col)]
+    return [(row, first_col, last_col)
+            for row in range(first_row, last_row + 1) for first_col, last_col in col_ranges]
+
+
+def nearby_activities(latitude, longitude, radius_km, limit=50, now=None):
+    """返回 radius_km 范围内尚未开始的活动及距离 [(activity, km)]，按距离从近到远排序。
+
+    先用 (geo_row, geo_col, event_time) 索引取出覆盖圆的网格中的候选活动，
+    再按实际距离过滤排序；扫描量只与附近网格中的活动数有关，与活动总数无关。
+    """
+    now = now or datetime.utcnow()
+    cells = sa.or_(*[sa.and_(Activity.geo_row == row, Activity.geo_col.between(first_col, last_col))
+                     for row, first_col, last_col in covering_cells(latitude, longitude, radius_km)])
+    candidates = Activity.query.options(joinedload(Activity.creator)).filter(
+        cells, Activity.event_time >= now
+    ).all()
+    results = []
+    for activity in candidates:
+        km = distance_km(latitude, longitude, activity.latitude, activity.longitude)
+        if km <= radius_km:
+            results.append((activity, km))
+    results.sort(key=lambda item: (item[1], item[0].event_time, item[0].id))
+    return results[:limit]
@@ -0,0 +1,153 @@
+import re
+import time
+from collections import Counter
+from contextlib import contextmanager
+from functools import wraps
+
+from flask import current_app, g, has_request_context, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+from app.log import get_logger
+from app.metrics import metrics
+
+_WHITESPACE_RE = re.compile(r'\s+')
+_IN_LIST_RE = re.compile(r'\(\s*(?:\?|%s|%\(\w+\)s|:\w+)(?:\s*,\s*(?:\?|%s|%\(\w+\)s|:\w+))+\s*\)')
+_LITERAL_RE = re.compile(r"'(?:[^']|'')*'|\b\d+\b")
+
+log = get_logger('sql')
+
+# 显式开启的统计（测试辅助函数使用），与当前请求无关
+_collectors = []
+_listening = False
+
+
+def statement_shape(statement):
+    """把 SQL 归一化为“形状”：去掉字面量、合并 IN 列表，用来识别重复语句。"""
+    shape = _WHITESPACE_RE.sub(' ', statement).strip()
+    shape = _LITERAL_RE.sub('?', shape)
+    return _IN_LIST_RE.sub('(?)', shape)
+
+
+class QueryStats:
+    def __init__(self):
+        self.count = 0
+        self.total_ms = 0.0
+        self.shapes = Counter()
+
+    def record(self, statement, elapsed_ms):
+        self.count += 1
+        self.total_ms += elapsed_ms
+        self.shapes[statement_shape(statement)] += 1
+
+    def suspects(self, threshold):
+        """同一形状的语句执行次数达到阈值即视为疑似 N+1。"""
+        return [(shape, count) for shape, count in self.shapes.most_common() if count >= threshold]
+
+    def report(self):
+        return '\n'.join(f'{count:>5} x {shape}' for shape, count in self.shapes.most_common())
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault('query_started', []).append(time.perf_counter())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    pending = conn.info.get('query_started')
+    if not pending:
+        return
+    started = pending.pop()
+    elapsed_ms = (time.perf_counter() - started) * 1000
+    if has_request_context():
+        stats = g.get('sql_stats')
+        if stats is not None:
+            stats.record(statement, elapsed_ms)
+    for stats in _collectors:
+        stats.record(statement, elapsed_ms)
+
+
+def _start():
+    g.sql_stats = QueryStats()
+
+
+def _finish(label):
+    stats = g.pop('sql_stats', None)
+    if stats is None:
+        return None
+    threshold = current_app.config['SQL_NPLUSONE_THRESHOLD']
+    suspects = stats.suspects(threshold)
+    log.info('sql stats', extra={'label': label, 'queries': stats.count, 'db_time_ms': round(stats.total_ms, 1)})
+    for shape, count in suspects:
+        log.warning('possible N+1 query', extra={'label': label, 'executions': count, 'statement': shape})
+    return stats, suspects
+
+
+def _listen():
+    global _listening
+    if not _listening:
+        # 挂在 Engine 类上，对所有引擎生效
+        event.listen(Engine, 'before_cursor_execute', _before_cursor_execute)
+        event.listen(Engine, 'after_cursor_execute', _after_cursor_execute)
+        _listening = True
+
+
+def init_instrumentation(app):
+    if not app.config['SQL_INSTRUMENTATION']:
+        return
+    _listen()
+
+    @app.before_request
+    def start_sql_stats():
+        _start()
+
+    @app.after_request
+    def finish_sql_stats(response):
+        result = _finish(f'{request.method} {request.path}')
+        if result and app.config['SQL_DEBUG_HEADERS']:
+            stats, suspects = result
+            response.headers['X-SQL-Queries'] = str(stats.count)
+            response.headers['X-SQL-Time-Ms'] = f'{stats.total_ms:.1f}'
+            if suspects:
+                response.headers['X-SQL-N-Plus-One'] = '; '.join(
+                    f'{count}x {shape[:120]}' for shape, count in suspects[:3])
+        return response
+
+
+def instrument_event(name):
+    """统计单个 Socket.IO 事件的耗时和其中的 SQL。Flask-SocketIO 不会触发 before/after_request。"""
+    def decorator(f):
+        @wraps(f)
+        def wrapper(*args, **kwargs):
+            if not current_app.config['SQL_INSTRUMENTATION']:
+                return metrics.time_event(name, f, *args, **kwargs)
+            _start()
+            try:
+                return metrics.time_event(name, f, *args, **kwargs)
+            finally:
+                _finish(f'socket {name}')
+        return wrapper
+    return decorator
+
+
+@contextmanager
+def count_queries():
+    """统计代码块内执行的全部 SQL，供测试使用。"""
+    _listen()
+    stats = QueryStats()
+    _collectors.append(stats)
+    try:
+        yield stats
+    finally:
+        _collectors.remove(stats)
+
+
+def assert_max_queries(client, url, max_queries, method='get', **kwargs):
+    """请求 url 并断言执行的 SQL 条数不超过 max_queries，返回响应。
+
+        response = assert_max_queries(client, '/', 4)
+    """
+    with count_queries() as stats:
+        response = getattr(client, method)(url, **kwargs)
+    assert stats.count <= max_queries, (
+        f'{method.upper()} {url} executed {stats.count} queries (budget {max_queries}):\n{stats.report()}')
+    return response
@@ -0,0 +1,227 @@
+import os
+import socket
+import time
+import uuid
+from datetime import datetime, timedelta
+
+import sqlalchemy as sa
+from sqlalchemy.exc import IntegrityError
+
+from app import db
+from app.log import get_logger
+from app.metrics import metrics
+from app.models import JobLease, JobRun
+
+log = get_logger('jobs')
+
+LEASE_NAME = 'jobs'
+
+
+def offload(func, *args, **kwargs):
+    """把不访问数据库的 CPU 密集型计算放到 eventlet 的原生线程池执行，不占用事件循环。
+
+    func 只能处理传入的数据：数据库会话和连接都属于事件循环，不能在原生线程中使用。
+    没有打 eventlet 补丁的进程（flask 命令、测试）直接调用。
+    """
+    try:
+        from eventlet import patcher, tpool
+    except ImportError:
+        return func(*args, **kwargs)
+    if not patcher.is_monkey_patched('thread'):
+        return func(*args, **kwargs)
+    return tpool.execute(func, *args, **kwargs)
+
+
+class Job:
+    def __init__(self, name, func, interval, history, enabled):
+        self.name = name
+        self.func = func
+        self.interval = interval
+        self.history = history
+        self.enabled = enabled
+
+
+class JobRunner:
+    """后台任务：所有进程通过 job_lease 表中的一行竞争租约，只有持有租约的进程执行任务。
+
+    任务用 job() 声明，由持有者按间隔执行并把每次运行写入 job_run。调度循环是一个
+    协程，只在租约快到期时访问数据库；任务本身在单独的协程中执行，其中 CPU 密集型的
+    计算步骤由任务自己通过 offload() 放到原生线程池。持有者退出或卡死时，
+    租约在 JOBS_LEASE_SECONDS 秒后过期，由其他进程接手。
+    """
+
+    def __init__(self):
+        self.app = None
+        self.socketio = None
+        self.identity = f'{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}'
+        self._jobs = {}
+        self._next_due = {}
+        self._running = set()
+        self._lease_until = None
+        self._task = None
+        self._stopping = False
+
+    def job(self, name, seconds=0, minutes=0, hours=0, history=True, enabled=None):
+        """声明一个按固定间隔执行的任务。enabled(config) 返回 False 时不调度；
+
+        history=False 的高频任务不写 job_run，只记录指标。
+        """
+        def decorator(func):
+            interval = timedelta(seconds=seconds, minutes=minutes, hours=hours)
+            self._jobs[name] = Job(name, func, interval, history, enabled)
+            return func
+        return decorator
+
+    def init_app(self, app, socketio):
+        self.app = app
+        self.socketio = socketio
+
+    @property
+    def is_leader(self):
+        return self._lease_until is not None and self._lease_until > datetime.utcnow()
+
+    def jobs(self):
+        return [job for job in self._jobs.values()
+                if job.enabled is None or job.enabled(self.app.config)]
+
+    def start(self):
+        """在处理请求的进程中启动调度循环；不访问数据库，立即返回。"""
+        if self._task is None and self.app.config['JOBS_ENABLED']:
+            self._stopping = False
+            self._task = self.socketio.start_background_task(self.run_forever)
+
+    def stop(self):
+        self._stopping = True
+
+    def stats(self):
+        return {'leader': int(self.is_leader), 'jobs': len(self.jobs()), 'running': len(self._running)}
+
+    def run_forever(self):
+        tick = self.app.config['JOBS_TICK_SECONDS']
+        while not self._stopping:
+            try:
+                with self.app.app_context():
+                    if self._hold_lease():
+                        self._dispatch_due()
+            except Exception:
+                log.exception('job runner tick failed')
+                self._lease_until = None
+            self.socketio.sleep(tick)
+        self._task = None
+        self._release()
+
+    def run_now(self, name):
+        """在当前进程中立即执行一次任务（不检查租约），返回运行结果。"""
+        job = self._jobs[name]
+        return self._execute(job, self._record_start(job, datetime.utcnow()))
+
+    def _hold_lease(self):
+        """获取或续租，返回当前进程是否是持有者。租约剩余不到三分之二时才访问数据库。"""
+        now = datetime.utcnow()
+        ttl = timedelta(seconds=self.app.config['JOBS_LEASE_SECONDS'])
+        if self._lease_until is not None and self._lease_until - now > ttl * 2 / 3:
+            return True
+        expires_at = now + ttl
+        was_leader = self.is_leader
+        updated = db.session.execute(sa.update(JobLease).where(
+            JobLease.name == LEASE_NAME,
+            sa.or_(JobLease.holder == self.identity, JobLease.expires_at < now)
+        ).ordered_values(
+            # MySQL 按顺序赋值，acquired_at 必须在 holder 之前计算
+            (JobLease.acquired_at, sa.case((JobLease.holder == self.identity, JobLease.acquired_at), else_=now)),
+            (JobLease.holder, self.identity),
+            (JobLease.expires_at, expires_at),
+        )).rowcount
+        if not updated:
+            try:
+                db.session.add(JobLease(name=LEASE_NAME, holder=self.identity, expires_at=expires_at, acquired_at=now))
+                db.session.flush()
+            except IntegrityError:
+                db.session.rollback()
+                if was_leader:
+                    log.warning('job lease lost', extra={'holder': self.identity})
+                self._lease_until = None
+                return False
+        db.session.commit()
+        # 续租时把本地到期时间留出一个 tick 的余量，避免与接手的进程同时执行
+        self._lease_until = expires_at - timedelta(seconds=self.app.config['JOBS_TICK_SECONDS'])
+        if not was_leader:
+            self._become_leader(now)
+        return True
+
+    def _become_leader(self, now):
+        log.info('job lease acquired', extra={'holder': self.identity})
+        # 上一任持有者没有执行完的记录标记为 abandoned
+        db.session.execute(sa.update(JobRun).where(
+            JobRun.outcome == 'running', JobRun.holder != self.identity
+        ).values(outcome='abandoned'))
+        db.session.commit()
+        # 按各任务最近一次开始时间接着排，避免换任后立刻重跑
+        last_started = dict(db.session.execute(
+            sa.select(JobRun.job, sa.func.max(JobRun.started_at)).group_by(JobRun.job)).all())
+        self._next_due = {job.name: last_started[job.name] + job.interval if job.name in last_started else now
+                          for job in self.jobs()}
+
+    def _dispatch_due(self):
+        now = datetime.utcnow()
+        for job in self.jobs():
+            if job.name in self._running or self._next_due.get(job.name, now) > now:
+                continue
+            self._next_due[job.name] = now + job.interval
+            run_id = self._record_start(job, now)
+            self._running.add(job.name)
+            self.socketio.start_background_task(self._execute_in_background, job, run_id)
+
+    def _execute_in_background(self, job, run_id):
+        try:
+            self._execute(job, run_id)
+        finally:
+            self._running.discard(job.name)
+
+    def _record_start(self, job, now):
+        if not job.history:
+            return None
+        run = JobRun(job=job.name, holder=self.identity, started_at=now, outcome='running')
+        db.session.add(run)
+        db.session.commit()
+        return run.id
+
+    def _execute(self, job, run_id):
+        started = time.perf_counter()
+        outcome, error = 'error', None
+        with self.app.app_context():
+            try:
+                job.func()
+                outcome = 'ok'
+            except Exception as exc:
+                db.session.rollback()
+                error = repr(exc)
+                log.exception('job failed', extra={'job': job.name})
+            finally:
+                seconds = time.perf_counter() - started
+                metrics.job_seconds.observe(seconds, job.name)
+                metrics.job_runs.inc(job.name, outcome)
+                if run_id is not None:
+                    db.session.execute(sa.update(JobRun).where(JobRun.id == run_id).values(
+                        finished_at=datetime.utcnow(), seconds=round(seconds, 3), outcome=outcome, error=error))
+                    db.session.commit()
+        return outcome
+
+    def _release(self):
+        if self._lease_until is None:
+            return
+        self._lease_until = None
+        with self.app.app_context():
+            db.session.execute(sa.update(JobLease).where(
+                JobLease.name == LEASE_NAME, JobLease.holder == self.identity
+            ).values(expires_at=datetime.utcnow()))
+            db.session.commit()
+
+
+def prune_job_runs(before):
+    result = db.session.execute(sa.delete(JobRun).where(JobRun.started_at < before, JobRun.outcome != 'running'))
+    db.session.commit()
+    return result.rowcount
+
+
+job_runner = JobRunner()
@@ -0,0 +1,269 @@
+import hmac
+import threading
+import time
+from bisect import bisect_left
+
+from flask import Response, abort, request
+
+# 延迟直方图的桶上界（秒）
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _format_labels(labels):
+    if not labels:
+        return ''
+    return '{' + ','.join(f'{name}="{_escape(value)}"' for name, value in labels) + '}'
+
+
+def _format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class _Metric:
+    kind = 'untyped'
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        self._values = {}
+
+    def _key(self, labels):
+        if len(labels) != len(self.labelnames):
+            raise ValueError(f'{self.name} expects labels {self.labelnames}, got {labels}')
+        return tuple(str(value) for value in labels)
+
+    def samples(self):
+        with self._lock:
+            items = list(self._values.items())
+        for key, value in sorted(items):
+            yield self.name, list(zip(self.labelnames, key)), value
+
+
+class Counter(_Metric):
+    kind = 'counter'
+
+    def inc(self, *labels, amount=1):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+
+class Gauge(_Metric):
+    kind = 'gauge'
+
+    def set(self, value, *labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+    def inc(self, *labels, amount=1):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def dec(self, *labels, amount=1):
+        self.inc(*labels, amount=-amount)
+
+
+class Histogram(_Metric):
+    kind = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), buckets=LATENCY_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value, *labels):
+        key = self._key(labels)
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                # 每个桶只记本桶的次数，导出时再累加
+                state = self._values[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            state[0][index] += 1
+            state[1] += value
+            state[2] += 1
+
+    def samples(self):
+        with self._lock:
+            items = [(key, (list(counts), total, count)) for key, (counts, total, count) in self._values.items()]
+        for key, (counts, total, count) in sorted(items):
+            labels = list(zip(self.labelnames, key))
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (float('inf'),), counts):
+                cumulative += bucket_count
+                yield self.name + '_bucket', labels + [('le', _format_value(float(bound)))], cumulative
+            yield self.name + '_sum', labels, total
+            yield self.name + '_count', labels, count
+
+
+class Metrics:
+    """进程内的指标注册表，以 Prometheus 文本格式在 /metrics 导出。
+
+    多进程部署时每个进程各自统计，需要分别抓取各工作进程的端口。缓存、写后队列
+    等组件的 stats() 以及连接池、房间数在抓取时现场读取，不占用请求路径。
+    """
+
+    def __init__(self):
+        self.enabled = False
+        self._metrics = []
+        self._collectors = []
+        self.http_request_seconds = self.histogram(
+            'yuedazi_http_request_duration_seconds', 'HTTP request latency by route', ('method', 'route', 'status'))
+        self.socket_event_seconds = self.histogram(
+            'yuedazi_socketio_event_duration_seconds', 'Socket.IO event handler latency', ('event',))
+        self.socket_events = self.counter(
+            'yuedazi_socketio_events_total', 'Socket.IO events handled', ('event', 'outcome'))
+        self.connected_sockets = self.gauge('yuedazi_socketio_connected', 'Currently connected Socket.IO clients')
+        self.socket_throttled = self.counter(
+            'yuedazi_socketio_throttled_total', 'Socket.IO events rejected by the rate limiter', ('event', 'scope'))
+        self.slow_consumer_disconnects = self.counter(
+            'yuedazi_socketio_slow_consumer_disconnects_total', 'Sockets disconnected for a full outbound queue')
+        self.job_seconds = self.histogram('yuedazi_job_duration_seconds', 'Background job run time', ('job',))
+        self.job_runs = self.counter('yuedazi_job_runs_total', 'Background job runs', ('job', 'outcome'))
+
+    def counter(self, name, documentation, labelnames=()):
+        return self._register(Counter(name, documentation, labelnames))
+
+    def gauge(self, name, documentation, labelnames=()):
+        return self._register(Gauge(name, documentation, labelnames))
+
+    def histogram(self, name, documentation, labelnames=(), buckets=LATENCY_BUCKETS):
+        return self._register(Histogram(name, documentation, labelnames, buckets))
+
+    def _register(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def init_app(self, app, db, socketio):
+        self.enabled = app.config['METRICS_ENABLED']
+        if not self.enabled:
+            return
+
+        @app.before_request
+        def start_request_timer():
+            request.environ['yuedazi.started'] = time.perf_counter()
+
+        @app.after_request
+        def observe_request(response):
+            started = request.environ.get('yuedazi.started')
+            if started is not None:
+                # 按路由规则而不是实际路径分组，避免每个活动 id 一条时间序列
+                route = request.url_rule.rule if request.url_rule is not None else 'unmatched'
+                self.http_request_seconds.observe(time.perf_counter() - started,
+                                                  request.method, route, response.status_code)
+            return response
+
+        @app.route('/metrics')
+        def metrics_endpoint():
+            # 指标里有路由、房间和队列等内部信息，没有配置令牌时不对外开放
+            token = app.config['METRICS_TOKEN']
+            if not token:
+                abort(404)
+            if not hmac.compare_digest(request.headers.get('Authorization', '').encode(), f'Bearer {token}'.encode()):
+                abort(403)
+            return Response(self.render(), mimetype='text/plain; version=0.0.4; charset=utf-8')
+
+        # 抓取时调用，返回 (名称, 类型, 说明, [(标签列表, 值)]) 的可迭代对象
+        self._collectors = [lambda: _component_stats(app), lambda: _pool_stats(db), lambda: _room_stats(socketio)]
+
+    def render(self):
+        lines = []
+        for metric in self._metrics:
+            lines.append(f'# HELP {metric.name} {metric.documentation}')
+            lines.append(f'# TYPE {metric.name} {metric.kind}')
+            for name, labels, value in metric.samples():
+                lines.append(f'{name}{_format_labels(labels)} {_format_value(value)}')
+        for collect in self._collectors:
+            for name, kind, documentation, samples in collect():
+                lines.append(f'# HELP {name} {documentation}')
+                lines.append(f'# TYPE {name} {kind}')
+                for labels, value in samples:
+                    lines.append(f'{name}{_format_labels(labels)} {_format_value(value)}')
+        return '\n'.join(lines) + '\n'
+
+    def time_event(self, name, f, *args, **kwargs):
+        """执行 Socket.IO 事件处理函数并记录耗时；返回错误 ack 的事件记为 error。"""
+        if not self.enabled:
+            return f(*args, **kwargs)
+        started = time.perf_counter()
+        outcome = 'exception'
+        try:
+            result = f(*args, **kwargs)
+            outcome = 'error' if isinstance(result, dict) and result.get('status') == 'error' else 'ok'
+            return result
+        finally:
+            self.socket_event_seconds.observe(time.perf_counter() - started, name)
+            self.socket_events.inc(name, outcome)
+
+
+def _component_stats(app):
+    from app.chat_stream import chat_stream
+    from app.chat_writer import message_writer
+    from app.db_routing import replica_monitor
+    from app.jobs import job_runner
+    from app.page_cache import page_cache
+    from app.passwords import password_hasher
+    from app.ratelimit import socket_limiter
+    from app.recommendations import recommender
+    from app.reminders import reminders
+    from app.user_cache import user_cache
+
+    components = [('chat_writer', message_writer), ('chat_stream', chat_stream), ('user_cache', user_cache),
+                  ('page_cache', page_cache), ('password_hasher', password_hasher), ('socket_limiter', socket_limiter),
+                  ('jobs', job_runner)]
+    if app.config.get('DB_REPLICA_URL'):
+        components.append(('replica', replica_monitor))
+    if recommender.enabled:
+        components.append(('recommendations', recommender))
+    if reminders.enabled:
+        components.append(('reminders', reminders))
+    for component, source in components:
+        for key, value in sorted(source.stats().items()):
+            if isinstance(value, (int, float)) and not isinstance(value, bool):
+                yield f'yuedazi_{component}_{key}', 'gauge', f'{component} stats()["{key}"]', [([], value)]
+
+
+def _pool_stats(db):
+    samples = {'size': [], 'checked_out': [], 'overflow': []}
+    for bind, engine in db.engines.items():
+        pool = engine.pool
+        if not hasattr(pool, 'checkedout'):
+            continue
+        labels = [('bind', bind or 'default')]
+        samples['size'].append((labels, pool.size()))
+        samples['checked_out'].append((labels, pool.checkedout()))
+        samples['overflow'].append((labels, pool.overflow()))
+    for key, values in samples.items():
+        if values:
+            yield f'yuedazi_db_pool_{key}', 'gauge', f'Database connection pool {key}', values
+
+
+def _room_stats(socketio):
+    server = getattr(socketio, 'server', None)
+    if server is None:
+        return
+    # 每个连接都有一个以 sid 命名的私有房间，这里只统计应用自己创建的房间
+    counts = {}
+    for namespace, rooms in server.manager.rooms.items():
+        for room, members in rooms.items():
+            if room is None or room in members:
+                continue
+            kind = room.split(':', 1)[0] if ':' in room else ('conversation' if '-' in room else room)
+            rooms_count, members_count = counts.get(kind, (0, 0))
+            counts[kind] = (rooms_count + 1, members_count + len(members))
+    yield ('yuedazi_socketio_rooms', 'gauge', 'Socket.IO rooms by kind',
+           [([('kind', kind)], rooms) for kind, (rooms, _) in sorted(counts.items())])
+    yield ('yuedazi_socketio_room_members', 'gauge', 'Socket.IO room memberships by kind',
+           [([('kind', kind)], members) for kind, (_, members) in sorted(counts.items())])
+
+
+metrics = Metrics()
@@ -5,7 +5,8 @@ import pytz  # 引入 pytz
 
 @login_manager.user_loader
 def load_user(user_id):
-    return User.query.get(int(user_id))
+    from app.user_cache import user_cache
+    return user_cache.get(user_id)
 
 class User(UserMixin, db.Model):
     id = db.Column(db.Integer, primary_key=True)
@@ -24,11 +25,27 @@ class Activity(db.Model):
     creator_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
     created_at = db.Column(db.DateTime, default=lambda: datetime.now(pytz.UTC))  # 显式指定 UTC
     event_time = db.Column(db.DateTime, nullable=False)
-    end_time = db.Column(db.DateTime, nullable=True)
+    end_time = db.Column(db.DateTime, nullable=True, index=True)  # 过期清理按结束时间查找
     location = db.Column(db.String(100), nullable=False)
     max_participants = db.Column(db.Integer, nullable=False)
+    # 已报名人数，由报名/退出的条件 UPDATE 维护，定期与 participation 表对账
+    participant_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    # 可选坐标；geo_row/geo_col 是所在网格，由 app.geo.index_activity 维护
+    latitude = db.Column(db.Float)
+    longitude = db.Column(db.Float)
+    geo_row = db.Column(db.Integer)
+    geo_col = db.Column(db.Integer)
     participants = db.relationship('Participation', backref='activity', lazy='dynamic', cascade='all, delete-orphan')
     messages = db.relationship('Message', backref='activity', lazy='dynamic', cascade='all, delete-orphan')
+    conversations = db.relationship('Conversation', backref='activity', lazy='dynamic', cascade='all, delete-orphan')
+
+    # 活动广场 keyset 分页使用的复合索引
+    __table_args__ = (
+        db.Index('ix_activity_created_at_id', 'created_at', 'id'),
+        db.Index('ix_activity_event_time_id', 'event_time', 'id'),
+        # 附近活动查询：按网格行、列区间和开始时间过滤
+        db.Index('ix_activity_geo_cell', 'geo_row', 'geo_col', 'event_time'),
+    )
 
 class Participation(db.Model):
     id = db.Column(db.Integer, primary_key=True)
@@ -36,11 +53,157 @@ class Participation(db.Model):
     activity_id = db.Column(db.Integer, db.ForeignKey('activity.id'), nullable=False)
     joined_at = db.Column(db.DateTime, default=lambda: datetime.now(pytz.UTC))  # 显式指定 UTC
 
+    __table_args__ = (
+        db.Index('uq_participation_user_activity', 'user_id', 'activity_id', unique=True),
+    )
+
 class Message(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     sender_id = db.Column(db.Integer, db.ForeignKey('user.id', ondelete='CASCADE'), nullable=False)
     receiver_id = db.Column(db.Integer, db.ForeignKey('user.id', ondelete='CASCADE'), nullable=False)
     activity_id = db.Column(db.Integer, db.ForeignKey('activity.id', ondelete='CASCADE'), nullable=False)
-    conversation_id = db.Column(db.String(100), nullable=False)
+    conversation_id = db.Column(db.Integer, db.ForeignKey('conversation.id', ondelete='CASCADE'), nullable=False)
+    content = db.Column(db.Text, nullable=False)
+    timestamp = db.Column(db.DateTime, default=lambda: datetime.now(pytz.UTC))  # 显式指定 UTC
+    # 会话内从 1 开始连续递增的序号，写入时由 conversation.last_seq 分配；断线重连的客户端按序号补齐
+    seq = db.Column(db.Integer, nullable=False)
+
+    # 聊天记录按会话倒序分页加载。归档表沿用消息 id，SQLite 下需 AUTOINCREMENT 保证删除后 id 不被复用
+    __table_args__ = (
+        db.Index('ix_message_conversation_timestamp_id', 'conversation_id', 'timestamp', 'id'),
+        db.Index('uq_message_conversation_seq', 'conversation_id', 'seq', unique=True),
+        {'sqlite_autoincrement': True},
+    )
+
+class Conversation(db.Model):
+    # 会话的反范式汇总，随每条消息在同一事务中更新。一个活动中的一对用户对应一个会话，
+    # URL 和 Socket.IO 房间使用 key（"活动id-较小用户id-较大用户id"），库内用整数 id 关联消息
+    id = db.Column(db.Integer, primary_key=True)
+    activity_id = db.Column(db.Integer, db.ForeignKey('activity.id', ondelete='CASCADE'), nullable=False)
+    user1_id = db.Column(db.Integer, db.ForeignKey('user.id', ondelete='CASCADE'), nullable=False)  # 较小的用户 id
+    user2_id = db.Column(db.Integer, db.ForeignKey('user.id', ondelete='CASCADE'), nullable=False)  # 较大的用户 id
+    last_message_id = db.Column(db.Integer, nullable=True)
+    last_activity_at = db.Column(db.DateTime, nullable=True)
+    user1_unread = db.Column(db.Integer, nullable=False, default=0)
+    user2_unread = db.Column(db.Integer, nullable=False, default=0)
+    last_seq = db.Column(db.Integer, nullable=False, default=0, server_default='0')  # 最后一条消息的序号
+    user1 = db.relationship('User', foreign_keys=[user1_id])
+    user2 = db.relationship('User', foreign_keys=[user2_id])
+    # 只用于让 ORM 先删消息再删会话；消息随活动/用户级联删除，这里不接管
+    messages = db.relationship('Message', backref='conversation', lazy='dynamic', passive_deletes='all')
+
+    # 最近聊天按参与者 + 最后活跃时间查询
+    __table_args__ = (
+        db.Index('uq_conversation_activity_users', 'activity_id', 'user1_id', 'user2_id', unique=True),
+        db.Index('ix_conversation_user1_last_activity', 'user1_id', 'last_activity_at'),
+        db.Index('ix_conversation_user2_last_activity', 'user2_id', 'last_activity_at'),
+    )
+
+    @property
+    def key(self):
+        return f"{self.activity_id}-{self.user1_id}-{self.user2_id}"
+
+    def other_user(self, user_id):
+        return self.user2 if user_id == self.user1_id else self.user1
+
+    def unread_for(self, user_id):
+        return self.user1_unread if user_id == self.user1_id else self.user2_unread
+
+class ActivityArchive(db.Model):
+    # 过期活动归档（REAPER_ARCHIVE 开启时由清理任务写入）
+    __tablename__ = 'activity_archive'
+    id = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    title = db.Column(db.String(100), nullable=False)
+    description = db.Column(db.Text, nullable=False)
+    creator_id = db.Column(db.Integer, nullable=False)
+    created_at = db.Column(db.DateTime)
+    event_time = db.Column(db.DateTime, nullable=False)
+    end_time = db.Column(db.DateTime)
+    location = db.Column(db.String(100), nullable=False)
+    max_participants = db.Column(db.Integer, nullable=False)
+    latitude = db.Column(db.Float)
+    longitude = db.Column(db.Float)
+    archived_at = db.Column(db.DateTime, nullable=False)
+
+class MessageArchive(db.Model):
+    # 过期活动的消息，以及超过 MESSAGE_ARCHIVE_AFTER_DAYS 天从 message 表移出的历史消息；
+    # 过期活动的会话已被删除，conversation_id 只作记录（迁移前归档、找不到会话的为空）
+    __tablename__ = 'message_archive'
+    id = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    sender_id = db.Column(db.Integer, nullable=False)
+    receiver_id = db.Column(db.Integer, nullable=False)
+    activity_id = db.Column(db.Integer, nullable=False, index=True)
+    conversation_id = db.Column(db.Integer, nullable=True)
     content = db.Column(db.Text, nullable=False)
-    timestamp = db.Column(db.DateTime, default=lambda: datetime.now(pytz.UTC))  # 显式指定 UTC
\ No newline at end of file
+    timestamp = db.Column(db.DateTime)
+    seq = db.Column(db.Integer)  # 引入序号之前归档的消息为空
+    archived_at = db.Column(db.DateTime, nullable=False)
+    sender = db.relationship('User', primaryjoin='foreign(MessageArchive.sender_id) == User.id', viewonly=True)
+
+    # 翻到 message 表最早一条之后，继续按同样的顺序读归档
+    __table_args__ = (
+        db.Index('ix_message_archive_conversation_timestamp_id', 'conversation_id', 'timestamp', 'id'),
+    )
+
+class ReplicationHeartbeat(db.Model):
+    # 主库定时写入，只读副本上读到的时间用来估算复制延迟
+    __tablename__ = 'replication_heartbeat'
+    id = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    beat_at = db.Column(db.DateTime, nullable=False)
+
+class SearchTerm(db.Model):
+    __tablename__ = 'search_term'
+    # 活动全文检索的倒排索引：(词, 活动) -> 权重
+    term = db.Column(db.String(64), primary_key=True)
+    activity_id = db.Column(db.Integer, db.ForeignKey('activity.id', ondelete='CASCADE'), primary_key=True, index=True)
+    weight = db.Column(db.Integer, nullable=False)
+
+class Recommendation(db.Model):
+    __tablename__ = 'recommendation'
+    # 离线计算的“为你推荐”，首页按 (user_id, rank) 主键顺序读取
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id', ondelete='CASCADE'), primary_key=True)
+    rank = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    activity_id = db.Column(db.Integer, db.ForeignKey('activity.id', ondelete='CASCADE'), nullable=False, index=True)
+    score = db.Column(db.Float, nullable=False)
+    generated_at = db.Column(db.DateTime, nullable=False)
+
+class RecommendationBuild(db.Model):
+    __tablename__ = 'recommendation_build'
+    # 每次推荐计算的耗时、内存峰值和规模；水位线是增量更新的起点
+    id = db.Column(db.Integer, primary_key=True)
+    kind = db.Column(db.String(16), nullable=False)
+    started_at = db.Column(db.DateTime, nullable=False)
+    seconds = db.Column(db.Float, nullable=False)
+    peak_rss_bytes = db.Column(db.BigInteger)
+    matrix_bytes = db.Column(db.BigInteger, nullable=False)
+    users = db.Column(db.Integer, nullable=False)
+    activities = db.Column(db.Integer, nullable=False)
+    interactions = db.Column(db.Integer, nullable=False)
+    recommendations = db.Column(db.Integer, nullable=False)
+    participation_watermark = db.Column(db.Integer, nullable=False)
+    message_watermark = db.Column(db.Integer, nullable=False)
+    activity_watermark = db.Column(db.Integer, nullable=False)
+
+class JobLease(db.Model):
+    __tablename__ = 'job_lease'
+    # 后台任务的租约：同一时刻只有 holder 所在进程执行任务，过期后由其他进程接手
+    name = db.Column(db.String(64), primary_key=True)
+    holder = db.Column(db.String(128), nullable=False)
+    acquired_at = db.Column(db.DateTime, nullable=False)
+    expires_at = db.Column(db.DateTime, nullable=False)
+
+class JobRun(db.Model):
+    __tablename__ = 'job_run'
+    # 后台任务的运行记录，outcome 为 running/ok/error/abandoned
+    id = db.Column(db.Integer, primary_key=True)
+    job = db.Column(db.String(64), nullable=False)
+    holder = db.Column(db.String(128), nullable=False)
+    started_at = db.Column(db.DateTime, nullable=False)
+    finished_at = db.Column(db.DateTime)
+    seconds = db.Column(db.Float)
+    outcome = db.Column(db.String(16), nullable=False)
+    error = db.Column(db.Text)
+
+    __table_args__ = (
+        db.Index('ix_job_run_job_started_at', 'job', 'started_at'),
+    )
@@ -0,0 +1,178 @@
+import hashlib
+import itertools
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime, timezone
+from functools import wraps
+
+from flask import Response, make_response, render_template, request, session
+from flask_login import current_user
+from markupsafe import Markup
+
+
+class PageCache:
+    """活动广场和活动详情的页面/片段缓存。
+
+    缓存键里带上版本号：全局的 feed 版本、每个活动自己的版本，以及影响所有
+    页面的 generation（例如用户改名）。写路径只需要递增版本号，旧条目不再被
+    命中，最终被 LRU 淘汰。版本号只在本进程内有效，多进程部署时其他进程依靠
+    TTL 兜底。
+
+    - cached_response：匿名 GET 请求的整页缓存，带 ETag/Last-Modified，支持 304
+    - fragment：渲染好的 HTML 片段，登录用户的页面也可以复用
+    """
+
+    def __init__(self):
+        self.enabled = False
+        self.max_entries = 0
+        self.ttl = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._counter = itertools.count(1)
+        self._generation = 0
+        self._feed_version = 0
+        self._activity_versions = {}
+        self._counters = {
+            'hits': 0,
+            'misses': 0,
+            'not_modified': 0,
+            'bypassed': 0,
+            'fragment_hits': 0,
+            'fragment_misses': 0,
+            'evictions': 0,
+        }
+
+    def init_app(self, app):
+        self.enabled = app.config['PAGE_CACHE_ENABLED']
+        self.max_entries = app.config['PAGE_CACHE_SIZE']
+        self.ttl = app.config['PAGE_CACHE_TTL']
+        app.jinja_env.globals.update(cached_fragment=self.fragment, activity_version=self.activity_version)
+
+    # ---- 版本号 ----
+
+    def feed_version(self):
+        return self._feed_version
+
+    def activity_version(self, activity_id):
+        return self._activity_versions.get(int(activity_id), 0)
+
+    def bump_feed(self):
+        with self._lock:
+            self._feed_version = next(self._counter)
+
+    def bump_activity(self, *activity_ids):
+        """活动内容、报名人数变化时调用。活动 id 可能被数据库复用，所以删除时也只递增不移除。"""
+        with self._lock:
+            for activity_id in activity_ids:
+                self._activity_versions[int(activity_id)] = next(self._counter)
+
+    def bump_all(self):
+        """用户名等会出现在任意页面上的数据变化时调用。"""
+        with self._lock:
+            self._generation = next(self._counter)
+
+    # ---- 存储 ----
+
+    def _get(self, key):
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if entry['expires'] <= now:
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return entry
+
+    def _put(self, key, entry):
+        entry['expires'] = time.monotonic() + self.ttl
+        with self._lock:
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self._counters['evictions'] += 1
+
+    def _count(self, name):
+        with self._lock:
+            self._counters[name] += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._counters)
+            stats['entries'] = len(self._entries)
+        stats['capacity'] = self.max_entries
+        pages = stats['hits'] + stats['misses']
+        stats['hit_rate'] = stats['hits'] / pages if pages else 0.0
+        fragments = stats['fragment_hits'] + stats['fragment_misses']
+        stats['fragment_hit_rate'] = stats['fragment_hits'] / fragments if fragments else 0.0
+        return stats
+
+    # ---- 片段 ----
+
+    def fragment(self, template, version, **context):
+        """渲染并缓存一个模板片段，version 通常是 (活动 id, 活动版本)。"""
+        if not self.enabled:
+            return Markup(render_template(template, **context))
+        key = ('fragment', template, version, self._generation)
+        entry = self._get(key)
+        if entry is not None:
+            self._count('fragment_hits')
+            return entry['html']
+        self._count('fragment_misses')
+        html = Markup(render_template(template, **context))
+        self._put(key, {'html': html})
+        return html
+
+    # ---- 整页 ----
+
+    def _cacheable(self):
+        # 登录用户的页面包含个人信息；带闪现消息的页面只显示一次
+        return (self.enabled and request.method == 'GET'
+                and not current_user.is_authenticated and '_flashes' not in session)
+
+    def cached_response(self, versions):
+        """缓存匿名用户的 GET 响应，versions(**view_args) 返回页面依赖的版本号。"""
+        def decorator(view):
+            @wraps(view)
+            def wrapper(**kwargs):
+                if not self._cacheable():
+                    self._count('bypassed')
+                    return view(**kwargs)
+                key = ('page', request.full_path, versions(**kwargs), self._generation)
+                entry = self._get(key)
+                if entry is None:
+                    self._count('misses')
+                    response = make_response(view(**kwargs))
+                    if response.status_code != 200 or response.direct_passthrough:
+                        return response
+                    body = response.get_data()
+                    entry = {
+                        'body': body,
+                        'mimetype': response.mimetype,
+                        'etag': hashlib.md5(body).hexdigest(),
+                        'last_modified': datetime.now(timezone.utc).replace(microsecond=0),
+                    }
+                    self._put(key, entry)
+                else:
+                    self._count('hits')
+                response = Response(entry['body'], mimetype=entry['mimetype'])
+                response.set_etag(entry['etag'])
+                response.last_modified = entry['last_modified']
+                # 浏览器每次都带条件头回来验证，未变化时只返回 304
+                response.cache_control.no_cache = True
+                response = response.make_conditional(request)
+                if response.status_code == 304:
+                    self._count('not_modified')
+                return response
+            return wrapper
+        return decorator
+
+
+page_cache = PageCache()
@@ -0,0 +1,42 @@
+import base64
+from datetime import datetime
+
+
+# 游标格式: base64("<排序列的 ISO 时间>|<id>")，对客户端不透明
+def encode_cursor(value, ident):
+    raw = f"{value.isoformat()}|{ident}".encode('utf-8')
+    return base64.urlsafe_b64encode(raw).decode('ascii').rstrip('=')
+
+
+def decode_cursor(cursor):
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        value, ident = base64.urlsafe_b64decode(padded.encode('ascii')).decode('utf-8').split('|')
+        return datetime.fromisoformat(value), int(ident)
+    except (ValueError, UnicodeError) as exc:
+        raise ValueError(f'Invalid cursor: {cursor!r}') from exc
+
+
+def keyset_page(query, column, id_column, cursor=None, limit=20, descending=True):
+    """按 (column, id) 做 keyset 分页，返回 (当前页记录, 下一页游标或 None)。
+
+    每页只扫描索引上的 limit + 1 行，代价与表大小无关。
+    """
+    if cursor:
+        value, ident = decode_cursor(cursor)
+        if descending:
+            query = query.filter((column < value) | ((column == value) & (id_column < ident)))
+        else:
+            query = query.filter((column > value) | ((column == value) & (id_column > ident)))
+    if descending:
+        query = query.order_by(column.desc(), id_column.desc())
+    else:
+        query = query.order_by(column.asc(), id_column.asc())
+
+    rows = query.limit(limit + 1).all()
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        last = rows[-1]
+        next_cursor = encode_cursor(getattr(last, column.key), getattr(last, id_column.key))
+    return rows, next_cursor
@@ -0,0 +1,75 @@
+import sqlalchemy as sa
+from sqlalchemy.exc import IntegrityError
+
+from app import db
+from app.models import Activity, Participation
+
+JOINED = 'joined'
+ALREADY_JOINED = 'already_joined'
+FULL = 'full'
+NOT_FOUND = 'not_found'
+
+
+def join_activity(user_id, activity_id):
+    """占一个名额并写入参与记录，返回 JOINED / ALREADY_JOINED / FULL / NOT_FOUND。
+
+    名额用一条带条件的 UPDATE 抢占，行锁保证并发报名不会超出 max_participants；
+    重复报名由 (user_id, activity_id) 唯一索引拦下，回滚后名额随之释放。
+    """
+    claimed = db.session.execute(
+        sa.update(Activity).where(
+            Activity.id == activity_id,
+            Activity.participant_count < Activity.max_participants
+        ).values(participant_count=Activity.participant_count + 1)
+    ).rowcount
+    if claimed:
+        try:
+            db.session.execute(sa.insert(Participation).values(user_id=user_id, activity_id=activity_id))
+            db.session.commit()
+            return JOINED
+        except IntegrityError:
+            db.session.rollback()
+            return ALREADY_JOINED
+    db.session.rollback()
+    # 失败路径才需要区分原因
+    if db.session.query(Participation.id).filter_by(user_id=user_id, activity_id=activity_id).first():
+        return ALREADY_JOINED
+    if db.session.query(Activity.id).filter_by(id=activity_id).first() is None:
+        return NOT_FOUND
+    return FULL
+
+
+def leave_activity(user_id, activity_id):
+    """删除参与记录并归还名额，返回是否确实退出。"""
+    removed = db.session.execute(
+        sa.delete(Participation).where(Participation.user_id == user_id, Participation.activity_id == activity_id)
+    ).rowcount
+    if removed:
+        db.session.execute(
+            sa.update(Activity).where(Activity.id == activity_id, Activity.participant_count >= removed).values(
+                participant_count=Activity.participant_count - removed)
+        )
+    db.session.commit()
+    return bool(removed)
+
+
+def release_user_participations(user_id):
+    """注销账号前归还该用户占用的名额，调用方负责 commit。"""
+    joined = sa.select(Participation.activity_id).where(Participation.user_id == user_id)
+    db.session.execute(
+        sa.update(Activity).where(Activity.id.in_(joined), Activity.participant_count > 0).values(
+            participant_count=Activity.participant_count - 1)
+    )
+    db.session.execute(sa.delete(Participation).where(Participation.user_id == user_id))
+
+
+def reconcile_participant_counts():
+    """按 participation 表重算 participant_count，返回被修正的活动数。"""
+    actual = sa.select(sa.func.count(Participation.id)).where(
+        Participation.activity_id == Activity.id
+    ).scalar_subquery()
+    fixed = db.session.execute(
+        sa.update(Activity).where(Activity.participant_count != actual).values(participant_count=actual)
+    ).rowcount
+    db.session.commit()
+    return fixed
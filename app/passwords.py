@@ -0,0 +1,176 @@
+import atexit
+import multiprocessing
+import os
+import threading
+import time
+from collections import deque
+
+from werkzeug.security import check_password_hash, generate_password_hash
+
+
+class PasswordHasherBusy(Exception):
+    """等待计算的哈希任务已达上限。"""
+
+
+def _worker_main(conn):
+    os.set_blocking(conn.fileno(), True)
+    while True:
+        try:
+            fn, args = conn.recv()
+        except EOFError:
+            return
+        try:
+            conn.send((True, fn(*args)))
+        except Exception as exc:
+            conn.send((False, exc))
+
+
+class PasswordHasher:
+    """在独立进程池中计算密码哈希。
+
+    scrypt/pbkdf2 是故意设计得很慢的 CPU 密集计算，在 eventlet 进程里直接调用会让
+    所有连接一起卡住几十毫秒。这里交给 spawn 出来的工作进程计算，调用方通过
+    sleep 轮询管道，期间事件循环照常运行。没有使用 ProcessPoolExecutor：它的
+    管理线程在 eventlet 补丁下会让进程退出时卡住。排队数超过上限时直接拒绝；
+    同一 IP 在时间窗口内的尝试次数也有上限。
+    """
+
+    def __init__(self):
+        self.method = 'scrypt'
+        self.workers = 0
+        self.queue_limit = 0
+        self.attempt_limit = 0
+        self.attempt_window = 0
+        self._sleep = time.sleep
+        self._processes = []
+        self._idle = deque()
+        self._pending = 0
+        self._attempts = {}
+        self._lock = threading.Lock()
+        self._counters = {'hashed': 0, 'verified': 0, 'rehashed': 0, 'rejected_busy': 0, 'throttled': 0,
+                          'max_pending': 0, 'total_ms': 0.0}
+
+    def init_app(self, app, socketio):
+        self.method = app.config['PASSWORD_HASH_METHOD']
+        self.workers = app.config['PASSWORD_HASH_WORKERS']
+        self.queue_limit = app.config['PASSWORD_HASH_QUEUE_LIMIT']
+        self.attempt_limit = app.config['LOGIN_ATTEMPTS_PER_IP']
+        self.attempt_window = app.config['LOGIN_ATTEMPT_WINDOW']
+        self._sleep = socketio.sleep
+
+    def hash(self, password):
+        password_hash = self._run(generate_password_hash, password, self.method)
+        self._counters['hashed'] += 1
+        return password_hash
+
+    def verify(self, password_hash, password):
+        result = self._run(check_password_hash, password_hash, password)
+        self._counters['verified'] += 1
+        return result
+
+    def needs_rehash(self, password_hash):
+        """已保存的哈希与当前 PASSWORD_HASH_METHOD 的算法或参数不一致。"""
+        return password_hash.split('$', 1)[0] != self.method
+
+    def upgrade(self, user, password):
+        """登录成功后按当前参数重新计算旧哈希，返回是否有修改（调用方负责 commit）。"""
+        if not self.needs_rehash(user.password_hash):
+            return False
+        user.password_hash = self.hash(password)
+        self._counters['rehashed'] += 1
+        return True
+
+    def allow(self, ip):
+        """记录一次来自 ip 的尝试，超出窗口内的次数上限时返回 False。"""
+        now = time.monotonic()
+        with self._lock:
+            attempts = self._attempts.setdefault(ip, deque())
+            while attempts and attempts[0] <= now - self.attempt_window:
+                attempts.popleft()
+            if len(attempts) >= self.attempt_limit:
+                self._counters['throttled'] += 1
+                return False
+            attempts.append(now)
+            if len(self._attempts) > 10000:
+                # 清掉窗口外已经没有记录的 IP，防止字典无限增长
+                for key in [key for key, value in self._attempts.items()
+                            if not value or value[-1] <= now - self.attempt_window]:
+                    del self._attempts[key]
+            return True
+
+    def stats(self):
+        stats = dict(self._counters)
+        stats['pending'] = self._pending
+        stats['workers'] = self.workers
+        stats['queue_limit'] = self.queue_limit
+        return stats
+
+    def shutdown(self):
+        for process, conn in self._processes:
+            conn.close()
+            process.join(timeout=1)
+        self._processes = []
+        self._idle.clear()
+
+    def _acquire(self):
+        """取一个空闲的工作进程，不足 workers 个时按需启动，否则等待。"""
+        while True:
+            with self._lock:
+                if self._idle:
+                    return self._idle.popleft()
+                if len(self._processes) < self.workers:
+                    # spawn 出的进程不继承 eventlet 补丁和数据库连接
+                    context = multiprocessing.get_context('spawn')
+                    conn, child_conn = context.Pipe()
+                    # eventlet 补丁下创建的 socketpair 是非阻塞的，子进程会继承这一设置
+                    os.set_blocking(conn.fileno(), True)
+                    os.set_blocking(child_conn.fileno(), True)
+                    process = context.Process(target=_worker_main, args=(child_conn,), daemon=True)
+                    process.start()
+                    child_conn.close()
+                    if not self._processes:
+                        atexit.register(self.shutdown)
+                    self._processes.append((process, conn))
+                    return process, conn
+            self._sleep(0.002)
+
+    def _call(self, fn, args):
+        worker = self._acquire()
+        process, conn = worker
+        try:
+            conn.send((fn, args))
+            while not conn.poll():
+                self._sleep(0.002)
+            ok, result = conn.recv()
+        except (EOFError, OSError):
+            # 工作进程异常退出，丢弃后由下一次调用重新启动
+            with self._lock:
+                self._processes.remove(worker)
+            raise
+        with self._lock:
+            self._idle.append(worker)
+        if not ok:
+            raise result
+        return result
+
+    def _run(self, fn, *args):
+        started = time.perf_counter()
+        if self.workers <= 0:
+            result = fn(*args)
+        else:
+            with self._lock:
+                if self._pending >= self.queue_limit:
+                    self._counters['rejected_busy'] += 1
+                    raise PasswordHasherBusy()
+                self._pending += 1
+                self._counters['max_pending'] = max(self._counters['max_pending'], self._pending)
+            try:
+                result = self._call(fn, args)
+            finally:
+                with self._lock:
+                    self._pending -= 1
+        self._counters['total_ms'] += (time.perf_counter() - started) * 1000
+        return result
+
+
+password_hasher = PasswordHasher()
@@ -0,0 +1,227 @@
+import importlib.metadata
+import socket as socket_module
+import threading
+import time
+from collections import OrderedDict
+from functools import lru_cache, wraps
+
+from flask import request
+from flask_login import current_user
+
+from app.log import get_logger
+from app.metrics import metrics
+
+log = get_logger('ratelimit')
+
+
+class SocketLimiter:
+    """Socket.IO 事件限流，以及断开发送队列堆积的慢消费者。
+
+    每个事件名可以按连接和按用户各配一个令牌桶 (每秒补充的令牌数, 桶容量)，两个桶都拿到
+    令牌才处理事件，否则直接返回 {'status': 'error', 'error': 'rate_limited', 'retry_after': 秒}。
+    令牌桶以 (范围, sid 或用户 id, 事件名) 为键放在一个 LRU 字典里，每次判断只有几次查找和
+    算术运算；桶的数量超过 SOCKET_RATE_LIMIT_KEYS 时淘汰最久未用的（相当于把它重新装满）。
+
+    后台任务每 SOCKET_OUTBOUND_CHECK_SECONDS 秒检查本进程每个连接待发送的数据包数，超过
+    SOCKET_OUTBOUND_QUEUE_LIMIT 的连接（网络太慢或不读数据的客户端）直接断开，
+    避免广播在它的发送队列里无限堆积。
+    """
+
+    def __init__(self):
+        self.socketio = None
+        self.limits = {}
+        self.max_keys = 0
+        self.queue_limit = 0
+        self.check_interval = 0
+        self._buckets = OrderedDict()
+        self._lock = threading.Lock()
+        self._watching = False
+        self._counters = {'allowed': 0, 'throttled': 0, 'evictions': 0, 'slow_consumers_disconnected': 0,
+                          'max_outbound_queue': 0}
+
+    def init_app(self, app, socketio):
+        self.socketio = socketio
+        self.limits = {}
+        for event, scopes in app.config['SOCKET_RATE_LIMITS'].items():
+            self.limits[event] = {}
+            for scope, (rate, burst) in scopes.items():
+                # 速率为 0 时桶永远补不满，也无法算出等待时间；不限流的事件直接不要列出
+                if not rate > 0 or not burst >= 1:
+                    raise ValueError(f'SOCKET_RATE_LIMITS[{event!r}][{scope!r}] needs rate > 0 and burst >= 1, '
+                                     f'got {(rate, burst)!r}')
+                self.limits[event][scope] = (float(rate), float(burst))
+        self.max_keys = app.config['SOCKET_RATE_LIMIT_KEYS']
+        self.queue_limit = app.config['SOCKET_OUTBOUND_QUEUE_LIMIT']
+        self.check_interval = app.config['SOCKET_OUTBOUND_CHECK_SECONDS']
+        self.clear()
+        if self.queue_limit and not self._watching:
+            self._watching = True
+            socketio.start_background_task(self._watch_outbound)
+
+    def clear(self):
+        with self._lock:
+            self._buckets.clear()
+
+    def stats(self):
+        with self._lock:
+            return dict(self._counters, buckets=len(self._buckets), bucket_capacity=self.max_keys)
+
+    # ---- 令牌桶 ----
+
+    def acquire(self, event, sid, user_id=None):
+        """为一次事件取令牌。放行时返回 0，否则返回建议的等待秒数。"""
+        scopes = self.limits.get(event)
+        if not scopes:
+            return 0
+        now = time.monotonic()
+        owners = (('socket', sid), ('user', user_id))
+        with self._lock:
+            buckets = []
+            for scope, owner in owners:
+                limit = scopes.get(scope)
+                if limit is None or owner is None:
+                    continue
+                bucket = self._bucket((scope, owner, event), limit, now)
+                if bucket[0] < 1:
+                    self._counters['throttled'] += 1
+                    metrics.socket_throttled.inc(event, scope)
+                    return (1 - bucket[0]) / limit[0]
+                buckets.append(bucket)
+            # 两个桶都有令牌时才一起扣除，被拒绝的事件不消耗另一个桶
+            for bucket in buckets:
+                bucket[0] -= 1
+            self._counters['allowed'] += 1
+        return 0
+
+    def _bucket(self, key, limit, now):
+        rate, burst = limit
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            bucket = self._buckets[key] = [burst, now]
+            if len(self._buckets) > self.max_keys:
+                self._buckets.popitem(last=False)
+                self._counters['evictions'] += 1
+        else:
+            bucket[0] = min(burst, bucket[0] + (now - bucket[1]) * rate)
+            bucket[1] = now
+            self._buckets.move_to_end(key)
+        return bucket
+
+    def forget(self, sid):
+        """连接断开时丢弃它的令牌桶；用户的桶保留，重连不能绕过限流。"""
+        with self._lock:
+            for event in self.limits:
+                self._buckets.pop(('socket', sid, event), None)
+
+    # ---- 慢消费者 ----
+
+    def disconnect_slow_consumers(self):
+        """断开待发送数据包超过上限的连接，返回断开的连接数。"""
+        server = self.socketio.server
+        slow = []
+        for connection in _engineio_connections(server):
+            depth = connection.queued
+            if depth > self._counters['max_outbound_queue']:
+                self._counters['max_outbound_queue'] = depth
+            if depth > self.queue_limit and not connection.closed:
+                slow.append((connection, depth))
+        for connection, depth in slow:
+            log.warning('slow socket consumer disconnected',
+                        extra={'sid': connection.eio_sid, 'queued_packets': depth})
+            # 丢弃积压的数据包，客户端重连后由聊天补发机制补齐错过的消息
+            connection.discard_queue()
+            for namespace in list(server.manager.get_namespaces()):
+                sid = server.manager.sid_from_eio_sid(connection.eio_sid, namespace)
+                if sid is not None:
+                    server.disconnect(sid, namespace=namespace)
+            # Socket.IO 的 disconnect 只结束命名空间会话，底层连接要等客户端读到断开包后关闭。
+            # 慢消费者读不到，直接关掉 TCP 连接，Engine.IO 随后自行清理
+            connection.shutdown()
+            metrics.slow_consumer_disconnects.inc()
+        self._counters['slow_consumers_disconnected'] += len(slow)
+        return len(slow)
+
+    def _watch_outbound(self):
+        while True:
+            self.socketio.sleep(self.check_interval)
+            if getattr(self.socketio, 'server', None) is None:
+                continue
+            try:
+                self.disconnect_slow_consumers()
+            except Exception:
+                log.exception('outbound queue check failed')
+
+
+# python-engineio 没有公开每个连接待发送的数据包数，慢消费者检查只能读它的内部属性，
+# 这些访问都集中在 _EngineIOConnection 中，并且只在验证过的主版本上启用
+ENGINEIO_SUPPORTED_MAJOR = 4
+
+
+@lru_cache(maxsize=None)
+def _engineio_supported():
+    try:
+        version = importlib.metadata.version('python-engineio')
+    except importlib.metadata.PackageNotFoundError:
+        version = None
+    supported = version is not None and version.split('.')[0] == str(ENGINEIO_SUPPORTED_MAJOR)
+    if not supported:
+        log.warning('slow consumer check disabled for unsupported python-engineio', extra={'version': version})
+    return supported
+
+
+def _engineio_connections(server):
+    """本进程的全部 Engine.IO 连接；python-engineio 的版本未经验证时返回空列表，不做检查。"""
+    if not _engineio_supported():
+        return []
+    return [_EngineIOConnection(eio_sid, socket, server.environ.get(eio_sid))
+            for eio_sid, socket in list(server.eio.sockets.items())]
+
+
+class _EngineIOConnection:
+    """python-engineio 内部的一个连接：待发送队列、关闭状态和 WSGI environ。"""
+
+    def __init__(self, eio_sid, socket, environ):
+        self.eio_sid = eio_sid
+        self._socket = socket
+        self._environ = environ or {}
+
+    @property
+    def queued(self):
+        return self._socket.queue.qsize()
+
+    @property
+    def closed(self):
+        return self._socket.closed
+
+    def discard_queue(self):
+        while not self._socket.queue.empty():
+            self._socket.queue.get_nowait()
+
+    def shutdown(self):
+        # 写任务可能正阻塞在向这个客户端发送数据上，直接关掉 TCP 连接让它和读任务一起退出。
+        # 只有 eventlet 的 WSGI 服务器能拿到底层 socket，其他服务器只能等发送超时
+        get_socket = getattr(self._environ.get('eventlet.input'), 'get_socket', None)
+        sock = get_socket() if get_socket else None
+        if sock is None:
+            return
+        try:
+            sock.shutdown(socket_module.SHUT_RDWR)
+        except OSError:
+            pass
+
+
+def rate_limited(event):
+    """按 SOCKET_RATE_LIMITS[event] 限流的 Socket.IO 事件处理函数，超限时返回错误 ack 而不执行。"""
+    def decorator(f):
+        @wraps(f)
+        def wrapper(*args, **kwargs):
+            user_id = current_user.id if current_user.is_authenticated else None
+            retry_after = socket_limiter.acquire(event, request.sid, user_id)
+            if retry_after:
+                return {'status': 'error', 'error': 'rate_limited', 'retry_after': round(retry_after, 3)}
+            return f(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+socket_limiter = SocketLimiter()
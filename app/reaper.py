@@ -0,0 +1,89 @@
+from datetime import datetime
+from itertools import takewhile
+
+import sqlalchemy as sa
+
+from app import db, socketio
+from app.log import get_logger
+from app.page_cache import page_cache
+from app.models import (Activity, ActivityArchive, Conversation, Message, MessageArchive, Participation, Recommendation,
+                        SearchTerm)
+from app.rooms import activity_broadcast_room
+
+log = get_logger('reaper')
+
+_ACTIVITY_COLUMNS = ['id', 'title', 'description', 'creator_id', 'created_at', 'event_time', 'end_time',
+                     'location', 'max_participants', 'latitude', 'longitude']
+_MESSAGE_COLUMNS = ['id', 'sender_id', 'receiver_id', 'activity_id', 'conversation_id', 'content', 'timestamp', 'seq']
+
+
+def _archive(activity_ids, archived_at):
+    archived = sa.literal(archived_at, sa.DateTime).label('archived_at')
+    db.session.execute(sa.insert(ActivityArchive).from_select(
+        _ACTIVITY_COLUMNS + ['archived_at'],
+        sa.select(*[getattr(Activity, column) for column in _ACTIVITY_COLUMNS], archived).where(
+            Activity.id.in_(activity_ids))
+    ))
+    _archive_messages(Message.activity_id.in_(activity_ids), archived_at)
+
+
+def _archive_messages(condition, archived_at):
+    archived = sa.literal(archived_at, sa.DateTime).label('archived_at')
+    db.session.execute(sa.insert(MessageArchive).from_select(
+        _MESSAGE_COLUMNS + ['archived_at'],
+        sa.select(*[getattr(Message, column) for column in _MESSAGE_COLUMNS], archived).where(condition)
+    ))
+
+
+def reap_expired_activities(chunk_size=500, archive=False, now=None):
+    """分批删除（或归档后删除）已结束的活动，返回处理的活动数。
+
+    每批通过 end_time 索引取出最多 chunk_size 个过期活动 id，用集合语句删除
+    依赖行和活动本身并单独提交，锁持有时间与过期总量无关。
+    """
+    now = now or datetime.utcnow()
+    total = 0
+    while True:
+        activity_ids = [row.id for row in db.session.query(Activity.id).filter(
+            Activity.end_time < now
+        ).order_by(Activity.end_time).limit(chunk_size)]
+        if not activity_ids:
+            break
+        if archive:
+            _archive(activity_ids, now)
+        for model in (Message, Participation, Conversation, SearchTerm, Recommendation):
+            db.session.execute(sa.delete(model).where(model.activity_id.in_(activity_ids)))
+        db.session.execute(sa.delete(Activity).where(Activity.id.in_(activity_ids)))
+        db.session.commit()
+        total += len(activity_ids)
+        page_cache.bump_activity(*activity_ids)
+        page_cache.bump_feed()
+        log.info('expired activities reaped', extra={'activities': len(activity_ids), 'archive': archive})
+        socketio.emit('delete_activities', {'ids': activity_ids}, to=activity_broadcast_room())
+        # 批次之间让出，避免长时间占用事件循环
+        socketio.sleep(0)
+    return total
+
+
+def archive_old_messages(before, chunk_size=1000, now=None):
+    """把 before 之前发送的聊天消息分批移到 message_archive，返回移动的条数。
+
+    消息 id 随发送时间递增，每批按主键取最早的 chunk_size 条，遇到不早于 before
+    的消息就停止，不需要单独的时间索引。会话汇总和聊天记录分页不受影响。
+    """
+    now = now or datetime.utcnow()
+    total = 0
+    while True:
+        rows = db.session.query(Message.id, Message.timestamp).order_by(Message.id).limit(chunk_size).all()
+        message_ids = [row.id for row in takewhile(lambda row: row.timestamp is None or row.timestamp < before, rows)]
+        if not message_ids:
+            break
+        _archive_messages(Message.id.in_(message_ids), now)
+        db.session.execute(sa.delete(Message).where(Message.id.in_(message_ids)))
+        db.session.commit()
+        total += len(message_ids)
+        log.info('old messages archived', extra={'messages': len(message_ids)})
+        if len(message_ids) < len(rows):
+            break
+        socketio.sleep(0)
+    return total
@@ -0,0 +1,289 @@
+import sys
+import threading
+import time
+from array import array
+from datetime import datetime
+
+import sqlalchemy as sa
+from sqlalchemy.orm import joinedload
+
+from app import db
+from app.jobs import offload
+from app.log import get_logger
+from app.models import Activity, Message, Participation, Recommendation, RecommendationBuild
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+log = get_logger('recommendations')
+
+# 用户与活动的交互权重：报名和创建是强信号，在活动里发过消息是弱信号
+PARTICIPATION_WEIGHT = 1.0
+CREATOR_WEIGHT = 1.0
+MESSAGE_WEIGHT = 0.5
+
+
+def _numeric():
+    # NumPy/SciPy 只在离线计算时需要，Web 请求不加载
+    import numpy as np
+    import scipy.sparse as sp
+    return np, sp
+
+
+def _interactions(user_ids=None):
+    """读取 (用户, 活动, 权重) 三元组；user_ids 为 None 时读取全部用户。"""
+    sources = (
+        (sa.select(Participation.user_id, Participation.activity_id), PARTICIPATION_WEIGHT),
+        (sa.select(Activity.creator_id, Activity.id), CREATOR_WEIGHT),
+        (sa.select(Message.sender_id, Message.activity_id).distinct(), MESSAGE_WEIGHT),
+    )
+    users, activities, weights = array('q'), array('q'), array('d')
+    for query, weight in sources:
+        if user_ids is not None:
+            query = query.where(query.selected_columns[0].in_(user_ids))
+        for partition in db.session.execute(query, execution_options={'yield_per': 10000}).partitions():
+            for user_id, activity_id in partition:
+                users.append(user_id)
+                activities.append(activity_id)
+                weights.append(weight)
+    return users, activities, weights
+
+
+def _peak_rss_bytes():
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux 上单位是 KiB，macOS 上是字节
+    return peak if sys.platform == 'darwin' else peak * 1024
+
+
+def _matrix_bytes(matrix):
+    return int(matrix.data.nbytes + matrix.indices.nbytes + matrix.indptr.nbytes)
+
+
+def _watermarks():
+    return {
+        'participation_watermark': db.session.scalar(sa.select(sa.func.max(Participation.id))) or 0,
+        'message_watermark': db.session.scalar(sa.select(sa.func.max(Message.id))) or 0,
+        'activity_watermark': db.session.scalar(sa.select(sa.func.max(Activity.id))) or 0,
+    }
+
+
+def _similarity(matrix, neighbors):
+    """列归一化后的共现矩阵，每行只保留最相似的 neighbors 个邻居，限制相似度矩阵和打分的规模。"""
+    np, sp = _numeric()
+    norms = np.sqrt(np.asarray(matrix.multiply(matrix).sum(axis=0)).ravel())
+    inverse = np.divide(1.0, norms, out=np.zeros_like(norms), where=norms > 0)
+    normalized = matrix @ sp.diags(inverse)
+    similarity = (normalized.T @ normalized).tocsr()
+    similarity.setdiag(0)
+    similarity.eliminate_zeros()
+    data, indices, indptr = [], [], [0]
+    for row in range(similarity.shape[0]):
+        start, end = similarity.indptr[row], similarity.indptr[row + 1]
+        values, columns = similarity.data[start:end], similarity.indices[start:end]
+        if len(values) > neighbors:
+            keep = np.argpartition(values, -neighbors)[-neighbors:]
+            values, columns = values[keep], columns[keep]
+        data.append(values)
+        indices.append(columns)
+        indptr.append(indptr[-1] + len(values))
+    return sp.csr_matrix((np.concatenate(data) if data else np.zeros(0),
+                          np.concatenate(indices) if indices else np.zeros(0, np.int32), indptr),
+                         shape=similarity.shape)
+
+
+def _rank(model, user_ids, matrix, candidates, top_k, now, seen=None):
+    """为一批用户打分并取前 top_k 个，返回待写入 recommendation 表的行。"""
+    np, _ = _numeric()
+    scores = (matrix @ model.similarity @ candidates).tocsr()
+    rows = []
+    for offset, user_id in enumerate(user_ids.tolist()):
+        begin, end = scores.indptr[offset], scores.indptr[offset + 1]
+        values, columns = scores.data[begin:end], scores.indices[begin:end]
+        # 去掉已经交互过的活动
+        interacted = matrix.indices[matrix.indptr[offset]:matrix.indptr[offset + 1]]
+        keep = (values > 0) & ~np.isin(columns, interacted)
+        values, columns = values[keep], columns[keep]
+        activity_ids = model.activity_ids[columns]
+        if seen is not None and user_id in seen:
+            keep = ~np.isin(activity_ids, list(seen[user_id]))
+            values, activity_ids = values[keep], activity_ids[keep]
+        if len(values) > top_k:
+            top = np.argpartition(values, -top_k)[-top_k:]
+            values, activity_ids = values[top], activity_ids[top]
+        order = np.lexsort((activity_ids, -values))
+        rows.extend({'user_id': user_id, 'rank': rank, 'activity_id': int(activity_ids[i]),
+                     'score': float(values[i]), 'generated_at': now}
+                    for rank, i in enumerate(order))
+    return rows
+
+
+class _Model:
+    """一次全量计算的结果：活动 id 到列号的映射和剪枝后的活动相似度矩阵。"""
+
+    def __init__(self, activity_ids, similarity):
+        self.activity_ids = activity_ids
+        self.similarity = similarity
+
+    def columns(self, activity_ids):
+        np, _ = _numeric()
+        ids = np.asarray(activity_ids, dtype=np.int64)
+        positions = np.searchsorted(self.activity_ids, ids)
+        positions[positions >= len(self.activity_ids)] = 0
+        known = self.activity_ids[positions] == ids if len(self.activity_ids) else np.zeros(len(ids), bool)
+        return positions, known
+
+
+class Recommender:
+    """离线计算“为你推荐”：用报名、创建和消息构造稀疏的用户×活动矩阵，
+
+    以列归一化后的共现矩阵（余弦相似度）作为活动相似度，每个活动只保留最相似的
+    RECOMMENDATIONS_NEIGHBORS 个邻居。用户得分为其交互向量乘以相似度矩阵，去掉已交互
+    和已开始的活动后取前 RECOMMENDATIONS_TOP_K 个写入 recommendation 表。数据库读写
+    留在事件循环中，相似度和打分这两步纯计算通过 offload() 放到原生线程池。
+
+    全量计算之后，update() 只为上次计算以来有新报名、新消息或新建活动的用户重新打分，
+    复用内存中的相似度矩阵；新活动要等下一次全量计算才会被推荐。
+    """
+
+    def __init__(self):
+        self.app = None
+        self.enabled = False
+        self._model = None
+        self._lock = threading.Lock()
+        self._last = {}
+
+    def init_app(self, app):
+        self.app = app
+        self.enabled = app.config['RECOMMENDATIONS_ENABLED']
+
+    def build(self):
+        """全量重建，返回本次计算的统计。"""
+        with self._lock:
+            return self._measure('full', self._build)
+
+    def update(self):
+        """增量更新；进程内还没有相似度矩阵时退化为全量重建。"""
+        with self._lock:
+            if self._model is None:
+                return self._measure('full', self._build)
+            return self._measure('incremental', self._update)
+
+    def stats(self):
+        stats = dict(self._last)
+        stats.pop('kind', None)
+        stats['model_activities'] = len(self._model.activity_ids) if self._model is not None else 0
+        return stats
+
+    def _measure(self, kind, compute):
+        # matrix_bytes 是交互矩阵和相似度矩阵的大小；tracemalloc 会让计算慢数倍，
+        # 这里只记录进程的峰值 RSS
+        started_at = datetime.utcnow()
+        started = time.perf_counter()
+        result = compute(started_at)
+        result.update(kind=kind, started_at=started_at, seconds=round(time.perf_counter() - started, 3),
+                      peak_rss_bytes=_peak_rss_bytes())
+        db.session.add(RecommendationBuild(**result))
+        db.session.commit()
+        self._last = {key: value for key, value in result.items() if key != 'started_at'}
+        log.info('recommendations built', extra=self._last)
+        return result
+
+    def _build(self, now):
+        np, sp = _numeric()
+        watermarks = _watermarks()
+        users, activities, weights = _interactions()
+        users = np.frombuffer(users, dtype=np.int64)
+        activities = np.frombuffer(activities, dtype=np.int64)
+        user_ids, rows = np.unique(users, return_inverse=True)
+        activity_ids, cols = np.unique(activities, return_inverse=True)
+        # 重复的 (用户, 活动) 权重相加
+        matrix = sp.csr_matrix((np.frombuffer(weights, dtype=np.float64), (rows, cols)),
+                               shape=(len(user_ids), len(activity_ids)))
+        model = _Model(activity_ids, offload(_similarity, matrix, self.app.config['RECOMMENDATIONS_NEIGHBORS']))
+        written = self._score(model, user_ids, matrix, now)
+        # 这次没有算出结果的用户（交互的活动都已开始等）清掉旧推荐
+        db.session.execute(sa.delete(Recommendation).where(Recommendation.generated_at < now))
+        db.session.commit()
+        self._model = model
+        return dict(watermarks, users=len(user_ids), activities=len(activity_ids), interactions=matrix.nnz,
+                    recommendations=written, matrix_bytes=_matrix_bytes(matrix) + _matrix_bytes(model.similarity))
+
+    def _update(self, now):
+        np, sp = _numeric()
+        previous = db.session.scalars(sa.select(RecommendationBuild).order_by(
+            RecommendationBuild.id.desc()).limit(1)).first()
+        watermarks = _watermarks()
+        changed = set(db.session.scalars(sa.select(Participation.user_id).where(
+            Participation.id > previous.participation_watermark)))
+        changed.update(db.session.scalars(sa.select(Message.sender_id).where(
+            Message.id > previous.message_watermark)))
+        changed.update(db.session.scalars(sa.select(Activity.creator_id).where(
+            Activity.id > previous.activity_watermark)))
+        user_ids = np.array(sorted(changed), dtype=np.int64)
+        written = interactions = largest = 0
+        chunk_size = self.app.config['RECOMMENDATIONS_CHUNK_SIZE']
+        for start in range(0, len(user_ids), chunk_size):
+            chunk = user_ids[start:start + chunk_size]
+            users, activities, weights = _interactions(chunk.tolist())
+            users = np.frombuffer(users, dtype=np.int64)
+            positions, known = self._model.columns(np.frombuffer(activities, dtype=np.int64))
+            rows = np.searchsorted(chunk, users)
+            matrix = sp.csr_matrix((np.frombuffer(weights, dtype=np.float64)[known], (rows[known], positions[known])),
+                                   shape=(len(chunk), len(self._model.activity_ids)))
+            interactions += matrix.nnz
+            largest = max(largest, _matrix_bytes(matrix))
+            # 相似度矩阵里没有的活动（上次全量之后新建的）也要当作已交互排除
+            seen = {}
+            for user_id, activity_id in zip(users.tolist(), activities):
+                seen.setdefault(user_id, set()).add(activity_id)
+            written += self._score(self._model, chunk, matrix, now, seen)
+        return dict(watermarks, users=len(user_ids), activities=len(self._model.activity_ids),
+                    interactions=interactions, recommendations=written,
+                    matrix_bytes=largest + _matrix_bytes(self._model.similarity))
+
+    def _score(self, model, user_ids, matrix, now, seen=None):
+        """按用户分批打分并替换这些用户的推荐，返回写入的行数。"""
+        np, sp = _numeric()
+        top_k = self.app.config['RECOMMENDATIONS_TOP_K']
+        chunk_size = self.app.config['RECOMMENDATIONS_CHUNK_SIZE']
+        upcoming_ids = np.fromiter(db.session.scalars(sa.select(Activity.id).where(Activity.event_time >= now)),
+                                   dtype=np.int64)
+        positions, known = model.columns(upcoming_ids)
+        upcoming = np.zeros(len(model.activity_ids), dtype=np.float64)
+        upcoming[positions[known]] = 1.0
+        candidates = sp.diags(upcoming)
+        written = 0
+        for start in range(0, len(user_ids), chunk_size):
+            rows = offload(_rank, model, user_ids[start:start + chunk_size], matrix[start:start + chunk_size],
+                           candidates, top_k, now, seen)
+            db.session.execute(sa.delete(Recommendation).where(
+                Recommendation.user_id.in_(user_ids[start:start + chunk_size].tolist())))
+            if rows:
+                db.session.execute(sa.insert(Recommendation.__table__), rows)
+            db.session.commit()
+            written += len(rows)
+        return written
+
+
+def recommended_activities(user_id, limit, now=None):
+    """读取预先计算的推荐：一次按 (user_id, rank) 主键范围的查询。"""
+    now = now or datetime.utcnow()
+    return Activity.query.options(joinedload(Activity.creator)).join(
+        Recommendation, Recommendation.activity_id == Activity.id
+    ).filter(Recommendation.user_id == user_id, Activity.event_time >= now).order_by(
+        Recommendation.rank).limit(limit).all()
+
+
+def remove_activities(activity_ids):
+    db.session.execute(sa.delete(Recommendation).where(Recommendation.activity_id.in_(activity_ids)))
+
+
+def remove_user(user_id):
+    db.session.execute(sa.delete(Recommendation).where(Recommendation.user_id == user_id))
+
+
+recommender = Recommender()
@@ -0,0 +1,197 @@
+import heapq
+import threading
+from datetime import datetime, timedelta
+
+import sqlalchemy as sa
+
+from app import db, to_local_time
+from app.log import get_logger
+from app.models import Activity, Participation
+from app.rooms import user_room
+
+log = get_logger('reminders')
+
+
+class ReminderWheel:
+    """“活动即将开始”提醒：在活动开始前 REMINDER_OFFSETS_MINUTES 分钟推送给报名者的用户房间。
+
+    小顶堆里存 (提醒时间, 活动 id, 开始时间, 提前分钟数)，每次 tick 只弹出到期的条目，
+    开销与到期的提醒数成正比，与活动总数无关。堆按时间窗口懒加载：只保存开始时间早于
+    _loaded_until 的、有人报名的活动，窗口快用完时按 (event_time, id) 索引再取下一段。
+
+    活动的修改、删除和报名、退出通过 schedule()/cancel()/joined()/left() 同步到本进程的堆
+    （新建的活动还没有报名者，不需要提醒）；
+    修改过的活动不从堆中删除旧条目，而是以 _event_times 为准，弹出时跳过过期的条目。
+    提醒只由持有后台任务租约的进程发出，其他进程处理的修改在发送前按主键重新核对，
+    提前到窗口内的修改由每 REMINDER_RESYNC_SECONDS 秒一次的窗口重读补上。
+    """
+
+    def __init__(self):
+        self.app = None
+        self.socketio = None
+        self.offsets = ()
+        self._lock = threading.Lock()
+        self._heap = []
+        self._event_times = {}
+        self._loaded_until = None
+        self._fired_until = None
+        self._last_tick = None
+        self._last_resync = None
+        self._counters = {'sent': 0, 'skipped': 0, 'loaded': 0}
+
+    def init_app(self, app, socketio):
+        self.app = app
+        self.socketio = socketio
+        self.offsets = tuple(sorted({int(minutes) for minutes in app.config['REMINDER_OFFSETS_MINUTES']}, reverse=True))
+
+    @property
+    def enabled(self):
+        return bool(self.app and self.app.config['REMINDERS_ENABLED'] and self.offsets)
+
+    def stats(self):
+        with self._lock:
+            return dict(self._counters, activities=len(self._event_times), heap=len(self._heap))
+
+    # ---- 同步 ----
+
+    def schedule(self, activity_id, event_time):
+        """活动创建、修改开始时间或有人报名时调用；重复调用没有副作用。"""
+        with self._lock:
+            self._schedule(activity_id, event_time)
+
+    def cancel(self, activity_id):
+        """活动删除时调用，堆中的旧条目在弹出时跳过。"""
+        with self._lock:
+            self._event_times.pop(activity_id, None)
+
+    def joined(self, activity_id):
+        """有人报名后调用：第一个报名者出现时活动才需要提醒。只有已加载窗口的进程才查询开始时间。"""
+        if self._loaded_until is None or activity_id in self._event_times:
+            return
+        event_time = db.session.scalar(sa.select(Activity.event_time).where(Activity.id == activity_id))
+        if event_time is not None:
+            self.schedule(activity_id, event_time)
+
+    def left(self, activity_id):
+        """有人退出后调用：没有报名者时不再提醒。"""
+        if activity_id not in self._event_times:
+            return
+        if not db.session.scalar(sa.select(Activity.participant_count).where(Activity.id == activity_id)):
+            self.cancel(activity_id)
+
+    def _schedule(self, activity_id, event_time):
+        if self._loaded_until is None:
+            return
+        if event_time >= self._loaded_until:
+            # 超出已加载的窗口，窗口推进到那里时再从数据库读取
+            self._event_times.pop(activity_id, None)
+            return
+        if self._event_times.get(activity_id) == event_time:
+            return
+        entries = [(event_time - timedelta(minutes=minutes), activity_id, event_time, minutes)
+                   for minutes in self.offsets]
+        entries = [entry for entry in entries if entry[0] > self._fired_until]
+        if not entries:
+            self._event_times.pop(activity_id, None)
+            return
+        self._event_times[activity_id] = event_time
+        for entry in entries:
+            heapq.heappush(self._heap, entry)
+        if len(self._heap) > 4 * len(self._event_times) * len(self.offsets) + 1024:
+            self._compact()
+
+    def _compact(self):
+        self._heap = [entry for entry in self._heap if self._event_times.get(entry[1]) == entry[2]]
+        heapq.heapify(self._heap)
+
+    # ---- 加载 ----
+
+    def _reset(self, now):
+        with self._lock:
+            self._heap = []
+            self._event_times = {}
+            self._loaded_until = now
+            self._fired_until = now
+        self._last_resync = now
+
+    def _load(self, start, end):
+        """把开始时间在 [start, end) 内、有人报名的活动放进堆，走 ix_activity_event_time_id。"""
+        rows = db.session.execute(sa.select(Activity.id, Activity.event_time).where(
+            Activity.event_time >= start, Activity.event_time < end, Activity.participant_count > 0
+        ).order_by(Activity.event_time, Activity.id)).all()
+        with self._lock:
+            self._loaded_until = max(self._loaded_until, end)
+            for activity_id, event_time in rows:
+                self._schedule(activity_id, event_time)
+            self._counters['loaded'] += len(rows)
+
+    def _advance_window(self, now):
+        config = self.app.config
+        ahead = timedelta(minutes=self.offsets[0])
+        step = timedelta(minutes=config['REMINDER_LOAD_MINUTES'])
+        # 最早的提醒需要提前 offsets[0] 分钟发出；剩余窗口不到半段时再取下一段，避免每个 tick 都查询
+        if self._loaded_until - now < ahead + step / 2:
+            self._load(self._loaded_until, now + ahead + step)
+        resync = config['REMINDER_RESYNC_SECONDS']
+        if resync and now - self._last_resync >= timedelta(seconds=resync):
+            self._last_resync = now
+            self._load(now, self._loaded_until)
+
+    # ---- 发送 ----
+
+    def tick(self, now=None):
+        """发出所有到期的提醒，返回发出的条数。由后台任务每秒调用一次。"""
+        now = now or datetime.utcnow()
+        # 刚成为租约持有者或中断过较长时间：从现在开始重新加载，不补发错过的提醒
+        if self._last_tick is None or now - self._last_tick > timedelta(seconds=60):
+            self._reset(now)
+        self._last_tick = now
+        self._advance_window(now)
+        due = []
+        with self._lock:
+            while self._heap and self._heap[0][0] <= now:
+                _, activity_id, event_time, minutes = heapq.heappop(self._heap)
+                if self._event_times.get(activity_id) != event_time:
+                    continue
+                due.append((activity_id, event_time, minutes))
+                if minutes == self.offsets[-1]:
+                    del self._event_times[activity_id]
+            self._fired_until = now
+        return self._send(due) if due else 0
+
+    def _send(self, due):
+        """按主键核对到期活动的开始时间，再给报名者发提醒；查询量只与到期的活动数有关。"""
+        ids = {activity_id for activity_id, _, _ in due}
+        activities = {row.id: row for row in db.session.execute(
+            sa.select(Activity.id, Activity.title, Activity.event_time).where(Activity.id.in_(ids))).all()}
+        participants = {}
+        for user_id, activity_id in db.session.execute(
+                sa.select(Participation.user_id, Participation.activity_id).where(Participation.activity_id.in_(ids))):
+            participants.setdefault(activity_id, []).append(user_id)
+        sent = 0
+        for activity_id, event_time, minutes in due:
+            activity = activities.get(activity_id)
+            if activity is None or activity.event_time != event_time:
+                # 已被删除，或者开始时间在其他进程中被修改过
+                self._counters['skipped'] += 1
+                if activity is None:
+                    self.cancel(activity_id)
+                else:
+                    self.schedule(activity_id, activity.event_time)
+                continue
+            reminder = {
+                'id': activity_id,
+                'title': activity.title,
+                'event_time': to_local_time(event_time).strftime('%Y-%m-%d %H:%M'),
+                'minutes': minutes
+            }
+            for user_id in participants.get(activity_id, ()):
+                self.socketio.emit('activity_reminder', reminder, to=user_room(user_id))
+                sent += 1
+        self._counters['sent'] += sent
+        if sent:
+            log.info('activity reminders sent', extra={'activities': len(ids), 'reminders': sent})
+        return sent
+
+
+reminders = ReminderWheel()
@@ -0,0 +1,16 @@
+from flask import current_app
+
+# 正在浏览活动广场的连接
+SQUARE_ROOM = 'square'
+
+
+def user_room(user_id):
+    # 每个已登录连接在 connect 时加入自己的用户房间
+    return f"user:{user_id}"
+
+
+def activity_broadcast_room():
+    """活动新增/删除通知的目标房间，None 表示广播给所有连接。"""
+    if current_app.config['ACTIVITY_BROADCAST_SCOPE'] == 'all':
+        return None
+    return SQUARE_ROOM
@@ -1,15 +1,35 @@
-from flask import render_template, redirect, url_for, flash, request
-from app.models import User, Activity, Participation, Message
+from flask import render_template, redirect, url_for, flash, request, jsonify, abort, current_app
+from app.models import User, Activity, Participation
 from app.forms import LoginForm, RegistrationForm, ActivityForm, ProfileForm
+from app.pagination import keyset_page
+from app import search as activity_search
+from app import geo
+from app import recommendations
+from app.reminders import reminders
+from app.chat_writer import message_writer
+from app.chat_stream import chat_stream
+from app.user_cache import user_cache
+from app.page_cache import page_cache
+from app.passwords import password_hasher, PasswordHasherBusy
+from app.db_routing import read_only, use_primary
+from app.rooms import SQUARE_ROOM, user_room, activity_broadcast_room
+from app.instrumentation import instrument_event
+from app.ratelimit import rate_limited, socket_limiter
+from app.metrics import metrics
+from app.log import get_logger
+from app.conversations import (conversation_key, parse_conversation_key, find_conversation, can_message, mark_read,
+                               message_page, recent_conversations, unread_total, remove_user_conversations)
+from app.participation import (join_activity, leave_activity, release_user_participations,
+                               ALREADY_JOINED, FULL, NOT_FOUND)
 from flask_login import current_user, login_user, logout_user, login_required
-from werkzeug.security import generate_password_hash, check_password_hash
-from flask_socketio import emit
 from flask_socketio import join_room
-from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import joinedload
 import sqlalchemy as sa
 import pytz
 from datetime import datetime
 
+log = get_logger('routes')
+
 def to_local_time(utc_time, timezone='Asia/Shanghai'):
     local_tz = pytz.timezone(timezone)
     if utc_time.tzinfo is None:
@@ -17,6 +37,27 @@ def to_local_time(utc_time, timezone='Asia/Shanghai'):
     local_time = utc_time.astimezone(local_tz)
     return local_time
 
+def activity_to_dict(activity):
+    return {
+        'id': activity.id,
+        'title': activity.title,
+        'creator': activity.creator.username,
+        'event_time': to_local_time(activity.event_time).strftime('%Y-%m-%d %H:%M'),
+        'end_time': to_local_time(activity.end_time).strftime('%Y-%m-%d %H:%M') if activity.end_time else None
+    }
+
+def query_activities(sort, search, cursor=None):
+    if search:
+        # 搜索结果按相关度排序，不做游标分页
+        return activity_search.search_activities(search, current_app.config['SEARCH_MAX_RESULTS']), None
+    # 预加载创建者，避免模板中逐行查询 User
+    query = Activity.query.options(joinedload(Activity.creator))
+    if sort == 'event_time':
+        return keyset_page(query, Activity.event_time, Activity.id, cursor,
+                           current_app.config['ACTIVITIES_PER_PAGE'], descending=False)
+    return keyset_page(query, Activity.created_at, Activity.id, cursor,
+                       current_app.config['ACTIVITIES_PER_PAGE'], descending=True)
+
 def init_routes(app, db, socketio):
     @app.route('/login', methods=['GET', 'POST'])
     def login():
@@ -24,10 +65,20 @@ def init_routes(app, db, socketio):
             return redirect(url_for('index'))
         form = LoginForm()
         if form.validate_on_submit():
+            if not password_hasher.allow(request.remote_addr):
+                flash('尝试次数过多，请稍后再试。', 'error')
+                return render_template('login.html', title='Sign In', form=form), 429
             user = User.query.filter_by(username=form.username.data).first()
-            if user and check_password_hash(user.password_hash, form.password.data):
-                login_user(user, remember=form.remember_me.data)
-                return redirect(url_for('index'))
+            try:
+                if user and password_hasher.verify(user.password_hash, form.password.data):
+                    if password_hasher.upgrade(user, form.password.data):
+                        db.session.commit()
+                        user_cache.invalidate(user.id)
+                    login_user(user, remember=form.remember_me.data)
+                    return redirect(url_for('index'))
+            except PasswordHasherBusy:
+                flash('服务器繁忙，请稍后再试。', 'error')
+                return render_template('login.html', title='Sign In', form=form), 503
             flash('Invalid username or password')
         return render_template('login.html', title='Sign In', form=form)
 
@@ -37,6 +88,9 @@ def init_routes(app, db, socketio):
             return redirect(url_for('index'))
         form = RegistrationForm()
         if form.validate_on_submit():
+            if not password_hasher.allow(request.remote_addr):
+                flash('尝试次数过多，请稍后再试。', 'error')
+                return render_template('register.html', title='Register', form=form), 429
             existing_user = User.query.filter_by(email=form.email.data).first()
             if existing_user:
                 flash('该邮箱已被注册，请使用其他邮箱。', 'error')
@@ -45,10 +99,15 @@ def init_routes(app, db, socketio):
                 if existing_user:
                     flash('该用户名已被使用，请选择其他用户名。', 'error')
                 else:
+                    try:
+                        password_hash = password_hasher.hash(form.password.data)
+                    except PasswordHasherBusy:
+                        flash('服务器繁忙，请稍后再试。', 'error')
+                        return render_template('register.html', title='Register', form=form), 503
                     user = User(
                         username=form.username.data,
                         email=form.email.data,
-                        password_hash=generate_password_hash(form.password.data)
+                        password_hash=password_hash
                     )
                     db.session.add(user)
                     db.session.commit()
@@ -64,51 +123,71 @@ def init_routes(app, db, socketio):
 
     @app.route('/')
     @app.route('/index', methods=['GET', 'POST'])
+    @page_cache.cached_response(lambda: page_cache.feed_version())
+    @read_only
     def index():
         sort = request.args.get('sort', 'created_at')
         search = request.args.get('search', '')
-        query = Activity.query
-        if search:
-            query = query.filter(Activity.title.contains(search) | Activity.description.contains(search))
-        if sort == 'event_time':
-            activities = query.order_by(Activity.event_time.asc()).all()
-        else:
-            activities = query.order_by(Activity.created_at.desc()).all()
-        
+        activities, next_cursor = query_activities(sort, search)
+
         recent_chats = []
+        unread_count = 0
+        recommended = []
         if current_user.is_authenticated:
-            subquery = db.session.query(
-                Message.conversation_id,
-                sa.func.max(Message.timestamp).label('max_timestamp')
-            ).filter(
-                Message.id.isnot(None) &
-                ((Message.sender_id == current_user.id) | (Message.receiver_id == current_user.id))
-            ).group_by(Message.conversation_id).subquery()
-
-            recent_chats_query = db.session.query(Message, Activity).join(
-                subquery,
-                (Message.conversation_id == subquery.c.conversation_id) &
-                (Message.timestamp == subquery.c.max_timestamp)
-            ).join(Activity, Message.activity_id == Activity.id).order_by(
-                subquery.c.max_timestamp.desc()
-            ).limit(5)
-
-            recent_chats = []
-            for message, activity in recent_chats_query.all():
-                other_user_id = message.receiver_id if message.sender_id == current_user.id else message.sender_id
-                other_user = User.query.get(other_user_id)
-                local_timestamp = to_local_time(message.timestamp)
+            if recommendations.recommender.enabled:
+                recommended = recommendations.recommended_activities(
+                    current_user.id, current_app.config['RECOMMENDATIONS_TOP_K'])
+            for conversation in recent_conversations(current_user.id):
                 recent_chats.append({
-                    'conversation_id': message.conversation_id,
-                    'activity': activity,
-                    'other_user': other_user,
-                    'last_message': message,
-                    'local_timestamp': local_timestamp
+                    'conversation_id': conversation.key,
+                    'activity': conversation.activity,
+                    'other_user': conversation.other_user(current_user.id),
+                    'last_message': conversation.last_message_id,
+                    'local_timestamp': to_local_time(conversation.last_activity_at),
+                    'unread': conversation.unread_for(current_user.id)
                 })
-            print("Recent chats:", [(chat['activity'].title, chat['other_user'].username, chat['local_timestamp'].strftime('%Y-%m-%d %H:%M')) for chat in recent_chats])
+            unread_count = unread_total(current_user.id)
+            log.debug('recent chats loaded', extra={'user_id': current_user.id, 'chats': len(recent_chats)})
 
         return render_template('index.html', title='Activity Square', activities=activities,
-                            search=search, sort=sort, recent_chats=recent_chats)
+                            next_cursor=next_cursor, search=search, sort=sort, recent_chats=recent_chats,
+                            unread_count=unread_count, recommended=recommended)
+
+    @app.route('/api/activities')
+    @read_only
+    def api_activities():
+        sort = request.args.get('sort', 'created_at')
+        search = request.args.get('search', '')
+        try:
+            activities, next_cursor = query_activities(sort, search, request.args.get('cursor'))
+        except ValueError:
+            abort(400)
+        return jsonify({
+            'activities': [activity_to_dict(activity) for activity in activities],
+            'next_cursor': next_cursor
+        })
+
+    @app.route('/api/activities/nearby')
+    @read_only
+    def api_activities_nearby():
+        try:
+            latitude = float(request.args['lat'])
+            longitude = float(request.args['lng'])
+            radius_km = float(request.args.get('radius_km', current_app.config['NEARBY_DEFAULT_RADIUS_KM']))
+            limit = int(request.args.get('limit', current_app.config['ACTIVITIES_PER_PAGE']))
+        except (KeyError, ValueError):
+            abort(400)
+        if not (-90 <= latitude <= 90 and -180 <= longitude <= 180) or not 0 < radius_km or limit < 1:
+            abort(400)
+        radius_km = min(radius_km, current_app.config['NEARBY_MAX_RADIUS_KM'])
+        results = geo.nearby_activities(latitude, longitude, radius_km,
+                                        min(limit, current_app.config['SEARCH_MAX_RESULTS']))
+        return jsonify({
+            'activities': [dict(activity_to_dict(activity), latitude=activity.latitude,
+                                longitude=activity.longitude, distance_km=round(km, 2))
+                           for activity, km in results],
+            'radius_km': radius_km
+        })
 
     @app.route('/activity/create', methods=['GET', 'POST'])
     @login_required
@@ -125,47 +204,52 @@ def init_routes(app, db, socketio):
                 event_time=form.event_time.data,
                 end_time=form.end_time.data,
                 location=form.location.data,
-                max_participants=form.max_participants.data
+                max_participants=form.max_participants.data,
+                latitude=form.latitude.data,
+                longitude=form.longitude.data
             )
+            geo.index_activity(activity)
             db.session.add(activity)
+            activity_search.index_activity(activity)
             db.session.commit()
-            socketio.emit('new_activity', {
-                'id': activity.id,
-                'title': activity.title,
-                'creator': activity.creator.username,
-                'event_time': to_local_time(activity.event_time).strftime('%Y-%m-%d %H:%M'),
-                'end_time': to_local_time(activity.end_time).strftime('%Y-%m-%d %H:%M') if activity.end_time else None
-            })
+            page_cache.bump_feed()
+            socketio.emit('new_activity', activity_to_dict(activity), to=activity_broadcast_room())
             flash('活动创建成功！', 'success')
             return redirect(url_for('index'))
         return render_template('activity_create.html', title='Create Activity', form=form)
 
     @app.route('/activity/<int:activity_id>')
+    @page_cache.cached_response(lambda activity_id: page_cache.activity_version(activity_id))
+    @read_only
     def activity_detail(activity_id):
         activity = Activity.query.get_or_404(activity_id)
-        participations = Participation.query.filter_by(activity_id=activity_id).all()
+        participations = Participation.query.options(joinedload(Participation.user)).filter_by(activity_id=activity_id).all()
         return render_template('activity_detail.html', title=activity.title, activity=activity, participations=participations)
 
     @app.route('/activity/<int:activity_id>/join')
     @login_required
     def activity_join(activity_id):
-        activity = Activity.query.get_or_404(activity_id)
-        if Participation.query.filter_by(user_id=current_user.id, activity_id=activity_id).first():
+        result = join_activity(current_user.id, activity_id)
+        if result == NOT_FOUND:
+            abort(404)
+        if result == ALREADY_JOINED:
             flash('You have already joined this activity.')
-        elif activity.participants.count() >= activity.max_participants:
+        elif result == FULL:
             flash('This activity is full.')
         else:
-            participation = Participation(user_id=current_user.id, activity_id=activity_id)
-            db.session.add(participation)
-            db.session.commit()
+            page_cache.bump_activity(activity_id)
+            reminders.joined(activity_id)
             flash('You have joined the activity!')
         return redirect(url_for('activity_detail', activity_id=activity_id))
 
     @app.route('/activity/manage')
     @login_required
+    @read_only
     def activity_manage():
         created_activities = Activity.query.filter_by(creator_id=current_user.id).all()
-        joined_activities = [p.activity for p in Participation.query.filter_by(user_id=current_user.id).all()]
+        joined_activities = Activity.query.join(Participation, Participation.activity_id == Activity.id).filter(
+            Participation.user_id == current_user.id
+        ).all()
         return render_template('activity_manage.html', title='Manage Activities',
                               created_activities=created_activities, joined_activities=joined_activities)
 
@@ -184,7 +268,15 @@ def init_routes(app, db, socketio):
             activity.end_time = form.end_time.data
             activity.location = form.location.data
             activity.max_participants = form.max_participants.data
+            activity.latitude = form.latitude.data
+            activity.longitude = form.longitude.data
+            geo.index_activity(activity)
+            activity_search.index_activity(activity)
             db.session.commit()
+            page_cache.bump_activity(activity_id)
+            page_cache.bump_feed()
+            if activity.participant_count:
+                reminders.schedule(activity_id, activity.event_time)
             flash('活动已更新！', 'success')
             return redirect(url_for('activity_manage'))
         elif request.method == 'GET':
@@ -194,6 +286,8 @@ def init_routes(app, db, socketio):
             form.end_time.data = activity.end_time
             form.location.data = activity.location
             form.max_participants.data = activity.max_participants
+            form.latitude.data = activity.latitude
+            form.longitude.data = activity.longitude
         return render_template('activity_edit.html', form=form, activity=activity)
 
     @app.route('/activity/delete/<int:activity_id>', methods=['POST'])
@@ -203,34 +297,37 @@ def init_routes(app, db, socketio):
         if activity.creator_id != current_user.id:
             flash('您无权删除此活动。', 'error')
             return redirect(url_for('activity_manage'))
+        activity_search.remove_activity(activity_id)
+        recommendations.remove_activities([activity_id])
         db.session.delete(activity)
         db.session.commit()
-        socketio.emit('delete_activity', {'id': activity_id})
+        page_cache.bump_activity(activity_id)
+        page_cache.bump_feed()
+        reminders.cancel(activity_id)
+        socketio.emit('delete_activity', {'id': activity_id}, to=activity_broadcast_room())
         flash('活动已删除！', 'success')
         return redirect(url_for('activity_manage'))
 
     @app.route('/activity/leave/<int:activity_id>', methods=['POST'])
     @login_required
     def activity_leave(activity_id):
-        activity = Activity.query.get_or_404(activity_id)
-        participation = Participation.query.filter_by(user_id=current_user.id, activity_id=activity_id).first()
-        if not participation:
+        if not leave_activity(current_user.id, activity_id):
+            if db.session.get(Activity, activity_id) is None:
+                abort(404)
             flash('您未参与此活动。', 'error')
             return redirect(url_for('activity_manage'))
-        db.session.delete(participation)
-        db.session.commit()
+        page_cache.bump_activity(activity_id)
+        reminders.left(activity_id)
         flash('您已退出该活动。', 'success')
         return redirect(url_for('activity_manage'))
 
     @app.route('/chat/<conversation_id>')
     @login_required
+    @read_only
     def chat(conversation_id):
-        # 查询消息记录
-        messages = Message.query.filter_by(conversation_id=conversation_id).order_by(Message.timestamp.asc()).all()
-        
         # 从 conversation_id 解析 activity_id 和 user_ids
         try:
-            activity_id, user1_id, user2_id = map(int, conversation_id.split('-'))
+            activity_id, user1_id, user2_id = parse_conversation_key(conversation_id)
         except ValueError:
             flash('无效的会话 ID。', 'error')
             return redirect(url_for('index'))
@@ -253,51 +350,142 @@ def init_routes(app, db, socketio):
             flash('用户不存在。', 'error')
             return redirect(url_for('index'))
 
+        # 打开会话即清零当前用户的未读数（按主库上的未读数判断）
+        with use_primary():
+            conversation = find_conversation(activity_id, user1_id, user2_id)
+            if conversation and mark_read(conversation, current_user.id):
+                db.session.commit()
+
+        # 只渲染最新的一页消息，更早的记录由前端滚动时按需加载；还没有消息时会话尚未创建
+        messages, has_more = [], False
+        if conversation:
+            messages, has_more = message_page(conversation.id, limit=current_app.config['CHAT_PAGE_SIZE'])
+
         # 为消息添加本地时间（如果有消息）
         for message in messages:
             message.local_timestamp = to_local_time(message.timestamp)
 
         # 即使 messages 为空，也允许进入聊天页面
         return render_template('chat.html', title=f'Chat - {activity.title} - {other_user.username}', 
-                             activity=activity, messages=messages, conversation_id=conversation_id, other_user=other_user)
+                             activity=activity, messages=messages, has_more=has_more,
+                             conversation_id=conversation_id, other_user=other_user)
+
+    @app.route('/api/chat/<conversation_id>/messages')
+    @login_required
+    @read_only
+    def api_chat_messages(conversation_id):
+        try:
+            activity_id, user1_id, user2_id = parse_conversation_key(conversation_id)
+        except ValueError:
+            abort(404)
+        if current_user.id not in (user1_id, user2_id):
+            abort(403)
+        before_id = request.args.get('before', type=int)
+        conversation = find_conversation(activity_id, user1_id, user2_id)
+        messages, has_more = [], False
+        if conversation:
+            messages, has_more = message_page(conversation.id, before_id, current_app.config['CHAT_PAGE_SIZE'])
+        return jsonify({
+            'messages': [{
+                'id': message.id,
+                'sender': message.sender.username,
+                'sender_id': message.sender_id,
+                'content': message.content,
+                'timestamp': to_local_time(message.timestamp).strftime('%Y-%m-%d %H:%M')
+            } for message in messages],
+            'has_more': has_more
+        })
 
     @socketio.on('send_message')
+    @instrument_event('send_message')
+    @rate_limited('send_message')
     def handle_send_message(data):
+        if not current_user.is_authenticated:
+            return {'status': 'error', 'error': 'forbidden'}
         activity_id = data['activity_id']
         content = data['content']
-        receiver_id = data['receiver_id']
         activity = Activity.query.get(activity_id)
-        if activity:
-            user_ids = sorted([current_user.id, int(receiver_id)])
-            conversation_id = f"{activity_id}-{user_ids[0]}-{user_ids[1]}"
-            message = Message(
-                sender_id=current_user.id,
-                receiver_id=receiver_id,
-                activity_id=activity_id,
-                conversation_id=conversation_id,
-                content=content
-            )
-            db.session.add(message)
-            db.session.commit()
-            print(f"Message saved and broadcasting to room {conversation_id}: {content}")
-            emit('new_message', {'sender': current_user.username, 'content': content}, room=conversation_id)
-            receiver = User.query.get(receiver_id)
-            local_timestamp = to_local_time(message.timestamp)
-            socketio.emit('new_chat_message', {
-                'conversation_id': conversation_id,
-                'activity_id': activity_id,
-                'activity_title': activity.title,
-                'other_user': receiver.username,
-                'timestamp': local_timestamp.strftime('%Y-%m-%d %H:%M')
-            })
-        else:
-            print(f"Activity {activity_id} not found")
+        if not activity:
+            log.info('chat message for missing activity', extra={'activity_id': activity_id})
+            return {'status': 'error', 'error': 'activity_not_found'}
+        # 入队之前确认接收方存在且属于这个会话，写后队列里不能有写不进去的消息
+        try:
+            receiver_id = int(data['receiver_id'])
+        except (KeyError, TypeError, ValueError):
+            return {'status': 'error', 'error': 'invalid_receiver'}
+        receiver = user_cache.get(receiver_id)
+        if receiver is None or not can_message(activity, current_user.id, receiver_id):
+            log.info('chat message for invalid receiver',
+                     extra={'activity_id': activity_id, 'receiver_id': receiver_id})
+            return {'status': 'error', 'error': 'invalid_receiver'}
+        conversation_id = conversation_key(activity_id, current_user.id, receiver_id)
+        timestamp = datetime.now(pytz.UTC)
+        # 消息进入写后队列，由后台批量落库、分配序号后广播 new_message，这里直接确认
+        accepted = message_writer.submit({
+            'sender_id': current_user.id,
+            'receiver_id': receiver_id,
+            'activity_id': activity_id,
+            'content': content,
+            'timestamp': timestamp
+        })
+        if not accepted:
+            log.warning('chat queue full, message rejected', extra={'room': conversation_id})
+            return {'status': 'error', 'error': 'busy'}
+        log.debug('chat message queued', extra={'room': conversation_id, 'length': len(content)})
+        local_timestamp = to_local_time(timestamp)
+        # 会话列表通知只发给收发双方各自的用户房间
+        notification = {
+            'conversation_id': conversation_id,
+            'activity_id': activity_id,
+            'activity_title': activity.title,
+            'timestamp': local_timestamp.strftime('%Y-%m-%d %H:%M')
+        }
+        socketio.emit('new_chat_message', dict(notification, other_user=receiver.username),
+                      to=user_room(current_user.id))
+        socketio.emit('new_chat_message', dict(notification, other_user=current_user.username, unread=True),
+                      to=user_room(receiver.id))
+        return {'status': 'ok'}
+
+    @socketio.on('connect')
+    @instrument_event('connect')
+    def handle_connect(auth=None):
+        metrics.connected_sockets.inc()
+        if current_user.is_authenticated:
+            join_room(user_room(current_user.id))
+
+    @socketio.on('disconnect')
+    def handle_disconnect():
+        metrics.connected_sockets.dec()
+        socket_limiter.forget(request.sid)
 
     @socketio.on('join')
+    @instrument_event('join')
+    @rate_limited('join')
     def handle_join(data):
         room = str(data['room'])
+        if room != SQUARE_ROOM:
+            # 其余房间都是会话房间，只允许会话双方加入
+            try:
+                _, user1_id, user2_id = parse_conversation_key(room)
+            except ValueError:
+                return {'status': 'error', 'error': 'invalid_room'}
+            if not current_user.is_authenticated or current_user.id not in (user1_id, user2_id):
+                return {'status': 'error', 'error': 'forbidden'}
+        if room == SQUARE_ROOM:
+            join_room(room)
+            log.debug('room joined', extra={'room': room})
+            return {'status': 'ok'}
+        # 客户端带上最后收到的序号，只补发之后的消息；没有带时从头补发
+        try:
+            last_seq = int(data.get('last_seq') or 0)
+        except (TypeError, ValueError):
+            return {'status': 'error', 'error': 'invalid_last_seq'}
+        if last_seq < 0:
+            return {'status': 'error', 'error': 'invalid_last_seq'}
         join_room(room)
-        print(f"User joined room {room}")
+        log.debug('room joined', extra={'room': room})
+        messages, reset = chat_stream.replay(room, last_seq)
+        return {'status': 'ok', 'messages': messages, 'reset': reset}
 
     @app.route('/profile', methods=['GET', 'POST'])
     @login_required
@@ -307,6 +495,9 @@ def init_routes(app, db, socketio):
             current_user.username = form.username.data
             current_user.email = form.email.data
             db.session.commit()
+            user_cache.invalidate(current_user.id)
+            # 用户名会出现在活动列表和详情页中
+            page_cache.bump_all()
             flash('Profile updated!')
             return redirect(url_for('profile'))
         return render_template('profile.html', title='Profile', form=form)
@@ -316,7 +507,14 @@ def init_routes(app, db, socketio):
     def delete_account():
         user = current_user._get_current_object()
         logout_user()
+        activity_search.remove_activities(sa.select(Activity.id).where(Activity.creator_id == user.id))
+        recommendations.remove_activities(sa.select(Activity.id).where(Activity.creator_id == user.id))
+        recommendations.remove_user(user.id)
+        remove_user_conversations(user.id)
+        release_user_participations(user.id)
         db.session.delete(user)
         db.session.commit()
+        user_cache.invalidate(user.id)
+        page_cache.bump_all()
         flash('您的账号已成功注销。', 'success')
         return redirect(url_for('index'))
\ No newline at end of file
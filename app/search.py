@@ -0,0 +1,121 @@
+import re
+import unicodedata
+from collections import Counter
+
+import sqlalchemy as sa
+from sqlalchemy.orm import joinedload
+
+from app import db
+from app.models import Activity, SearchTerm
+
+# 各字段命中一次的权重，同一词在一个字段内最多计 3 次
+FIELD_WEIGHTS = (('title', 3), ('location', 2), ('description', 1))
+MAX_TERM_FREQUENCY = 3
+MAX_TERM_LENGTH = 64
+
+# 中日韩统一表意文字按二元组切分，其余按字母数字串切分
+_TOKEN_RE = re.compile(r'[\u3400-\u4dbf\u4e00-\u9fff\uf900-\ufaff]+|[0-9a-z]+')
+_CJK_RE = re.compile(r'[\u3400-\u4dbf\u4e00-\u9fff\uf900-\ufaff]')
+
+
+def _normalize(text):
+    return unicodedata.normalize('NFKC', text or '').lower()
+
+
+def tokenize(text):
+    tokens = []
+    for run in _TOKEN_RE.findall(_normalize(text)):
+        if _CJK_RE.match(run):
+            if len(run) == 1:
+                tokens.append(run)
+            else:
+                tokens.extend(run[i:i + 2] for i in range(len(run) - 1))
+        else:
+            tokens.append(run[:MAX_TERM_LENGTH])
+    return tokens
+
+
+def activity_terms(activity):
+    weights = Counter()
+    for field, field_weight in FIELD_WEIGHTS:
+        for term, frequency in Counter(tokenize(getattr(activity, field))).items():
+            weights[term] += field_weight * min(frequency, MAX_TERM_FREQUENCY)
+    return weights
+
+
+def index_activity(activity):
+    """在当前事务中重建单个活动的倒排索引，调用方负责 commit。"""
+    if activity.id is None:
+        db.session.flush()
+    remove_activity(activity.id)
+    rows = [{'term': term, 'activity_id': activity.id, 'weight': weight}
+            for term, weight in activity_terms(activity).items()]
+    if rows:
+        db.session.execute(sa.insert(SearchTerm), rows)
+
+
+def remove_activity(activity_id):
+    db.session.execute(sa.delete(SearchTerm).where(SearchTerm.activity_id == activity_id))
+
+
+def remove_activities(activity_ids):
+    db.session.execute(sa.delete(SearchTerm).where(SearchTerm.activity_id.in_(activity_ids)))
+
+
+def _term_conditions(query):
+    normalized = _normalize(query)
+    terms = list(dict.fromkeys(tokenize(normalized)))
+    if not terms:
+        return []
+    # 最后一个词还在输入中时按前缀匹配，便于边输入边搜索
+    prefix = terms.pop() if not normalized[-1:].isspace() else None
+    conditions = [SearchTerm.term == term for term in terms]
+    if prefix is not None and prefix not in terms:
+        conditions.append(sa.and_(SearchTerm.term >= prefix, SearchTerm.term < prefix + '\uffff'))
+    return conditions
+
+
+def search_activity_ids(query, limit=50):
+    """返回按相关度排序的活动 id，要求命中查询中的每个词。
+
+    只扫描查询词在 search_term 主键上的倒排链，耗时与活动表大小无关。
+    """
+    conditions = _term_conditions(query)
+    if not conditions:
+        return []
+    term_slot = sa.case(*[(condition, slot) for slot, condition in enumerate(conditions)])
+    score = sa.func.sum(SearchTerm.weight).label('score')
+    rows = db.session.query(SearchTerm.activity_id, score).filter(
+        sa.or_(*conditions)
+    ).group_by(SearchTerm.activity_id).having(
+        sa.func.count(sa.distinct(term_slot)) == len(conditions)
+    ).order_by(score.desc(), SearchTerm.activity_id.desc()).limit(limit).all()
+    return [row.activity_id for row in rows]
+
+
+def search_activities(query, limit=50):
+    ids = search_activity_ids(query, limit)
+    if not ids:
+        return []
+    activities = Activity.query.options(joinedload(Activity.creator)).filter(Activity.id.in_(ids)).all()
+    by_id = {activity.id: activity for activity in activities}
+    return [by_id[activity_id] for activity_id in ids if activity_id in by_id]
+
+
+def rebuild_index(batch_size=500):
+    db.session.execute(sa.delete(SearchTerm))
+    count = 0
+    last_id = 0
+    while True:
+        batch = Activity.query.filter(Activity.id > last_id).order_by(Activity.id).limit(batch_size).all()
+        if not batch:
+            break
+        rows = [{'term': term, 'activity_id': activity.id, 'weight': weight}
+                for activity in batch for term, weight in activity_terms(activity).items()]
+        if rows:
+            db.session.execute(sa.insert(SearchTerm), rows)
+        db.session.commit()
+        count += len(batch)
+        last_id = batch[-1].id
+    db.session.commit()
+    return count
@@ -0,0 +1,86 @@
+import threading
+import time
+from collections import OrderedDict
+
+from sqlalchemy.orm import make_transient_to_detached
+
+
+class UserCache:
+    """Flask-Login 的用户缓存：按 id 保存 User 的列值快照，LRU + TTL 淘汰。
+
+    命中时用快照构造一个 detached 对象并 merge(load=False) 进当前会话，
+    不产生 SELECT；得到的对象仍是持久化状态，可以照常修改、提交和访问关联。
+    修改或删除用户后必须调用 invalidate。多进程部署时其他进程最多在 TTL
+    内读到旧数据。
+    """
+
+    def __init__(self, max_size=10000, ttl=60):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._counters = {'hits': 0, 'misses': 0, 'evictions': 0, 'invalidations': 0}
+
+    def init_app(self, app):
+        self.max_size = app.config['USER_CACHE_SIZE']
+        self.ttl = app.config['USER_CACHE_TTL']
+        self.clear()
+
+    def get(self, user_id):
+        from app import db
+        from app.models import User
+
+        user_id = int(user_id)
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry is not None and entry[0] > now:
+                self._entries.move_to_end(user_id)
+                self._counters['hits'] += 1
+                snapshot = entry[1]
+            else:
+                if entry is not None:
+                    del self._entries[user_id]
+                self._counters['misses'] += 1
+                snapshot = None
+        if snapshot is None:
+            user = db.session.get(User, user_id)
+            if user is not None and self.max_size > 0:
+                self._store(user_id, self._snapshot(user), now)
+            return user
+        user = User(**snapshot)
+        make_transient_to_detached(user)
+        return db.session.merge(user, load=False)
+
+    def invalidate(self, user_id):
+        with self._lock:
+            if self._entries.pop(int(user_id), None) is not None:
+                self._counters['invalidations'] += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._counters)
+            stats['size'] = len(self._entries)
+        stats['capacity'] = self.max_size
+        lookups = stats['hits'] + stats['misses']
+        stats['hit_rate'] = stats['hits'] / lookups if lookups else 0.0
+        return stats
+
+    @staticmethod
+    def _snapshot(user):
+        return {attr.key: getattr(user, attr.key) for attr in user.__mapper__.column_attrs}
+
+    def _store(self, user_id, snapshot, now):
+        with self._lock:
+            self._entries[user_id] = (now + self.ttl, snapshot)
+            self._entries.move_to_end(user_id)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+                self._counters['evictions'] += 1
+
+
+user_cache = UserCache()
@@ -0,0 +1,74 @@
+"""对比聊天通知全量广播与按用户房间定向发送的单条消息开销。
+
+    python -m benchmarks.fanout --connections 10000 --messages 200
+
+不建立真实网络连接：用 python-socketio 的 Server 和房间管理器模拟大量已连接
+的客户端，把 Engine.IO 层的发送替换为计数，测得的是服务端每条消息的分发成本。
+"""
+import argparse
+import json
+import time
+
+import socketio
+
+
+def build_server(connections):
+    server = socketio.Server(async_mode='threading')
+    sent = {'packets': 0}
+
+    def send_packet(eio_sid, pkt):
+        sent['packets'] += 1
+
+    server.eio.send_packet = send_packet
+    for i in range(connections):
+        sid = server.manager.connect(f'eio-{i}', '/')
+        server.manager.enter_room(sid, '/', f'user:{i}')
+    return server, sent
+
+
+def run(connections, messages):
+    server, sent = build_server(connections)
+    payload = {
+        'conversation_id': '1-1-2',
+        'activity_id': 1,
+        'activity_title': 'benchmark',
+        'other_user': 'user2',
+        'timestamp': '2025-01-01 00:00'
+    }
+    results = {}
+
+    sent['packets'] = 0
+    started = time.perf_counter()
+    for _ in range(messages):
+        server.emit('new_chat_message', payload)
+    elapsed = time.perf_counter() - started
+    results['broadcast'] = {
+        'us_per_message': elapsed / messages * 1e6,
+        'packets_per_message': sent['packets'] / messages
+    }
+
+    sent['packets'] = 0
+    started = time.perf_counter()
+    for i in range(messages):
+        sender, receiver = i % connections, (i + 1) % connections
+        server.emit('new_chat_message', payload, to=f'user:{sender}')
+        server.emit('new_chat_message', payload, to=f'user:{receiver}')
+    elapsed = time.perf_counter() - started
+    results['per_user_rooms'] = {
+        'us_per_message': elapsed / messages * 1e6,
+        'packets_per_message': sent['packets'] / messages
+    }
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--connections', type=int, default=10000)
+    parser.add_argument('--messages', type=int, default=200)
+    args = parser.parse_args()
+    results = run(args.connections, args.messages)
+    print(json.dumps({'connections': args.connections, 'messages': args.messages, **results}, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,97 @@
+"""并发报名压测：大量用户同时报名同一个活动，检查名额不超卖、无重复报名。
+
+    DATABASE_URL=mysql://... python -m benchmarks.join_race --users 300 --capacity 50
+
+会在目标数据库中创建临时用户和活动，结束后删除。每个用户报名两次，
+用来同时覆盖超卖和重复报名两种竞争。
+"""
+import argparse
+import json
+import threading
+import time
+import uuid
+from collections import Counter
+
+import sqlalchemy as sa
+
+
+def run(users, capacity, attempts):
+    from app import create_app, db
+    from app.models import Activity, Participation, User
+    from app.participation import join_activity
+
+    app = create_app()
+    tag = uuid.uuid4().hex[:8]
+    with app.app_context():
+        people = [User(username=f'race-{tag}-{i}', email=f'race-{tag}-{i}@example.com', password_hash='x')
+                  for i in range(users)]
+        db.session.add_all(people)
+        db.session.flush()
+        activity = Activity(title=f'race-{tag}', description='join race', creator_id=people[0].id,
+                            event_time=sa.func.now(), location='bench', max_participants=capacity)
+        db.session.add(activity)
+        db.session.commit()
+        user_ids = [user.id for user in people]
+        activity_id = activity.id
+
+    results = Counter()
+    barrier = threading.Barrier(users)
+    lock = threading.Lock()
+
+    def worker(user_id):
+        barrier.wait()
+        for _ in range(attempts):
+            with app.app_context():
+                try:
+                    result = join_activity(user_id, activity_id)
+                except Exception as exc:
+                    result = f'error:{type(exc).__name__}'
+            with lock:
+                results[result] += 1
+
+    threads = [threading.Thread(target=worker, args=(user_id,)) for user_id in user_ids]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+
+    with app.app_context():
+        count = db.session.query(Activity.participant_count).filter_by(id=activity_id).scalar()
+        rows = Participation.query.filter_by(activity_id=activity_id).count()
+        distinct = db.session.query(sa.func.count(sa.distinct(Participation.user_id))).filter_by(
+            activity_id=activity_id).scalar()
+        db.session.execute(sa.delete(Participation).where(Participation.activity_id == activity_id))
+        db.session.execute(sa.delete(Activity).where(Activity.id == activity_id))
+        db.session.execute(sa.delete(User).where(User.id.in_(user_ids)))
+        db.session.commit()
+
+    report = {
+        'users': users,
+        'capacity': capacity,
+        'attempts_per_user': attempts,
+        'elapsed_s': round(elapsed, 3),
+        'results': dict(results),
+        'participant_count': count,
+        'participation_rows': rows,
+        'distinct_users': distinct,
+    }
+    report['ok'] = (count == rows == distinct == min(capacity, users)
+                    and results['joined'] == min(capacity, users))
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--users', type=int, default=300)
+    parser.add_argument('--capacity', type=int, default=50)
+    parser.add_argument('--attempts', type=int, default=2, help='每个用户的报名次数')
+    args = parser.parse_args()
+    report = run(args.users, args.capacity, args.attempts)
+    print(json.dumps(report, indent=2, ensure_ascii=False))
+    raise SystemExit(0 if report['ok'] else 1)
+
+
+if __name__ == '__main__':
+    main()
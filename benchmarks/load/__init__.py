@@ -0,0 +1,11 @@
+"""HTTP 路由与 Socket.IO 聊天的负载测试。
+
+    python -m benchmarks.load --users 1000 --activities 5000 --messages 50000 --clients 50 --duration 30 \\
+        --output bench-$(git rev-parse --short HEAD).json
+    python -m benchmarks.load --skip-datagen --compare bench-old.json
+
+先在本地 SQLite 数据库中生成合成数据（datagen），再启动一个使用真实 create_app()
+的 eventlet 服务进程（server），由多个模拟客户端并发访问页面和 Socket.IO 事件
+（clients），最后输出每种操作的 p50/p95/p99 延迟、吞吐量和每次请求的 SQL 条数（report）。
+客户端需要 requests 和 python-socketio[client]。
+"""
@@ -0,0 +1,98 @@
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+
+from benchmarks.hub_latency import _free_port, _wait_for
+from benchmarks.load import __doc__ as DOC
+from benchmarks.load.clients import DEFAULT_MIX, run_clients
+from benchmarks.load.datagen import search_terms
+from benchmarks.load.report import build_report, compare
+
+
+def _parse_mix(text):
+    mix = dict(DEFAULT_MIX)
+    for item in filter(None, text.split(',')):
+        name, _, weight = item.partition('=')
+        if name not in DEFAULT_MIX:
+            raise argparse.ArgumentTypeError(f'unknown operation {name!r}, choose from {", ".join(DEFAULT_MIX)}')
+        mix[name] = float(weight)
+    return {name: weight for name, weight in mix.items() if weight > 0}
+
+
+def prepare(args):
+    from app import create_app
+    from benchmarks.load.datagen import describe, generate
+
+    app = create_app()
+    with app.app_context():
+        if args.skip_datagen:
+            return describe()
+        return generate(args.users, args.activities, args.participations, args.conversations,
+                        args.messages, args.seed)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=DOC.splitlines()[0])
+    parser.add_argument('--db', default=os.path.join(tempfile.gettempdir(), 'yuedazi-bench.db'),
+                        help='SQLite 数据库文件路径')
+    parser.add_argument('--skip-datagen', action='store_true', help='复用 --db 中已有的数据')
+    parser.add_argument('--users', type=int, default=1000)
+    parser.add_argument('--activities', type=int, default=5000)
+    parser.add_argument('--participations', type=int, default=5, help='每个活动的平均报名人数')
+    parser.add_argument('--conversations', type=int, default=2000)
+    parser.add_argument('--messages', type=int, default=50000)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--clients', type=int, default=50, help='并发模拟客户端数')
+    parser.add_argument('--warmup', type=float, default=3, help='预热秒数，不计入统计')
+    parser.add_argument('--duration', type=float, default=30, help='统计秒数')
+    parser.add_argument('--mix', type=_parse_mix, default=dict(DEFAULT_MIX),
+                        help='操作权重，例如 index=10,join=0（未列出的使用默认值）')
+    parser.add_argument('--output', help='同时把 JSON 报告写入该文件')
+    parser.add_argument('--compare', help='与之前保存的 JSON 报告对比')
+    parser.add_argument('--serve', action='store_true', help=argparse.SUPPRESS)
+    parser.add_argument('--port', type=int, default=0, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.serve:
+        from benchmarks.load.server import serve
+        serve(args.port)
+        return
+
+    import requests
+
+    # config.py 在导入时读取 DATABASE_URL，必须在导入 app 之前设置
+    os.environ['DATABASE_URL'] = 'sqlite:///' + os.path.abspath(args.db)
+    dataset = prepare(args)
+    print('dataset', json.dumps(dataset['counts']), file=sys.stderr)
+
+    port = _free_port()
+    env = dict(os.environ, PYTHONUNBUFFERED='1')
+    env.pop('FLASK_RUN_FROM_CLI', None)
+    server = subprocess.Popen([sys.executable, '-m', 'benchmarks.load', '--serve', '--port', str(port)],
+                              env=env, stdout=subprocess.DEVNULL)
+    base = f'http://127.0.0.1:{port}'
+    try:
+        _wait_for(server, base + '/login', timeout=60)
+        recorder, elapsed = run_clients(base, dataset, search_terms(), args.clients, args.mix,
+                                        args.warmup, args.duration, args.seed)
+        socket_sql = requests.get(base + '/_bench/socket-sql', timeout=60).json()
+    finally:
+        server.terminate()
+        server.wait()
+
+    settings = {key: getattr(args, key) for key in ('clients', 'warmup', 'duration', 'mix', 'seed')}
+    report = build_report(recorder, elapsed, socket_sql, dataset, settings)
+    text = json.dumps(report, indent=2, ensure_ascii=False)
+    print(text)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            f.write(text + '\n')
+    if args.compare:
+        with open(args.compare, encoding='utf-8') as f:
+            print(compare(report, json.load(f)), file=sys.stderr)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,160 @@
+"""模拟客户端：每个客户端以一个用户身份登录，按权重随机访问页面和触发 Socket.IO 事件。"""
+import random
+import re
+import threading
+import time
+
+from benchmarks.load.datagen import BENCH_PASSWORD
+
+# 操作名 -> 默认权重
+DEFAULT_MIX = {
+    'index': 20,
+    'search': 15,
+    'activity': 25,
+    'chat': 15,
+    'join': 5,
+    'socket_send_message': 15,
+    'socket_join': 5,
+}
+
+_CSRF_RE = re.compile(r'name="csrf_token" type="hidden" value="([^"]+)"')
+
+
+class Recorder:
+    """线程安全地收集每种操作的耗时、错误数和 SQL 条数。"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.operations = {}
+        self.recording = False
+
+    def record(self, name, elapsed_ms, ok, queries=None):
+        if not self.recording:
+            return
+        with self._lock:
+            stats = self.operations.setdefault(name, {'latencies_ms': [], 'errors': 0, 'queries': []})
+            stats['latencies_ms'].append(elapsed_ms)
+            if not ok:
+                stats['errors'] += 1
+            if queries is not None:
+                stats['queries'].append(queries)
+
+
+class SimulatedClient:
+    def __init__(self, base, conversation, user_id, activity_ids, terms, recorder, seed):
+        import requests
+
+        self.base = base
+        self.conversation = conversation
+        self.user_id = user_id
+        self.receiver_id = next(other for other in conversation['user_ids'] if other != user_id)
+        self.activity_ids = activity_ids
+        self.terms = terms
+        self.recorder = recorder
+        self.rng = random.Random(seed)
+        self.http = requests.Session()
+        self.socket = None
+
+    def login(self):
+        page = self.http.get(self.base + '/login', timeout=60)
+        token = _CSRF_RE.search(page.text)
+        data = {'username': f'bench{self.user_id}', 'password': BENCH_PASSWORD}
+        if token:
+            data['csrf_token'] = token.group(1)
+        response = self.http.post(self.base + '/login', data=data, allow_redirects=False, timeout=120)
+        if response.status_code != 302:
+            raise RuntimeError(f'login as bench{self.user_id} failed: HTTP {response.status_code}')
+
+    def connect(self):
+        import socketio
+
+        self.socket = socketio.Client(reconnection=False)
+        cookie = '; '.join(f'{name}={value}' for name, value in self.http.cookies.items())
+        self.socket.connect(self.base, headers={'Cookie': cookie}, transports=['websocket'], wait_timeout=60)
+        ack = self.socket.call('join', {'room': self.conversation['id']}, timeout=60)
+        if not ack or ack.get('status') != 'ok':
+            raise RuntimeError(f'joining room {self.conversation["id"]} failed: {ack}')
+
+    def close(self):
+        if self.socket is not None:
+            self.socket.disconnect()
+        self.http.close()
+
+    def _get(self, name, path):
+        started = time.perf_counter()
+        try:
+            response = self.http.get(self.base + path, allow_redirects=False, timeout=120)
+        except OSError:
+            self.recorder.record(name, (time.perf_counter() - started) * 1000, False)
+            return
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        queries = response.headers.get('X-SQL-Queries')
+        self.recorder.record(name, elapsed_ms, response.status_code < 400,
+                             int(queries) if queries is not None else None)
+
+    def _call(self, name, event, data):
+        started = time.perf_counter()
+        try:
+            ack = self.socket.call(event, data, timeout=120)
+            ok = bool(ack) and ack.get('status') == 'ok'
+        except Exception:
+            ok = False
+        self.recorder.record(name, (time.perf_counter() - started) * 1000, ok)
+
+    def step(self, name):
+        if name == 'index':
+            self._get(name, '/')
+        elif name == 'search':
+            self._get(name, '/index?search=' + self.rng.choice(self.terms))
+        elif name == 'activity':
+            self._get(name, f'/activity/{self.rng.choice(self.activity_ids)}')
+        elif name == 'chat':
+            self._get(name, f'/chat/{self.conversation["id"]}')
+        elif name == 'join':
+            self._get(name, f'/activity/{self.rng.choice(self.activity_ids)}/join')
+        elif name == 'socket_send_message':
+            self._call(name, 'send_message', {'activity_id': self.conversation['activity_id'],
+                                              'receiver_id': self.receiver_id,
+                                              'content': f'bench message {self.rng.random():.6f}'})
+        elif name == 'socket_join':
+            self._call(name, 'join', {'room': self.conversation['id']})
+        else:
+            raise ValueError(f'unknown operation {name!r}')
+
+    def run(self, mix, deadline):
+        names = list(mix)
+        weights = [mix[name] for name in names]
+        while time.time() < deadline:
+            self.step(self.rng.choices(names, weights)[0])
+
+
+def run_clients(base, dataset, terms, clients, mix, warmup, duration, seed=0):
+    """并发运行 clients 个模拟客户端，预热 warmup 秒后统计 duration 秒，返回 (recorder, 实际统计秒数)。"""
+    conversations = dataset['conversations']
+    if not conversations:
+        raise RuntimeError('dataset has no conversations, generate messages first')
+    recorder = Recorder()
+    simulated = []
+    for i in range(clients):
+        conversation = conversations[i % len(conversations)]
+        user_id = conversation['user_ids'][(i // len(conversations)) % 2]
+        simulated.append(SimulatedClient(base, conversation, user_id, dataset['activity_ids'], terms,
+                                         recorder, seed + i))
+    for client in simulated:
+        client.login()
+        client.connect()
+
+    deadline = time.time() + warmup + duration
+    threads = [threading.Thread(target=client.run, args=(mix, deadline), daemon=True) for client in simulated]
+    for thread in threads:
+        thread.start()
+    time.sleep(warmup)
+    recorder.recording = True
+    started = time.perf_counter()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+    recorder.recording = False
+    for client in simulated:
+        client.close()
+    return recorder, elapsed
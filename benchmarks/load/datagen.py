@@ -0,0 +1,138 @@
+"""生成负载测试用的合成数据：用户、活动、报名、会话和聊天消息。"""
+import random
+from datetime import datetime, timedelta
+
+import sqlalchemy as sa
+
+BENCH_PASSWORD = 'bench-password'
+INSERT_BATCH = 5000
+
+_WORDS = ['篮球', '足球', '羽毛球', '跑步', '徒步', '爬山', '骑行', '游泳', '桌游', '剧本杀', '电影', '读书',
+          '咖啡', '摄影', '露营', '音乐', '编程', '英语', 'basketball', 'football', 'hiking', 'coffee',
+          'movie', 'board', 'games', 'camping', 'python', 'music']
+_PLACES = ['体育馆', '操场', '图书馆', '咖啡馆', '公园', '学生活动中心', '东区食堂', '西门']
+
+
+def search_terms():
+    """客户端搜索时使用的关键词，与生成活动标题的词表一致。"""
+    return list(_WORDS)
+
+
+def _insert(db, model, rows):
+    for start in range(0, len(rows), INSERT_BATCH):
+        db.session.execute(sa.insert(model), rows[start:start + INSERT_BATCH])
+
+
+def generate(users, activities, participations, conversations, messages, seed=0):
+    """清空当前数据库并写入合成数据，需在应用上下文中调用。
+
+    participations 是每个活动的平均报名人数，消息平均分布在 conversations 个会话中。
+    返回客户端需要的数据规模和会话列表。
+    """
+    from app import db
+    from app.conversations import conversation_key
+    from app.models import Activity, Conversation, Message, Participation, User
+    from app.passwords import password_hasher
+    from app.search import rebuild_index
+
+    rng = random.Random(seed)
+    now = datetime.utcnow()
+    db.drop_all()
+    db.create_all()
+
+    # 所有用户共用同一个哈希，避免生成数据时逐个计算
+    password_hash = password_hasher.hash(BENCH_PASSWORD)
+    _insert(db, User, [{'id': i, 'username': f'bench{i}', 'email': f'bench{i}@example.com',
+                        'password_hash': password_hash} for i in range(1, users + 1)])
+
+    activity_rows = []
+    members = {}
+    participation_rows = []
+    for activity_id in range(1, activities + 1):
+        creator_id = rng.randint(1, users)
+        event_time = now + timedelta(days=rng.randint(1, 60), minutes=rng.randint(0, 1439))
+        joined = rng.sample(range(1, users + 1), min(users, rng.randint(0, 2 * participations)))
+        # 留出空位，保证报名接口不会只返回“已满”
+        max_participants = len(joined) + rng.randint(1, 20)
+        activity_rows.append({
+            'id': activity_id,
+            'title': ' '.join(rng.sample(_WORDS, 2)) + f' {activity_id}',
+            'description': ' '.join(rng.choices(_WORDS, k=12)),
+            'creator_id': creator_id,
+            'created_at': now - timedelta(minutes=activities - activity_id),
+            'event_time': event_time,
+            'end_time': event_time + timedelta(hours=2),
+            'location': rng.choice(_PLACES),
+            'max_participants': max_participants,
+            'participant_count': len(joined),
+        })
+        members[activity_id] = (creator_id, joined)
+        participation_rows.extend({'user_id': user_id, 'activity_id': activity_id,
+                                   'joined_at': now - timedelta(minutes=rng.randint(0, 10000))}
+                                  for user_id in joined)
+    _insert(db, Activity, activity_rows)
+    _insert(db, Participation, participation_rows)
+
+    # 会话发生在活动创建者和报名者之间
+    pairs = {}
+    candidates = [activity_id for activity_id, (_, joined) in members.items() if joined]
+    attempts = 0
+    while candidates and len(pairs) < conversations and attempts < conversations * 10:
+        attempts += 1
+        activity_id = rng.choice(candidates)
+        creator_id, joined = members[activity_id]
+        other_id = rng.choice(joined)
+        if other_id == creator_id:
+            continue
+        key = conversation_key(activity_id, creator_id, other_id)
+        pairs[key] = (activity_id, min(creator_id, other_id), max(creator_id, other_id))
+
+    keys = list(pairs)
+    conversation_ids = {key: number for number, key in enumerate(keys, 1)}
+    message_rows = []
+    summaries = {}
+    seqs = {}
+    started = now - timedelta(seconds=messages)
+    for message_id in range(1, (messages if keys else 0) + 1):
+        key = rng.choice(keys)
+        activity_id, user1_id, user2_id = pairs[key]
+        sender_id, receiver_id = (user1_id, user2_id) if rng.random() < 0.5 else (user2_id, user1_id)
+        timestamp = started + timedelta(seconds=message_id)
+        seqs[key] = seqs.get(key, 0) + 1
+        message_rows.append({'id': message_id, 'sender_id': sender_id, 'receiver_id': receiver_id,
+                             'activity_id': activity_id, 'conversation_id': conversation_ids[key],
+                             'content': ' '.join(rng.choices(_WORDS, k=rng.randint(1, 8))),
+                             'timestamp': timestamp, 'seq': seqs[key]})
+        summaries[key] = (message_id, timestamp)
+    _insert(db, Message, message_rows)
+    _insert(db, Conversation, [{'id': conversation_ids[key], 'activity_id': activity_id, 'user1_id': user1_id,
+                                'user2_id': user2_id, 'last_message_id': summaries[key][0],
+                                'last_activity_at': summaries[key][1], 'user1_unread': 0, 'user2_unread': 0,
+                                'last_seq': seqs[key]}
+                               for key, (activity_id, user1_id, user2_id) in pairs.items() if key in summaries])
+    db.session.commit()
+    rebuild_index()
+    return describe()
+
+
+def describe():
+    """读取当前数据库的数据规模和会话列表，--skip-datagen 时复用已有数据。"""
+    from app import db
+    from app.models import Activity, Conversation, Message, Participation, User
+
+    def count(model):
+        return db.session.query(sa.func.count()).select_from(model).scalar()
+
+    rows = Conversation.query.order_by(Conversation.id).all()
+    return {
+        'counts': {
+            'users': count(User),
+            'activities': count(Activity),
+            'participations': count(Participation),
+            'conversations': len(rows),
+            'messages': count(Message),
+        },
+        'activity_ids': [row[0] for row in db.session.query(Activity.id).order_by(Activity.id)],
+        'conversations': [{'id': row.key, 'activity_id': row.activity_id, 'user_ids': [row.user1_id, row.user2_id]}
+                          for row in rows],
+    }
@@ -0,0 +1,65 @@
+"""把客户端统计整理成 JSON 报告，并与之前的报告对比。"""
+import subprocess
+from datetime import datetime, timezone
+
+from benchmarks.hub_latency import _percentiles
+
+
+def _git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def build_report(recorder, elapsed, socket_sql, dataset, settings):
+    operations = {}
+    total = errors = 0
+    for name, stats in sorted(recorder.operations.items()):
+        latencies = stats['latencies_ms']
+        entry = {
+            'requests': len(latencies),
+            'errors': stats['errors'],
+            'throughput_rps': round(len(latencies) / elapsed, 2),
+            **_percentiles(latencies),
+        }
+        if stats['queries']:
+            entry['queries_per_request'] = round(sum(stats['queries']) / len(stats['queries']), 2)
+        elif name.startswith('socket_'):
+            # 服务端按事件名统计，包含预热和登录阶段的事件
+            sql = socket_sql.get(name[len('socket_'):])
+            if sql and sql['events']:
+                entry['queries_per_request'] = round(sql['queries'] / sql['events'], 2)
+        operations[name] = entry
+        total += len(latencies)
+        errors += stats['errors']
+    return {
+        'benchmark': 'load',
+        'commit': _git_commit(),
+        'finished_at': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+        'settings': settings,
+        'dataset': dataset['counts'],
+        'elapsed_s': round(elapsed, 2),
+        'totals': {'requests': total, 'errors': errors, 'throughput_rps': round(total / elapsed, 2)},
+        'operations': operations,
+    }
+
+
+def compare(report, baseline):
+    """逐项对比两份报告的 p95 延迟、吞吐量和 SQL 条数，返回可打印的文本。"""
+    lines = [f"{'operation':<22}  {'p95_ms':>24}  {'throughput_rps':>24}  {'queries':>20}"]
+
+    def cell(old, new):
+        if old is None or new is None:
+            return f'{old} -> {new}'
+        change = f' ({(new - old) / old * 100:+.0f}%)' if old else ''
+        return f'{old} -> {new}{change}'
+
+    for name, entry in report['operations'].items():
+        old = baseline.get('operations', {}).get(name, {})
+        lines.append(f"{name:<22}  {cell(old.get('p95_ms'), entry['p95_ms']):>24}  "
+                     f"{cell(old.get('throughput_rps'), entry['throughput_rps']):>24}  "
+                     f"{cell(old.get('queries_per_request'), entry.get('queries_per_request')):>20}")
+    lines.append(f"baseline commit {baseline.get('commit')}, this run {report.get('commit')}")
+    return '\n'.join(lines)
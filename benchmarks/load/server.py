@@ -0,0 +1,44 @@
+"""负载测试使用的服务进程：真实的 create_app()，额外统计每个 Socket.IO 事件的 SQL 条数。"""
+import signal
+import sys
+from collections import defaultdict
+
+
+def serve(port):
+    import eventlet
+    eventlet.monkey_patch()
+
+    from flask import jsonify
+
+    from app import create_app, instrumentation, socketio
+    from app.passwords import password_hasher
+    from app.ratelimit import socket_limiter
+
+    app = create_app()
+    # HTTP 请求的 SQL 条数由 X-SQL-Queries 响应头带回
+    app.config['SQL_DEBUG_HEADERS'] = True
+    app.config['SQL_INSTRUMENTATION'] = True
+    password_hasher.attempt_limit = sys.maxsize
+    # 模拟客户端没有思考时间，关闭事件限流以测出吞吐上限
+    socket_limiter.limits = {}
+
+    # Socket.IO 事件没有响应头，在 instrument_event 结束统计时按事件名累加
+    socket_sql = defaultdict(lambda: {'events': 0, 'queries': 0})
+    finish = instrumentation._finish
+
+    def record(label):
+        result = finish(label)
+        if result and label.startswith('socket '):
+            totals = socket_sql[label[len('socket '):]]
+            totals['events'] += 1
+            totals['queries'] += result[0].count
+        return result
+
+    instrumentation._finish = record
+    app.add_url_rule('/_bench/socket-sql', 'bench_socket_sql', lambda: jsonify(socket_sql))
+
+    def shutdown(signum, frame):
+        raise SystemExit(0)
+
+    signal.signal(signal.SIGTERM, shutdown)
+    socketio.run(app, host='127.0.0.1', port=port, debug=False, use_reloader=False, log_output=False)
@@ -0,0 +1,28 @@
+"""Add composite indexes for activity keyset pagination
+
+Revision ID: 3f9a2c7d51e0
+Revises: 1edca2b11346
+Create Date: 2025-04-02 10:12:41.203511
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '3f9a2c7d51e0'
+down_revision = '1edca2b11346'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('activity', schema=None) as batch_op:
+        batch_op.create_index('ix_activity_created_at_id', ['created_at', 'id'], unique=False)
+        batch_op.create_index('ix_activity_event_time_id', ['event_time', 'id'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('activity', schema=None) as batch_op:
+        batch_op.drop_index('ix_activity_event_time_id')
+        batch_op.drop_index('ix_activity_created_at_id')
@@ -0,0 +1,28 @@
+"""Add replication_heartbeat table
+
+Revision ID: 4c8e2a7f9d31
+Revises: e7c3d91a5b20
+Create Date: 2025-04-12 16:20:45.903117
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '4c8e2a7f9d31'
+down_revision = 'e7c3d91a5b20'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('replication_heartbeat',
+    sa.Column('id', sa.Integer(), autoincrement=False, nullable=False),
+    sa.Column('beat_at', sa.DateTime(), nullable=False),
+    sa.PrimaryKeyConstraint('id')
+    )
+
+
+def downgrade():
+    op.drop_table('replication_heartbeat')
@@ -0,0 +1,26 @@
+"""Add (conversation_id, timestamp, id) index to message
+
+Revision ID: 5d0b7e3c9f12
+Revises: c52e8d0f1a47
+Create Date: 2025-04-09 09:27:14.660437
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '5d0b7e3c9f12'
+down_revision = 'c52e8d0f1a47'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('message', schema=None) as batch_op:
+        batch_op.create_index('ix_message_conversation_timestamp_id', ['conversation_id', 'timestamp', 'id'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('message', schema=None) as batch_op:
+        batch_op.drop_index('ix_message_conversation_timestamp_id')
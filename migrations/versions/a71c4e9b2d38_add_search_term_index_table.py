@@ -0,0 +1,36 @@
+"""Add search_term inverted index table
+
+Revision ID: a71c4e9b2d38
+Revises: 3f9a2c7d51e0
+Create Date: 2025-04-03 16:40:08.551920
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'a71c4e9b2d38'
+down_revision = '3f9a2c7d51e0'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('search_term',
+    sa.Column('term', sa.String(length=64), nullable=False),
+    sa.Column('activity_id', sa.Integer(), nullable=False),
+    sa.Column('weight', sa.Integer(), nullable=False),
+    sa.ForeignKeyConstraint(['activity_id'], ['activity.id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('term', 'activity_id')
+    )
+    with op.batch_alter_table('search_term', schema=None) as batch_op:
+        batch_op.create_index(batch_op.f('ix_search_term_activity_id'), ['activity_id'], unique=False)
+    # 已有活动的索引通过 `flask search reindex` 重建
+
+
+def downgrade():
+    with op.batch_alter_table('search_term', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_search_term_activity_id'))
+
+    op.drop_table('search_term')
@@ -0,0 +1,165 @@
+"""Key conversations by integer id and reference them from message by integer
+
+Revision ID: b3d5f8a1c642
+Revises: 4c8e2a7f9d31
+Create Date: 2025-04-13 15:08:37.264810
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'b3d5f8a1c642'
+down_revision = '4c8e2a7f9d31'
+branch_labels = None
+depends_on = None
+
+_USER1 = "CASE WHEN {t}.sender_id < {t}.receiver_id THEN {t}.sender_id ELSE {t}.receiver_id END"
+_USER2 = "CASE WHEN {t}.sender_id < {t}.receiver_id THEN {t}.receiver_id ELSE {t}.sender_id END"
+
+
+def _conversation_of(table):
+    # 消息所属会话由 (活动, 较小用户 id, 较大用户 id) 唯一确定，走 uq_conversation_activity_users
+    return (f"(SELECT c.id FROM conversation c WHERE c.activity_id = {table}.activity_id "
+            f"AND c.user1_id = {_USER1.format(t=table)} AND c.user2_id = {_USER2.format(t=table)})")
+
+
+def _string_key(table):
+    # 旧的字符串会话键 "活动id-较小用户id-较大用户id"，用 SQLAlchemy 拼接以兼容 MySQL 和 SQLite
+    t = sa.table(table, sa.column('activity_id', sa.Integer), sa.column('sender_id', sa.Integer),
+                 sa.column('receiver_id', sa.Integer), sa.column('conversation_key', sa.String))
+    user1 = sa.case((t.c.sender_id < t.c.receiver_id, t.c.sender_id), else_=t.c.receiver_id)
+    user2 = sa.case((t.c.sender_id < t.c.receiver_id, t.c.receiver_id), else_=t.c.sender_id)
+    return t, (sa.cast(t.c.activity_id, sa.String) + '-' + sa.cast(user1, sa.String) + '-'
+               + sa.cast(user2, sa.String))
+
+
+def upgrade():
+    with op.batch_alter_table('conversation', schema=None) as batch_op:
+        batch_op.drop_index('ix_conversation_user2_last_activity')
+        batch_op.drop_index('ix_conversation_user1_last_activity')
+    op.rename_table('conversation', 'conversation_legacy')
+
+    op.create_table('conversation',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('activity_id', sa.Integer(), nullable=False),
+    sa.Column('user1_id', sa.Integer(), nullable=False),
+    sa.Column('user2_id', sa.Integer(), nullable=False),
+    sa.Column('last_message_id', sa.Integer(), nullable=True),
+    sa.Column('last_activity_at', sa.DateTime(), nullable=True),
+    sa.Column('user1_unread', sa.Integer(), nullable=False),
+    sa.Column('user2_unread', sa.Integer(), nullable=False),
+    sa.ForeignKeyConstraint(['activity_id'], ['activity.id'], ondelete='CASCADE'),
+    sa.ForeignKeyConstraint(['user1_id'], ['user.id'], ondelete='CASCADE'),
+    sa.ForeignKeyConstraint(['user2_id'], ['user.id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('id')
+    )
+    with op.batch_alter_table('conversation', schema=None) as batch_op:
+        batch_op.create_index('uq_conversation_activity_users', ['activity_id', 'user1_id', 'user2_id'], unique=True)
+        batch_op.create_index('ix_conversation_user1_last_activity', ['user1_id', 'last_activity_at'], unique=False)
+        batch_op.create_index('ix_conversation_user2_last_activity', ['user2_id', 'last_activity_at'], unique=False)
+
+    op.execute("""
+        INSERT INTO conversation (activity_id, user1_id, user2_id, last_message_id, last_activity_at,
+                                  user1_unread, user2_unread)
+        SELECT activity_id, user1_id, user2_id, last_message_id, last_activity_at, user1_unread, user2_unread
+        FROM conversation_legacy
+        ORDER BY last_activity_at, id
+    """)
+    # 没有汇总行的消息（例如 1edca2b11346 填了 'temp' 的旧消息）按收发双方补建会话
+    op.execute(f"""
+        INSERT INTO conversation (activity_id, user1_id, user2_id, last_message_id, last_activity_at,
+                                  user1_unread, user2_unread)
+        SELECT m.activity_id, {_USER1.format(t='m')}, {_USER2.format(t='m')}, MAX(m.id), MAX(m.timestamp), 0, 0
+        FROM message m
+        WHERE NOT EXISTS {_conversation_of('m')}
+        GROUP BY m.activity_id, {_USER1.format(t='m')}, {_USER2.format(t='m')}
+    """)
+
+    for table in ('message', 'message_archive'):
+        with op.batch_alter_table(table, schema=None) as batch_op:
+            batch_op.add_column(sa.Column('conversation_ref', sa.Integer(), nullable=True))
+        op.execute(f"UPDATE {table} SET conversation_ref = {_conversation_of(table)}")
+
+    # 索引要在 batch 之外删除，否则 SQLite 重建表时还会按旧列重建它
+    op.drop_index('ix_message_conversation_timestamp_id', table_name='message')
+    # 归档表沿用消息 id：SQLite 重建表时加上 AUTOINCREMENT，删除的 id 不会再分配给新消息
+    with op.batch_alter_table('message', schema=None, table_kwargs={'sqlite_autoincrement': True}) as batch_op:
+        batch_op.drop_column('conversation_id')
+    with op.batch_alter_table('message', schema=None, table_kwargs={'sqlite_autoincrement': True}) as batch_op:
+        batch_op.alter_column('conversation_ref', new_column_name='conversation_id',
+                              existing_type=sa.Integer(), nullable=False)
+    with op.batch_alter_table('message', schema=None, table_kwargs={'sqlite_autoincrement': True}) as batch_op:
+        batch_op.create_foreign_key('fk_message_conversation_id_conversation', 'conversation',
+                                    ['conversation_id'], ['id'], ondelete='CASCADE')
+    op.create_index('ix_message_conversation_timestamp_id', 'message', ['conversation_id', 'timestamp', 'id'],
+                    unique=False)
+
+    # 过期活动的会话已删除，这些归档消息的 conversation_id 为空
+    with op.batch_alter_table('message_archive', schema=None) as batch_op:
+        batch_op.drop_column('conversation_id')
+    with op.batch_alter_table('message_archive', schema=None) as batch_op:
+        batch_op.alter_column('conversation_ref', new_column_name='conversation_id',
+                              existing_type=sa.Integer(), existing_nullable=True)
+    op.create_index('ix_message_archive_conversation_timestamp_id', 'message_archive',
+                    ['conversation_id', 'timestamp', 'id'], unique=False)
+
+    op.drop_table('conversation_legacy')
+
+
+def downgrade():
+    op.create_table('conversation_legacy',
+    sa.Column('id', sa.String(length=100), nullable=False),
+    sa.Column('activity_id', sa.Integer(), nullable=False),
+    sa.Column('user1_id', sa.Integer(), nullable=False),
+    sa.Column('user2_id', sa.Integer(), nullable=False),
+    sa.Column('last_message_id', sa.Integer(), nullable=True),
+    sa.Column('last_activity_at', sa.DateTime(), nullable=True),
+    sa.Column('user1_unread', sa.Integer(), nullable=False),
+    sa.Column('user2_unread', sa.Integer(), nullable=False),
+    sa.ForeignKeyConstraint(['activity_id'], ['activity.id'], ondelete='CASCADE'),
+    sa.ForeignKeyConstraint(['user1_id'], ['user.id'], ondelete='CASCADE'),
+    sa.ForeignKeyConstraint(['user2_id'], ['user.id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('id')
+    )
+    columns = ['activity_id', 'user1_id', 'user2_id', 'last_message_id', 'last_activity_at',
+               'user1_unread', 'user2_unread']
+    conversation = sa.table('conversation', *[sa.column(name) for name in columns])
+    key = (sa.cast(conversation.c.activity_id, sa.String) + '-' + sa.cast(conversation.c.user1_id, sa.String)
+           + '-' + sa.cast(conversation.c.user2_id, sa.String))
+    legacy = sa.table('conversation_legacy', sa.column('id'), *[sa.column(name) for name in columns])
+    op.execute(sa.insert(legacy).from_select(['id'] + columns, sa.select(key, *conversation.c)))
+
+    for table in ('message', 'message_archive'):
+        with op.batch_alter_table(table, schema=None) as batch_op:
+            batch_op.add_column(sa.Column('conversation_key', sa.String(length=100), nullable=True))
+        t, string_key = _string_key(table)
+        op.execute(sa.update(t).values(conversation_key=string_key))
+
+    op.drop_index('ix_message_conversation_timestamp_id', table_name='message')
+    with op.batch_alter_table('message', schema=None) as batch_op:
+        batch_op.drop_constraint('fk_message_conversation_id_conversation', type_='foreignkey')
+        batch_op.drop_column('conversation_id')
+    with op.batch_alter_table('message', schema=None) as batch_op:
+        batch_op.alter_column('conversation_key', new_column_name='conversation_id',
+                              existing_type=sa.String(length=100), nullable=False)
+    op.create_index('ix_message_conversation_timestamp_id', 'message', ['conversation_id', 'timestamp', 'id'],
+                    unique=False)
+
+    op.drop_index('ix_message_archive_conversation_timestamp_id', table_name='message_archive')
+    with op.batch_alter_table('message_archive', schema=None) as batch_op:
+        batch_op.drop_column('conversation_id')
+    with op.batch_alter_table('message_archive', schema=None) as batch_op:
+        batch_op.alter_column('conversation_key', new_column_name='conversation_id',
+                              existing_type=sa.String(length=100), nullable=False)
+
+    with op.batch_alter_table('conversation', schema=None) as batch_op:
+        batch_op.drop_index('ix_conversation_user2_last_activity')
+        batch_op.drop_index('ix_conversation_user1_last_activity')
+        batch_op.drop_index('uq_conversation_activity_users')
+    op.drop_table('conversation')
+    op.rename_table('conversation_legacy', 'conversation')
+    with op.batch_alter_table('conversation', schema=None) as batch_op:
+        batch_op.create_index('ix_conversation_user1_last_activity', ['user1_id', 'last_activity_at'], unique=False)
+        batch_op.create_index('ix_conversation_user2_last_activity', ['user2_id', 'last_activity_at'], unique=False)
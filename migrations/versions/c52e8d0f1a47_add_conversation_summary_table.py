@@ -0,0 +1,60 @@
+"""Add conversation summary table and backfill from message
+
+Revision ID: c52e8d0f1a47
+Revises: a71c4e9b2d38
+Create Date: 2025-04-07 11:05:52.318264
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c52e8d0f1a47'
+down_revision = 'a71c4e9b2d38'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('conversation',
+    sa.Column('id', sa.String(length=100), nullable=False),
+    sa.Column('activity_id', sa.Integer(), nullable=False),
+    sa.Column('user1_id', sa.Integer(), nullable=False),
+    sa.Column('user2_id', sa.Integer(), nullable=False),
+    sa.Column('last_message_id', sa.Integer(), nullable=True),
+    sa.Column('last_activity_at', sa.DateTime(), nullable=True),
+    sa.Column('user1_unread', sa.Integer(), nullable=False),
+    sa.Column('user2_unread', sa.Integer(), nullable=False),
+    sa.ForeignKeyConstraint(['activity_id'], ['activity.id'], ondelete='CASCADE'),
+    sa.ForeignKeyConstraint(['user1_id'], ['user.id'], ondelete='CASCADE'),
+    sa.ForeignKeyConstraint(['user2_id'], ['user.id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('id')
+    )
+    with op.batch_alter_table('conversation', schema=None) as batch_op:
+        batch_op.create_index('ix_conversation_user1_last_activity', ['user1_id', 'last_activity_at'], unique=False)
+        batch_op.create_index('ix_conversation_user2_last_activity', ['user2_id', 'last_activity_at'], unique=False)
+
+    # 按每个会话的最后一条消息回填；历史未读数无法还原，记为 0
+    # 'temp' 是 1edca2b11346 迁移给旧消息填的占位值，不对应真实会话
+    op.execute("""
+        INSERT INTO conversation (id, activity_id, user1_id, user2_id, last_message_id, last_activity_at,
+                                  user1_unread, user2_unread)
+        SELECT m.conversation_id, m.activity_id,
+               CASE WHEN m.sender_id < m.receiver_id THEN m.sender_id ELSE m.receiver_id END,
+               CASE WHEN m.sender_id < m.receiver_id THEN m.receiver_id ELSE m.sender_id END,
+               m.id, m.timestamp, 0, 0
+        FROM message m
+        JOIN (SELECT conversation_id, MAX(id) AS last_id
+              FROM message
+              WHERE conversation_id <> 'temp'
+              GROUP BY conversation_id) latest ON latest.last_id = m.id
+    """)
+
+
+def downgrade():
+    with op.batch_alter_table('conversation', schema=None) as batch_op:
+        batch_op.drop_index('ix_conversation_user2_last_activity')
+        batch_op.drop_index('ix_conversation_user1_last_activity')
+
+    op.drop_table('conversation')
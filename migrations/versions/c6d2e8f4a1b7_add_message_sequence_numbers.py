@@ -0,0 +1,72 @@
+"""Add per-conversation message sequence numbers
+
+Revision ID: c6d2e8f4a1b7
+Revises: a9e4c2b7f613
+Create Date: 2025-04-27 16:21:05.408193
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c6d2e8f4a1b7'
+down_revision = 'a9e4c2b7f613'
+branch_labels = None
+depends_on = None
+
+_CHUNK_SIZE = 5000
+
+
+def _backfill_seq():
+    # 已有消息按 (会话, id) 顺序编号；按同样的顺序 keyset 分批读取，避免一次读入整张表
+    bind = op.get_bind()
+    message = sa.table('message', sa.column('id', sa.Integer), sa.column('conversation_id', sa.Integer),
+                       sa.column('seq', sa.Integer))
+    last_conversation, last_id, seq = None, None, 0
+    while True:
+        query = sa.select(message.c.conversation_id, message.c.id).order_by(
+            message.c.conversation_id, message.c.id).limit(_CHUNK_SIZE)
+        if last_conversation is not None:
+            query = query.where(sa.or_(message.c.conversation_id > last_conversation,
+                                       sa.and_(message.c.conversation_id == last_conversation,
+                                               message.c.id > last_id)))
+        rows = bind.execute(query).all()
+        if not rows:
+            break
+        updates = []
+        for conversation_id, message_id in rows:
+            seq = seq + 1 if conversation_id == last_conversation else 1
+            last_conversation, last_id = conversation_id, message_id
+            updates.append({'message_id': message_id, 'new_seq': seq})
+        bind.execute(sa.update(message).where(message.c.id == sa.bindparam('message_id')).values(
+            seq=sa.bindparam('new_seq')), updates)
+
+
+def upgrade():
+    with op.batch_alter_table('conversation', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('last_seq', sa.Integer(), server_default='0', nullable=False))
+    with op.batch_alter_table('message', schema=None, table_kwargs={'sqlite_autoincrement': True}) as batch_op:
+        batch_op.add_column(sa.Column('seq', sa.Integer(), nullable=True))
+    with op.batch_alter_table('message_archive', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('seq', sa.Integer(), nullable=True))
+
+    _backfill_seq()
+    op.execute("""
+        UPDATE conversation SET last_seq = COALESCE(
+            (SELECT MAX(m.seq) FROM message m WHERE m.conversation_id = conversation.id), 0)
+    """)
+
+    with op.batch_alter_table('message', schema=None, table_kwargs={'sqlite_autoincrement': True}) as batch_op:
+        batch_op.alter_column('seq', existing_type=sa.Integer(), nullable=False)
+    op.create_index('uq_message_conversation_seq', 'message', ['conversation_id', 'seq'], unique=True)
+
+
+def downgrade():
+    op.drop_index('uq_message_conversation_seq', table_name='message')
+    with op.batch_alter_table('message_archive', schema=None) as batch_op:
+        batch_op.drop_column('seq')
+    with op.batch_alter_table('message', schema=None, table_kwargs={'sqlite_autoincrement': True}) as batch_op:
+        batch_op.drop_column('seq')
+    with op.batch_alter_table('conversation', schema=None) as batch_op:
+        batch_op.drop_column('last_seq')
@@ -0,0 +1,43 @@
+"""Add activity latitude/longitude and geo grid cell index
+
+Revision ID: d84a1f6c3e27
+Revises: b3d5f8a1c642
+Create Date: 2025-04-21 16:12:44.902318
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'd84a1f6c3e27'
+down_revision = 'b3d5f8a1c642'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # 已有活动没有坐标，网格列保持为空，无需回填
+    with op.batch_alter_table('activity', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('latitude', sa.Float(), nullable=True))
+        batch_op.add_column(sa.Column('longitude', sa.Float(), nullable=True))
+        batch_op.add_column(sa.Column('geo_row', sa.Integer(), nullable=True))
+        batch_op.add_column(sa.Column('geo_col', sa.Integer(), nullable=True))
+    op.create_index('ix_activity_geo_cell', 'activity', ['geo_row', 'geo_col', 'event_time'], unique=False)
+
+    with op.batch_alter_table('activity_archive', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('latitude', sa.Float(), nullable=True))
+        batch_op.add_column(sa.Column('longitude', sa.Float(), nullable=True))
+
+
+def downgrade():
+    with op.batch_alter_table('activity_archive', schema=None) as batch_op:
+        batch_op.drop_column('longitude')
+        batch_op.drop_column('latitude')
+
+    op.drop_index('ix_activity_geo_cell', table_name='activity')
+    with op.batch_alter_table('activity', schema=None) as batch_op:
+        batch_op.drop_column('geo_col')
+        batch_op.drop_column('geo_row')
+        batch_op.drop_column('longitude')
+        batch_op.drop_column('latitude')
@@ -0,0 +1,42 @@
+"""Add activity.participant_count and unique (user_id, activity_id) on participation
+
+Revision ID: e7c3d91a5b20
+Revises: 8b1f4a6d2c95
+Create Date: 2025-04-11 10:42:08.517236
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e7c3d91a5b20'
+down_revision = '8b1f4a6d2c95'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('activity', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('participant_count', sa.Integer(), server_default='0', nullable=False))
+
+    # 唯一索引之前先去掉重复报名，保留最早的一条（派生表绕开 MySQL 不能同表子查询的限制）
+    op.execute(
+        "DELETE FROM participation WHERE id NOT IN ("
+        "SELECT id FROM (SELECT MIN(id) AS id FROM participation GROUP BY user_id, activity_id) AS keep)"
+    )
+    op.execute(
+        "UPDATE activity SET participant_count = ("
+        "SELECT COUNT(*) FROM participation WHERE participation.activity_id = activity.id)"
+    )
+
+    with op.batch_alter_table('participation', schema=None) as batch_op:
+        batch_op.create_index('uq_participation_user_activity', ['user_id', 'activity_id'], unique=True)
+
+
+def downgrade():
+    with op.batch_alter_table('participation', schema=None) as batch_op:
+        batch_op.drop_index('uq_participation_user_activity')
+
+    with op.batch_alter_table('activity', schema=None) as batch_op:
+        batch_op.drop_column('participant_count')
@@ -0,0 +1,56 @@
+"""Add recommendation and recommendation_build tables
+
+Revision ID: f1b6c8e2d4a9
+Revises: d84a1f6c3e27
+Create Date: 2025-04-23 10:37:15.604127
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'f1b6c8e2d4a9'
+down_revision = 'd84a1f6c3e27'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('recommendation',
+    sa.Column('user_id', sa.Integer(), nullable=False),
+    sa.Column('rank', sa.Integer(), autoincrement=False, nullable=False),
+    sa.Column('activity_id', sa.Integer(), nullable=False),
+    sa.Column('score', sa.Float(), nullable=False),
+    sa.Column('generated_at', sa.DateTime(), nullable=False),
+    sa.ForeignKeyConstraint(['activity_id'], ['activity.id'], ondelete='CASCADE'),
+    sa.ForeignKeyConstraint(['user_id'], ['user.id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('user_id', 'rank')
+    )
+    with op.batch_alter_table('recommendation', schema=None) as batch_op:
+        batch_op.create_index(batch_op.f('ix_recommendation_activity_id'), ['activity_id'], unique=False)
+
+    op.create_table('recommendation_build',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('kind', sa.String(length=16), nullable=False),
+    sa.Column('started_at', sa.DateTime(), nullable=False),
+    sa.Column('seconds', sa.Float(), nullable=False),
+    sa.Column('peak_rss_bytes', sa.BigInteger(), nullable=True),
+    sa.Column('matrix_bytes', sa.BigInteger(), nullable=False),
+    sa.Column('users', sa.Integer(), nullable=False),
+    sa.Column('activities', sa.Integer(), nullable=False),
+    sa.Column('interactions', sa.Integer(), nullable=False),
+    sa.Column('recommendations', sa.Integer(), nullable=False),
+    sa.Column('participation_watermark', sa.Integer(), nullable=False),
+    sa.Column('message_watermark', sa.Integer(), nullable=False),
+    sa.Column('activity_watermark', sa.Integer(), nullable=False),
+    sa.PrimaryKeyConstraint('id')
+    )
+
+
+def downgrade():
+    op.drop_table('recommendation_build')
+    with op.batch_alter_table('recommendation', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_recommendation_activity_id'))
+
+    op.drop_table('recommendation')
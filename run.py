@@ -1,7 +1,26 @@
+# 只在作为服务器运行时（python run.py、自动重载的子进程、flask serve 的工作进程）打补丁。
+# FLASK_APP=run.py 的 flask 命令只是导入本文件取 app，此时 Flask 已经加载，再打补丁会报错
+if __name__ == '__main__':
+    import eventlet
+    # 必须在导入其他模块之前打补丁，socket/threading 等才会变成协作式实现
+    eventlet.monkey_patch()
+
+# 密码哈希进程池以 spawn 方式启动子进程，子进程会以 __mp_main__ 的名义重新执行
+# 本文件；子进程只负责计算哈希，不能创建应用和启动定时任务
+POOL_WORKER = __name__ == '__mp_main__'
+
+import os
 from app import create_app, socketio
-import eventlet
+from app.jobs import job_runner
 
-app = create_app()
+if not POOL_WORKER:
+    app = create_app()
 
 if __name__ == '__main__':
-    socketio.run(app, host='0.0.0.0', port=5000, debug=True, use_reloader=True)
\ No newline at end of file
+    # 由 `flask serve` 启动的工作进程关闭调试和自动重载
+    worker = os.environ.get('YUEDAZI_WORKER') == '1'
+    # 自动重载时父进程只监视文件，后台任务只在实际处理请求的子进程中参与租约竞争
+    if worker or os.environ.get('WERKZEUG_RUN_MAIN') == 'true':
+        job_runner.start()
+    socketio.run(app, host=os.environ.get('HOST', '0.0.0.0'), port=int(os.environ.get('PORT', 5000)),
+                 debug=not worker, use_reloader=not worker)
\ No newline at end of file
@@ -0,0 +1,82 @@
+import os
+import tempfile
+from datetime import datetime, timedelta
+
+import pytest
+
+# 在导入 config 之前设置：默认使用临时 SQLite 库（TEST_DATABASE_URL 可指定 MySQL 测试库，
+# 每个测试都会清空重建表），关闭后台任务、提醒和日志，密码哈希在当前进程内计算
+os.environ['DATABASE_URL'] = os.environ.get('TEST_DATABASE_URL') or 'sqlite:///' + os.path.join(
+    tempfile.mkdtemp(prefix='yuedazi-test-'), 'test.db')
+os.environ['PASSWORD_HASH_WORKERS'] = '0'
+os.environ['JOBS_ENABLED'] = '0'
+os.environ['REMINDERS_ENABLED'] = '0'
+os.environ['LOG_ENABLED'] = '0'
+
+
+@pytest.fixture(scope='session')
+def app():
+    from app import create_app
+    app = create_app()
+    app.config.update(TESTING=True, WTF_CSRF_ENABLED=False)
+    return app
+
+
+@pytest.fixture
+def db(app):
+    """每个测试使用新建的空表。测试代码不保留应用上下文，请求与直接访问数据库各用各的 session。"""
+    from app import db
+    from app.page_cache import page_cache
+    from app.ratelimit import socket_limiter
+    from app.user_cache import user_cache
+
+    with app.app_context():
+        db.create_all()
+    yield db
+    with app.app_context():
+        db.session.remove()
+        db.drop_all()
+    # 表重建后 id 会复用，进程内的缓存不能带到下一个测试
+    page_cache.clear()
+    user_cache.clear()
+    socket_limiter.clear()
+
+
+@pytest.fixture
+def make_user(app, db):
+    from app.models import User
+
+    def make_user(username):
+        with app.app_context():
+            user = User(username=username, email=f'{username}@example.com', password_hash='x')
+            db.session.add(user)
+            db.session.commit()
+            return user.id
+    return make_user
+
+
+@pytest.fixture
+def make_activity(app, db):
+    from app.models import Activity
+
+    def make_activity(creator_id, title='activity', max_participants=10):
+        event_time = datetime.utcnow() + timedelta(days=1)
+        with app.app_context():
+            activity = Activity(title=title, description='description', creator_id=creator_id, event_time=event_time,
+                                end_time=event_time + timedelta(hours=2), location='location',
+                                max_participants=max_participants)
+            db.session.add(activity)
+            db.session.commit()
+            return activity.id
+    return make_activity
+
+
+@pytest.fixture
+def login(app):
+    def login(user_id):
+        client = app.test_client()
+        with client.session_transaction() as session:
+            session['_user_id'] = str(user_id)
+            session['_fresh'] = True
+        return client
+    return login
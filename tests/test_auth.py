@@ -0,0 +1,30 @@
+from app import init_proxy_fix
+from app.passwords import password_hasher
+
+
+def _attempt(client, forwarded_for):
+    return client.post('/login', data={'username': 'nobody', 'password': 'wrong'},
+                       headers={'X-Forwarded-For': forwarded_for}).status_code
+
+
+def test_login_throttle_uses_forwarded_client_address(app, db, monkeypatch):
+    monkeypatch.setattr(app, 'wsgi_app', app.wsgi_app)
+    monkeypatch.setitem(app.config, 'PROXY_FIX_HOPS', 1)
+    monkeypatch.setattr(password_hasher, 'attempt_limit', 2)
+    monkeypatch.setattr(password_hasher, '_attempts', {})
+    init_proxy_fix(app)
+    client = app.test_client()
+
+    assert [_attempt(client, '203.0.113.1') for _ in range(3)] == [200, 200, 429]
+    # 同一代理后面的其他客户端不受影响
+    assert _attempt(client, '203.0.113.2') == 200
+    # 只信任最近一层代理追加的地址，客户端自己填的 X-Forwarded-For 不能绕过限制
+    assert _attempt(client, '198.51.100.7, 203.0.113.1') == 429
+
+
+def test_forwarded_headers_ignored_without_trusted_proxy(app, db, monkeypatch):
+    monkeypatch.setattr(password_hasher, 'attempt_limit', 2)
+    monkeypatch.setattr(password_hasher, '_attempts', {})
+    client = app.test_client()
+
+    assert [_attempt(client, f'203.0.113.{k}') for k in range(10, 13)] == [200, 200, 429]
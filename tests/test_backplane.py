@@ -0,0 +1,49 @@
+import sqlite3
+import threading
+import time
+from types import SimpleNamespace
+
+from app.backplane import SQLiteManager
+
+
+def test_publishers_share_one_connection(tmp_path, monkeypatch):
+    connects = []
+    connect = sqlite3.connect
+
+    def counting_connect(*args, **kwargs):
+        connects.append(args)
+        return connect(*args, **kwargs)
+    monkeypatch.setattr(sqlite3, 'connect', counting_connect)
+    # 每个线程（eventlet 下每个协程）发布时都不应该再建新连接
+    manager = SQLiteManager(f'sqlite:///{tmp_path}/backplane.db', channel='test')
+
+    def publish(worker):
+        for k in range(50):
+            manager._publish({'worker': worker, 'k': k})
+    threads = [threading.Thread(target=publish, args=(worker,)) for worker in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert len(connects) == 1
+    assert manager._execute('SELECT COUNT(*) FROM socketio_backplane')[0][0] == 400
+
+
+def test_listener_receives_messages_from_another_manager(tmp_path):
+    url = f'sqlite:///{tmp_path}/backplane.db'
+    listener = SQLiteManager(url, channel='test')
+    listener.server = SimpleNamespace(sleep=time.sleep)
+    messages = listener._listen()
+    publisher = SQLiteManager(url, channel='test')
+    other_channel = SQLiteManager(url, channel='other')
+
+    def publish():
+        time.sleep(0.1)
+        other_channel._publish({'n': 0})
+        publisher._publish({'n': 1})
+        publisher._publish({'n': 2})
+    thread = threading.Thread(target=publish)
+    thread.start()
+    assert [next(messages), next(messages)] == [{'n': 1}, {'n': 2}]
+    thread.join()
@@ -0,0 +1,96 @@
+import pytest
+import sqlalchemy as sa
+
+from app import socketio
+from app.chat_writer import message_writer
+from app.conversations import conversation_key
+from app.models import Message, Participation
+
+
+@pytest.fixture
+def chat(app, db, make_user, make_activity, login):
+    """发起人 owner 的活动，member 已报名，stranger 没有报名。返回 (ids, 连接工厂)。"""
+    owner, member, stranger = make_user('owner'), make_user('member'), make_user('stranger')
+    activity_id = make_activity(owner)
+    with app.app_context():
+        db.session.add(Participation(user_id=member, activity_id=activity_id))
+        db.session.commit()
+
+    clients = []
+
+    def connect(user_id):
+        client = socketio.test_client(app, flask_test_client=login(user_id))
+        clients.append(client)
+        return client
+    yield {'owner': owner, 'member': member, 'stranger': stranger, 'activity': activity_id}, connect
+    for client in clients:
+        if client.is_connected():
+            client.disconnect()
+
+
+def send(client, activity_id, receiver_id, content='hello'):
+    return client.emit('send_message', {'activity_id': activity_id, 'receiver_id': receiver_id, 'content': content},
+                       callback=True)
+
+
+def stored_messages(app, db):
+    message_writer.drain()
+    with app.app_context():
+        return db.session.execute(sa.select(Message.sender_id, Message.receiver_id).order_by(Message.id)).all()
+
+
+def test_send_message_rejects_invalid_receivers(app, db, chat):
+    ids, connect = chat
+    client = connect(ids['member'])
+    assert send(client, ids['activity'], 999) == {'status': 'error', 'error': 'invalid_receiver'}
+    assert send(client, ids['activity'], 'abc') == {'status': 'error', 'error': 'invalid_receiver'}
+    assert send(client, ids['activity'], ids['member']) == {'status': 'error', 'error': 'invalid_receiver'}
+    # 对方既不是发起人也没有报名，双方也没有会话
+    assert send(client, ids['activity'], ids['stranger']) == {'status': 'error', 'error': 'invalid_receiver'}
+    assert send(client, ids['activity'] + 1, ids['owner']) == {'status': 'error', 'error': 'activity_not_found'}
+    assert stored_messages(app, db) == []
+
+
+def test_send_message_to_creator_participant_and_existing_conversation(app, db, chat):
+    ids, connect = chat
+    assert send(connect(ids['member']), ids['activity'], ids['owner']) == {'status': 'ok'}
+    assert send(connect(ids['stranger']), ids['activity'], ids['owner']) == {'status': 'ok'}
+    # 会话由 stranger 发起后，发起人可以回复
+    owner = connect(ids['owner'])
+    message_writer.drain()
+    assert send(owner, ids['activity'], ids['stranger']) == {'status': 'ok'}
+    assert send(owner, ids['activity'], ids['member']) == {'status': 'ok'}
+    assert stored_messages(app, db) == [(ids['member'], ids['owner']), (ids['stranger'], ids['owner']),
+                                        (ids['owner'], ids['stranger']), (ids['owner'], ids['member'])]
+
+
+def test_send_message_requires_login(app, db, chat):
+    ids, connect = chat
+    client = socketio.test_client(app)
+    assert send(client, ids['activity'], ids['owner']) == {'status': 'error', 'error': 'forbidden'}
+    client.disconnect()
+
+
+def test_join_replays_after_last_seq(app, db, chat):
+    ids, connect = chat
+    member = connect(ids['member'])
+    for k in range(3):
+        assert send(member, ids['activity'], ids['owner'], f'm{k}') == {'status': 'ok'}
+    message_writer.drain()
+    room = conversation_key(ids['activity'], ids['owner'], ids['member'])
+    owner = connect(ids['owner'])
+
+    response = owner.emit('join', {'room': room, 'last_seq': 1}, callback=True)
+    assert [(message['seq'], message['content']) for message in response['messages']] == [(2, 'm1'), (3, 'm2')]
+    # 没有带序号时从头补发
+    response = owner.emit('join', {'room': room}, callback=True)
+    assert [message['seq'] for message in response['messages']] == [1, 2, 3]
+    assert response['reset'] is False
+
+
+@pytest.mark.parametrize('last_seq', ['abc', [1], -1])
+def test_join_rejects_invalid_last_seq(app, db, chat, last_seq):
+    ids, connect = chat
+    room = conversation_key(ids['activity'], ids['owner'], ids['member'])
+    response = connect(ids['owner']).emit('join', {'room': room, 'last_seq': last_seq}, callback=True)
+    assert response == {'status': 'error', 'error': 'invalid_last_seq'}
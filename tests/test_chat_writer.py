@@ -0,0 +1,28 @@
+from datetime import datetime
+
+import sqlalchemy as sa
+
+from app.chat_stream import chat_stream
+from app.chat_writer import message_writer
+from app.models import Conversation, Message
+
+
+def test_broadcast_failure_does_not_rewrite_committed_batch(app, db, make_user, make_activity, monkeypatch):
+    sender, receiver = make_user('sender'), make_user('receiver')
+    activity_id = make_activity(receiver)
+
+    def unreachable(events):
+        raise ConnectionError('message queue unreachable')
+    monkeypatch.setattr(chat_stream, 'publish', unreachable)
+    failures = message_writer.stats()['publish_failures']
+    for k in range(3):
+        assert message_writer.submit({'sender_id': sender, 'receiver_id': receiver, 'activity_id': activity_id,
+                                      'content': f'm{k}', 'timestamp': datetime.utcnow()})
+    message_writer.drain()
+
+    assert message_writer.stats()['publish_failures'] > failures
+    with app.app_context():
+        rows = db.session.execute(sa.select(Message.content, Message.seq).order_by(Message.seq)).all()
+        conversation = db.session.execute(sa.select(Conversation)).scalar_one()
+        assert rows == [('m0', 1), ('m1', 2), ('m2', 3)]
+        assert (conversation.last_seq, conversation.user2_unread) == (3, 3)
@@ -0,0 +1,34 @@
+from datetime import datetime, timedelta
+
+from app.conversations import message_page, record_messages
+from app.models import Message
+from app.reaper import archive_old_messages
+
+PAGE = 3
+
+
+def test_history_continues_into_archive_when_page_ends_at_boundary(app, db, make_user, make_activity, monkeypatch):
+    monkeypatch.setitem(app.config, 'MESSAGE_ARCHIVE_AFTER_DAYS', 1)
+    sender, receiver = make_user('sender'), make_user('receiver')
+    activity_id = make_activity(receiver)
+    now = datetime.utcnow()
+    # 5 条旧消息进入归档，message 表里正好剩一页
+    sent_at = [now - timedelta(days=10, minutes=-k) for k in range(5)] + [now - timedelta(minutes=PAGE - k)
+                                                                         for k in range(PAGE)]
+    with app.app_context():
+        record_messages([Message(sender_id=sender, receiver_id=receiver, activity_id=activity_id,
+                                 content=f'm{k}', timestamp=timestamp) for k, timestamp in enumerate(sent_at)])
+        db.session.commit()
+        assert archive_old_messages(now - timedelta(days=1)) == 5
+        conversation_id = db.session.query(Message.conversation_id).first()[0]
+
+        pages = []
+        before_id = None
+        while True:
+            messages, has_more = message_page(conversation_id, before_id, PAGE)
+            pages.append(([message.content for message in messages], has_more))
+            if not has_more:
+                break
+            before_id = messages[0].id
+
+    assert pages == [(['m5', 'm6', 'm7'], True), (['m2', 'm3', 'm4'], True), (['m0', 'm1'], False)]
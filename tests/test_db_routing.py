@@ -0,0 +1,89 @@
+from datetime import datetime, timedelta
+
+import pytest
+import sqlalchemy as sa
+from flask import Flask
+
+from app import db
+from app.db_routing import REPLICA_BIND, read_only, replica_monitor
+from app.models import ReplicationHeartbeat, User
+
+
+@pytest.fixture
+def routed_app(tmp_path):
+    """主库和副本各用一个 SQLite 文件，副本里的数据与主库不同，读到哪边一看便知。"""
+    app = Flask(__name__)
+    had_replica_metadata = REPLICA_BIND in db.metadatas
+    app.config.update(
+        SECRET_KEY='test', SQLALCHEMY_DATABASE_URI=f"sqlite:///{tmp_path / 'primary.db'}",
+        SQLALCHEMY_BINDS={REPLICA_BIND: f"sqlite:///{tmp_path / 'replica.db'}"},
+        DB_READ_YOUR_WRITES_SECONDS=5, DB_REPLICA_MAX_LAG=5, DB_REPLICA_LAG_CHECK_INTERVAL=0)
+    db.init_app(app)
+
+    @app.route('/read')
+    @read_only
+    def read():
+        return db.session.scalar(sa.select(User.username).order_by(User.id))
+
+    @app.route('/read-primary')
+    def read_primary():
+        return db.session.scalar(sa.select(User.username).order_by(User.id))
+
+    @app.route('/write', methods=['POST'])
+    def write():
+        db.session.add(User(username='written', email='written@example.com', password_hash='x'))
+        db.session.commit()
+        return ''
+
+    with app.app_context():
+        db.create_all(bind_key=None)
+        db.metadata.create_all(db.engines[REPLICA_BIND])
+        db.session.add(User(username='primary', email='primary@example.com', password_hash='x'))
+        db.session.commit()
+        with db.engines[REPLICA_BIND].begin() as conn:
+            conn.execute(sa.insert(User.__table__).values(username='replica', email='replica@example.com',
+                                                          password_hash='x'))
+    yield app
+    # init_app 会为副本的 bind 注册一份 metadata，不能留给只有主库的测试应用
+    if not had_replica_metadata:
+        db.metadatas.pop(REPLICA_BIND, None)
+
+
+def _beat(app, age):
+    """模拟复制到副本上的心跳，age 为心跳距今的秒数。"""
+    with app.app_context(), db.engines[REPLICA_BIND].begin() as conn:
+        conn.execute(sa.delete(ReplicationHeartbeat.__table__))
+        conn.execute(sa.insert(ReplicationHeartbeat.__table__).values(
+            id=1, beat_at=datetime.utcnow() - timedelta(seconds=age)))
+
+
+def test_read_only_views_go_to_replica(routed_app):
+    _beat(routed_app, 0)
+    client = routed_app.test_client()
+    assert client.get('/read').text == 'replica'
+    assert client.get('/read-primary').text == 'primary'
+
+
+def test_reads_after_write_go_to_primary(routed_app):
+    _beat(routed_app, 0)
+    client = routed_app.test_client()
+    client.post('/write')
+    assert client.get('/read').text == 'primary'
+    # 其他客户端不受影响
+    assert routed_app.test_client().get('/read').text == 'replica'
+    # 读己之写窗口结束后回到副本
+    with client.session_transaction() as session:
+        session['_db_primary_until'] -= routed_app.config['DB_READ_YOUR_WRITES_SECONDS']
+    assert client.get('/read').text == 'replica'
+
+
+def test_reads_fall_back_to_primary_when_replica_lags(routed_app):
+    client = routed_app.test_client()
+    fallbacks = replica_monitor.stats()['lag_fallbacks']
+    # 副本上还没有心跳
+    assert client.get('/read').text == 'primary'
+    _beat(routed_app, routed_app.config['DB_REPLICA_MAX_LAG'] + 10)
+    assert client.get('/read').text == 'primary'
+    assert replica_monitor.stats()['lag_fallbacks'] == fallbacks + 2
+    _beat(routed_app, 0)
+    assert client.get('/read').text == 'replica'
@@ -0,0 +1,58 @@
+import math
+
+import pytest
+
+from app.geo import _COLS, EARTH_RADIUS_KM, cell_of, covering_cells, distance_km, index_activity, nearby_activities
+from app.models import Activity
+
+
+def _destination(latitude, longitude, bearing, km):
+    """从起点沿方位角 bearing（度）走 km 公里到达的点。"""
+    phi, lam, theta = math.radians(latitude), math.radians(longitude), math.radians(bearing)
+    delta = km / EARTH_RADIUS_KM
+    phi2 = math.asin(math.sin(phi) * math.cos(delta) + math.cos(phi) * math.sin(delta) * math.cos(theta))
+    lam2 = lam + math.atan2(math.sin(theta) * math.sin(delta) * math.cos(phi),
+                            math.cos(delta) - math.sin(phi) * math.sin(phi2))
+    return math.degrees(phi2), (math.degrees(lam2) + 540) % 360 - 180
+
+
+def _covered(cells, latitude, longitude):
+    row, col = cell_of(latitude, longitude)
+    return any(row == r and first <= col <= last for r, first, last in cells)
+
+
+@pytest.mark.parametrize('latitude, longitude', [(39.9, 116.4), (0, 179.99), (-33.9, -179.98), (60, 0), (89.5, 10)])
+@pytest.mark.parametrize('radius_km', [0.5, 10, 100])
+def test_points_at_the_radius_are_covered(latitude, longitude, radius_km):
+    cells = covering_cells(latitude, longitude, radius_km)
+    for bearing in range(0, 360, 5):
+        point = _destination(latitude, longitude, bearing, radius_km * 0.9999)
+        assert distance_km(latitude, longitude, *point) <= radius_km
+        assert _covered(cells, *point), (bearing, point)
+
+
+def test_cells_wrap_across_the_antimeridian():
+    cells = covering_cells(0, 179.99, 10)
+    rows = sorted({row for row, _, _ in cells})
+    assert rows == list(range(rows[0], rows[-1] + 1)) and len(cells) == 2 * len(rows)
+    # 每行拆成东西两段：一段到最后一列，一段从第 0 列开始，两段都只有几格
+    ranges = {(first, last) for _, first, last in cells}
+    assert len(ranges) == 2
+    (west_first, west_last), (east_first, east_last) = sorted(ranges, key=lambda r: -r[0])
+    assert west_last == _COLS - 1 and east_first == 0
+    assert west_last - west_first < 5 and east_last - east_first < 5
+
+
+def test_nearby_finds_activities_across_the_antimeridian(app, db, make_user, make_activity):
+    owner = make_user('owner')
+    east, west, far = (make_activity(owner, title=title) for title in ('east', 'west', 'far'))
+    with app.app_context():
+        for activity_id, longitude in ((east, 179.99), (west, -179.99), (far, -179.5)):
+            activity = db.session.get(Activity, activity_id)
+            activity.latitude, activity.longitude = 0.0, longitude
+            index_activity(activity)
+        db.session.commit()
+
+        results = nearby_activities(0.0, 179.995, 5)
+        assert [activity.title for activity, _ in results] == ['east', 'west']
+        assert results[1][1] == pytest.approx(distance_km(0, 179.995, 0, -179.99))
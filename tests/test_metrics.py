@@ -0,0 +1,15 @@
+def test_metrics_closed_without_token(app, monkeypatch):
+    monkeypatch.setitem(app.config, 'METRICS_TOKEN', None)
+    assert app.test_client().get('/metrics').status_code == 404
+
+
+def test_metrics_require_bearer_token(app, db, monkeypatch):
+    monkeypatch.setitem(app.config, 'METRICS_TOKEN', 'secret')
+    client = app.test_client()
+    assert client.get('/metrics').status_code == 403
+    assert client.get('/metrics', headers={'Authorization': 'Bearer wrong'}).status_code == 403
+    assert client.get('/metrics', headers={'Authorization': 'Bearer 密钥'}).status_code == 403
+
+    response = client.get('/metrics', headers={'Authorization': 'Bearer secret'})
+    assert response.status_code == 200
+    assert '# TYPE yuedazi_http_request_duration_seconds histogram' in response.text
@@ -0,0 +1,68 @@
+from types import SimpleNamespace
+
+from app import page_cache as page_cache_module
+from app.page_cache import PageCache, page_cache
+
+
+def test_matching_etag_gets_304(app, db, make_user, make_activity):
+    make_activity(make_user('owner'), title='picnic')
+    client = app.test_client()
+    first = client.get('/')
+    assert first.status_code == 200 and first.headers['ETag']
+    not_modified = page_cache.stats()['not_modified']
+
+    response = client.get('/', headers={'If-None-Match': first.headers['ETag']})
+    assert response.status_code == 304 and response.data == b''
+    assert page_cache.stats()['not_modified'] == not_modified + 1
+
+
+def test_version_bump_invalidates_page(app, db, make_user, make_activity):
+    owner = make_user('owner')
+    activity_id = make_activity(owner, title='picnic')
+    client = app.test_client()
+    etag = client.get(f'/activity/{activity_id}').headers['ETag']
+    hits = page_cache.stats()['hits']
+    assert client.get(f'/activity/{activity_id}').headers['ETag'] == etag
+    assert page_cache.stats()['hits'] == hits + 1
+
+    # 绕过视图直接新建的活动在 feed 版本递增前看不到
+    assert b'picnic' in client.get('/').data
+    make_activity(owner, title='hiking')
+    assert b'hiking' not in client.get('/').data
+    page_cache.bump_feed()
+    assert b'hiking' in client.get('/').data
+
+    page_cache.bump_activity(activity_id)
+    misses = page_cache.stats()['misses']
+    client.get(f'/activity/{activity_id}')
+    assert page_cache.stats()['misses'] == misses + 1
+
+
+def _cache(monkeypatch, max_entries=10, ttl=30):
+    clock = SimpleNamespace(now=0.0)
+    monkeypatch.setattr(page_cache_module, 'time', SimpleNamespace(monotonic=lambda: clock.now))
+    cache = PageCache()
+    cache.max_entries, cache.ttl = max_entries, ttl
+    return cache, clock
+
+
+def test_entries_expire_after_ttl(monkeypatch):
+    cache, clock = _cache(monkeypatch, ttl=30)
+    cache._put('key', {'body': b'page'})
+    clock.now = 29.9
+    assert cache._get('key') == {'body': b'page', 'expires': 30}
+    clock.now = 30
+    assert cache._get('key') is None
+    assert cache.stats()['entries'] == 0
+
+
+def test_least_recently_used_entry_is_evicted(monkeypatch):
+    cache, _ = _cache(monkeypatch, max_entries=2)
+    cache._put('a', {})
+    cache._put('b', {})
+    # 读一次 a，b 变成最久未使用
+    assert cache._get('a') is not None
+    cache._put('c', {})
+    assert cache._get('b') is None
+    assert cache._get('a') is not None and cache._get('c') is not None
+    assert cache.stats()['evictions'] == 1
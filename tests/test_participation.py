@@ -0,0 +1,69 @@
+import threading
+from collections import Counter
+
+import sqlalchemy as sa
+
+from app.models import Activity, Participation
+from app.participation import ALREADY_JOINED, FULL, JOINED, NOT_FOUND, join_activity, leave_activity
+
+CAPACITY = 10
+USERS = 40
+ATTEMPTS = 3
+
+
+def seat_counts(app, db, activity_id):
+    with app.app_context():
+        count = db.session.get(Activity, activity_id).participant_count
+        rows = db.session.scalar(sa.select(sa.func.count(Participation.id)).where(
+            Participation.activity_id == activity_id))
+        distinct = db.session.scalar(sa.select(sa.func.count(sa.distinct(Participation.user_id))).where(
+            Participation.activity_id == activity_id))
+    return count, rows, distinct
+
+
+def test_concurrent_joins_never_oversell(app, db, make_user, make_activity):
+    user_ids = [make_user(f'user{i}') for i in range(USERS)]
+    activity_id = make_activity(user_ids[0], max_participants=CAPACITY)
+
+    # 每个用户同时发起 ATTEMPTS 次报名，既争抢名额，也和自己的重复请求竞争
+    results = Counter()
+    lock = threading.Lock()
+    barrier = threading.Barrier(USERS * ATTEMPTS)
+
+    def worker(user_id):
+        barrier.wait()
+        with app.app_context():
+            try:
+                result = join_activity(user_id, activity_id)
+            except Exception as exc:
+                result = f'error:{type(exc).__name__}: {exc}'
+        with lock:
+            results[result] += 1
+
+    threads = [threading.Thread(target=worker, args=(user_id,)) for user_id in user_ids for _ in range(ATTEMPTS)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert set(results) <= {JOINED, ALREADY_JOINED, FULL}, results
+    assert results[JOINED] == CAPACITY
+    assert seat_counts(app, db, activity_id) == (CAPACITY, CAPACITY, CAPACITY)
+
+
+def test_join_results_and_leave(app, db, make_user, make_activity):
+    first, second = make_user('first'), make_user('second')
+    activity_id = make_activity(first, max_participants=1)
+    with app.app_context():
+        assert join_activity(first, activity_id) == JOINED
+        assert join_activity(first, activity_id) == ALREADY_JOINED
+        assert join_activity(second, activity_id) == FULL
+        assert join_activity(second, activity_id + 1) == NOT_FOUND
+    assert seat_counts(app, db, activity_id) == (1, 1, 1)
+
+    with app.app_context():
+        assert leave_activity(first, activity_id)
+        assert not leave_activity(first, activity_id)
+        # 退出后名额归还，重复报名回滚时也没有占住名额
+        assert join_activity(second, activity_id) == JOINED
+    assert seat_counts(app, db, activity_id) == (1, 1, 1)
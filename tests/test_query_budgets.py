@@ -0,0 +1,71 @@
+"""页面的 SQL 条数上限。数据量取得足够大，出现 N+1 时条数会随行数成倍增长而超出预算。"""
+from datetime import datetime, timedelta
+
+import pytest
+
+from app.conversations import conversation_key, record_messages
+from app.instrumentation import assert_max_queries
+from app.models import Activity, Message, Participation
+from app.page_cache import page_cache
+from app.user_cache import user_cache
+
+SIZE = 10
+
+
+@pytest.fixture
+def data(app, db, make_user, make_activity):
+    """一个发起人和 SIZE 个用户；发起人的 SIZE 个活动都坐满这些用户，第一个活动下每人和发起人各有一个会话。"""
+    owner_id = make_user('owner')
+    user_ids = [make_user(f'user{i}') for i in range(SIZE)]
+    activity_ids = [make_activity(owner_id, title=f'activity {i}', max_participants=SIZE) for i in range(SIZE)]
+    started = datetime.utcnow() - timedelta(hours=1)
+    with app.app_context():
+        for activity_id in activity_ids:
+            db.session.add_all(Participation(user_id=user_id, activity_id=activity_id) for user_id in user_ids)
+            db.session.get(Activity, activity_id).participant_count = SIZE
+        messages = []
+        for i, user_id in enumerate(user_ids):
+            for k in range(SIZE):
+                sender_id, receiver_id = (owner_id, user_id) if k % 2 else (user_id, owner_id)
+                messages.append(Message(sender_id=sender_id, receiver_id=receiver_id, activity_id=activity_ids[0],
+                                        content=f'message {k}', timestamp=started + timedelta(seconds=i * SIZE + k)))
+        record_messages(messages)
+        db.session.commit()
+    return owner_id, user_ids, activity_ids
+
+
+def cold_get(client, url, budget):
+    # 清空进程内缓存，统计的是未命中缓存时的查询
+    page_cache.clear()
+    user_cache.clear()
+    response = assert_max_queries(client, url, budget)
+    assert response.status_code == 200
+    return response
+
+
+def test_index(data, login):
+    owner_id, user_ids, activity_ids = data
+    cold_get(login(owner_id), '/', 4)
+    cold_get(login(user_ids[0]), '/', 4)
+
+
+def test_index_anonymous(data, app):
+    cold_get(app.test_client(), '/', 1)
+
+
+def test_activity_detail(data, login):
+    owner_id, user_ids, activity_ids = data
+    cold_get(login(owner_id), f'/activity/{activity_ids[0]}', 3)
+
+
+def test_activity_manage(data, login):
+    owner_id, user_ids, activity_ids = data
+    cold_get(login(owner_id), '/activity/manage', 3)
+    cold_get(login(user_ids[0]), '/activity/manage', 3)
+
+
+def test_chat(data, login):
+    owner_id, user_ids, activity_ids = data
+    key = conversation_key(activity_ids[0], owner_id, user_ids[0])
+    cold_get(login(owner_id), f'/chat/{key}', 8)
+    cold_get(login(owner_id), f'/api/chat/{key}/messages', 3)
@@ -0,0 +1,96 @@
+import importlib.metadata
+from types import SimpleNamespace
+
+import engineio
+import pytest
+from flask import Flask
+
+from app import socketio
+from app.ratelimit import SocketLimiter, _engineio_supported, socket_limiter
+
+
+def limiter_app(limits):
+    app = Flask(__name__)
+    app.config.update(SOCKET_RATE_LIMITS=limits, SOCKET_RATE_LIMIT_KEYS=100, SOCKET_OUTBOUND_QUEUE_LIMIT=0,
+                      SOCKET_OUTBOUND_CHECK_SECONDS=1)
+    return app
+
+
+@pytest.mark.parametrize('limit', [(0, 10), (-1, 10), (5, 0.5)])
+def test_invalid_limits_are_rejected(limit):
+    with pytest.raises(ValueError):
+        SocketLimiter().init_app(limiter_app({'join': {'socket': limit}}), socketio)
+
+
+def test_socket_and_user_buckets():
+    limiter = SocketLimiter()
+    limiter.init_app(limiter_app({'join': {'socket': (1, 2), 'user': (1, 3)}}), socketio)
+    assert [limiter.acquire('join', 'a', 1) for _ in range(2)] == [0, 0]
+    assert limiter.acquire('join', 'a', 1) > 0
+    # 同一用户的另一个连接只剩用户桶里的一个令牌
+    assert limiter.acquire('join', 'b', 1) == 0
+    assert limiter.acquire('join', 'b', 1) > 0
+    assert limiter.acquire('join', 'c', 2) == 0
+    assert limiter.acquire('send_message', 'a', 1) == 0
+    assert limiter.stats()['throttled'] == 2
+
+
+def test_join_flood_gets_rate_limited_ack(app, db, make_user, login):
+    client = socketio.test_client(app, flask_test_client=login(make_user('user')))
+    burst = int(socket_limiter.limits['join']['socket'][1])
+    acks = [client.emit('join', {'room': 'square'}, callback=True) for _ in range(burst + 1)]
+    client.disconnect()
+    assert acks[:burst] == [{'status': 'ok'}] * burst
+    assert acks[-1]['error'] == 'rate_limited' and acks[-1]['retry_after'] > 0
+
+
+class FakeManager:
+    def get_namespaces(self):
+        return ['/']
+
+    def sid_from_eio_sid(self, eio_sid, namespace):
+        return f'{namespace}{eio_sid}'
+
+
+def outbound_limiter(sockets):
+    limiter = SocketLimiter()
+    limiter.queue_limit = 2
+    disconnected = []
+    limiter.socketio = SimpleNamespace(server=SimpleNamespace(
+        eio=SimpleNamespace(sockets=sockets), environ={eio_sid: {} for eio_sid in sockets}, manager=FakeManager(),
+        disconnect=lambda sid, namespace: disconnected.append(sid)))
+    return limiter, disconnected
+
+
+def test_slow_consumers_are_disconnected():
+    eio_server = engineio.Server(async_mode='threading')
+    sockets = {eio_sid: engineio.socket.Socket(eio_server, eio_sid) for eio_sid in ('fast', 'slow')}
+    for packet in range(5):
+        sockets['slow'].queue.put(packet)
+    sockets['fast'].queue.put(0)
+    limiter, disconnected = outbound_limiter(sockets)
+
+    assert limiter.disconnect_slow_consumers() == 1
+    assert disconnected == ['/slow']
+    assert (sockets['slow'].queue.qsize(), sockets['fast'].queue.qsize()) == (0, 1)
+    assert limiter.stats()['max_outbound_queue'] == 5
+
+
+@pytest.fixture
+def engineio_version(monkeypatch):
+    def engineio_version(version):
+        real_version = importlib.metadata.version
+        monkeypatch.setattr(importlib.metadata, 'version',
+                            lambda name: version if name == 'python-engineio' else real_version(name))
+        _engineio_supported.cache_clear()
+    yield engineio_version
+    _engineio_supported.cache_clear()
+
+
+def test_unsupported_engineio_skips_the_check(engineio_version):
+    assert _engineio_supported()
+    engineio_version('5.0.0')
+    limiter = SocketLimiter()
+    # server 上没有任何属性，读内部属性就会报错
+    limiter.socketio = SimpleNamespace(server=object())
+    assert limiter.disconnect_slow_consumers() == 0
@@ -0,0 +1,43 @@
+import threading
+
+import sqlalchemy as sa
+
+from app import recommendations
+from app.models import Participation, Recommendation
+from app.recommendations import recommender
+
+
+def test_offloaded_steps_do_not_touch_the_database(app, db, make_user, make_activity, monkeypatch):
+    creator, alice, bob = make_user('creator'), make_user('alice'), make_user('bob')
+    first, second, third = (make_activity(creator, title) for title in ('first', 'second', 'third'))
+    with app.app_context():
+        db.session.add_all([Participation(user_id=alice, activity_id=first),
+                            Participation(user_id=alice, activity_id=second),
+                            Participation(user_id=bob, activity_id=first)])
+        db.session.commit()
+
+    # 在没有应用上下文的线程里执行，计算中一旦访问 db.session 就会报错
+    offloaded = []
+
+    def offload(func, *args):
+        result, errors = [], []
+
+        def run():
+            try:
+                result.append(func(*args))
+            except Exception as exc:
+                errors.append(exc)
+        thread = threading.Thread(target=run)
+        thread.start()
+        thread.join()
+        assert not errors, errors
+        offloaded.append(func.__name__)
+        return result[0]
+    monkeypatch.setattr(recommendations, 'offload', offload)
+
+    with app.app_context():
+        recommender.build()
+        rows = db.session.execute(sa.select(Recommendation.user_id, Recommendation.activity_id).order_by(
+            Recommendation.user_id, Recommendation.rank)).all()
+    assert offloaded[0] == '_similarity' and set(offloaded[1:]) == {'_rank'}
+    assert rows == [(alice, third), (bob, second), (bob, third)]
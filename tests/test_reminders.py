@@ -0,0 +1,102 @@
+from datetime import datetime, timedelta
+
+import pytest
+
+from app.models import Activity, Participation
+from app.reminders import ReminderWheel
+from app.rooms import user_room
+
+T0 = datetime(2030, 1, 1, 12, 0)
+
+
+class FakeSocketIO:
+    def __init__(self):
+        self.emitted = []
+
+    def emit(self, event, data, to):
+        self.emitted.append((event, data, to))
+
+
+@pytest.fixture
+def wheel(app, monkeypatch):
+    monkeypatch.setitem(app.config, 'REMINDER_OFFSETS_MINUTES', [15, 60])
+    monkeypatch.setitem(app.config, 'REMINDER_LOAD_MINUTES', 30)
+    wheel = ReminderWheel()
+    wheel.init_app(app, FakeSocketIO())
+    return wheel
+
+
+@pytest.fixture
+def scheduled(app, db, make_user, make_activity):
+    """新建一个有一人报名、在 T0 之后 minutes 分钟开始的活动，返回 (活动 id, 报名者 id)。"""
+    owner, member = make_user('owner'), make_user('member')
+
+    def scheduled(title, minutes):
+        activity_id = make_activity(owner, title=title)
+        with app.app_context():
+            activity = db.session.get(Activity, activity_id)
+            activity.event_time = T0 + timedelta(minutes=minutes)
+            activity.participant_count = 1
+            db.session.add(Participation(user_id=member, activity_id=activity_id))
+            db.session.commit()
+        return activity_id, member
+    return scheduled
+
+
+def run(app, wheel, minutes, on_tick=None):
+    """从 T0 起每分钟 tick 一次，返回 [(第几分钟, 活动标题, 提前分钟数)]。"""
+    fired = []
+    for minute in range(minutes + 1):
+        if on_tick:
+            on_tick(minute)
+        before = len(wheel.socketio.emitted)
+        with app.app_context():
+            wheel.tick(T0 + timedelta(minutes=minute))
+        fired.extend((minute, data['title'], data['minutes']) for _, data, _ in wheel.socketio.emitted[before:])
+    return fired
+
+
+def test_tick_fires_due_reminders_in_time_order(app, wheel, scheduled):
+    _, member = scheduled('later', 30)
+    scheduled('sooner', 20)
+    scheduled('next window', 90)
+    scheduled('started', -5)
+
+    # 一小时提醒在加载前已经过去的不补发；90 分钟后的活动在窗口推进后加载
+    assert run(app, wheel, 80) == [(5, 'sooner', 15), (15, 'later', 15), (30, 'next window', 60),
+                                   (75, 'next window', 15)]
+    assert {to for _, _, to in wheel.socketio.emitted} == {user_room(member)}
+    assert wheel.stats()['heap'] == 0
+
+
+@pytest.mark.parametrize('resync_seconds, expected', [(300, [(25, 'moved', 15)]), (0, [])])
+def test_resync_picks_up_changes_from_other_processes(app, db, wheel, scheduled, monkeypatch,
+                                                      resync_seconds, expected):
+    monkeypatch.setitem(app.config, 'REMINDER_RESYNC_SECONDS', resync_seconds)
+    moved, _ = scheduled('moved', 200)
+
+    def move_forward(minute):
+        # 另一个进程把活动提前到本进程已加载的窗口内，没有调用本进程的 schedule()
+        if minute == 1:
+            with app.app_context():
+                db.session.get(Activity, moved).event_time = T0 + timedelta(minutes=40)
+                db.session.commit()
+    assert run(app, wheel, 30, move_forward) == expected
+
+
+def test_changed_or_deleted_activities_are_checked_before_sending(app, db, wheel, scheduled, monkeypatch):
+    # 关掉窗口重读，只靠发送前的核对
+    monkeypatch.setitem(app.config, 'REMINDER_RESYNC_SECONDS', 0)
+    postponed, _ = scheduled('postponed', 20)
+    deleted, _ = scheduled('deleted', 20)
+
+    def change(minute):
+        # 其他进程的修改：到期时按主键核对，推迟的活动按新时间重新排队，删除的跳过
+        if minute == 1:
+            with app.app_context():
+                db.session.get(Activity, postponed).event_time = T0 + timedelta(minutes=25)
+                db.session.query(Participation).filter_by(activity_id=deleted).delete()
+                db.session.delete(db.session.get(Activity, deleted))
+                db.session.commit()
+    assert run(app, wheel, 12, change) == [(10, 'postponed', 15)]
+    assert wheel.stats()['skipped'] == 2
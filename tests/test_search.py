@@ -0,0 +1,30 @@
+from app.models import Activity
+from app.search import rebuild_index, search_activity_ids, tokenize
+
+
+def test_tokenize_splits_cjk_into_bigrams():
+    assert tokenize('周末去爬山 Hiking2024!') == ['周末', '末去', '去爬', '爬山', 'hiking2024']
+    # 单个汉字保留为一个词，全角字母数字按 NFKC 归一化
+    assert tokenize('山 ＡＢＣ１') == ['山', 'abc1']
+    assert tokenize('!!') == []
+
+
+def test_results_ranked_by_field_weight_and_require_every_term(app, db, make_user, make_activity):
+    owner = make_user('owner')
+    in_title, in_description, in_location, unrelated, english = (
+        make_activity(owner, title=title) for title in ('周末爬山', '读书会', '野餐', '电影', 'Hiking trip'))
+    with app.app_context():
+        db.session.get(Activity, in_description).description = '饭后一起去爬山'
+        db.session.get(Activity, in_location).location = '爬山公园'
+        db.session.commit()
+        rebuild_index()
+
+        # 标题 3 分，地点 2 分，描述 1 分
+        assert search_activity_ids('爬山') == [in_title, in_location, in_description]
+        assert search_activity_ids('爬山 公园') == [in_location]
+        assert search_activity_ids('周末 爬山') == [in_title]
+        assert search_activity_ids('电影') == [unrelated]
+        assert search_activity_ids('电影 爬山') == []
+        # 最后一个词在输入中时按前缀匹配，输入空格后要求完整的词
+        assert search_activity_ids('hik') == [english]
+        assert search_activity_ids('hik ') == []
@@ -0,0 +1,51 @@
+from app.instrumentation import count_queries
+from app.models import User
+from app.user_cache import user_cache
+
+
+def test_hit_returns_persistent_user_without_select(app, db, make_user, make_activity):
+    user_id = make_user('alice')
+    make_activity(user_id, title='picnic')
+    misses = user_cache.stats()['misses']
+    with app.app_context():
+        assert user_cache.get(user_id).username == 'alice'
+    assert user_cache.stats()['misses'] == misses + 1
+
+    hits = user_cache.stats()['hits']
+    with app.app_context():
+        with count_queries() as stats:
+            user = user_cache.get(user_id)
+            assert user.username == 'alice'
+        assert stats.count == 0
+        assert user_cache.stats()['hits'] == hits + 1
+        # merge(load=False) 得到的对象属于当前会话，关联照常加载，修改可以提交
+        assert user in db.session
+        assert [activity.title for activity in user.activities] == ['picnic']
+        user.username = 'alice2'
+        db.session.commit()
+    with app.app_context():
+        assert db.session.get(User, user_id).username == 'alice2'
+
+
+def test_missing_user_is_not_cached(app, db):
+    with app.app_context():
+        assert user_cache.get(12345) is None
+        assert user_cache.get(12345) is None
+    assert user_cache.stats()['size'] == 0
+
+
+def test_invalidate_drops_stale_snapshot(app, db, make_user):
+    user_id = make_user('alice')
+    with app.app_context():
+        user_cache.get(user_id)
+        db.session.get(User, user_id).username = 'renamed'
+        db.session.commit()
+    # 没有 invalidate 时命中的是修改前的快照
+    with app.app_context():
+        assert user_cache.get(user_id).username == 'alice'
+
+    invalidations = user_cache.stats()['invalidations']
+    user_cache.invalidate(user_id)
+    assert user_cache.stats()['invalidations'] == invalidations + 1
+    with app.app_context():
+        assert user_cache.get(user_id).username == 'renamed'